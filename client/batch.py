@@ -0,0 +1,88 @@
+import os
+import threading
+from dotenv import load_dotenv
+from sender import get_sender
+
+load_dotenv()
+
+# Collection intervals covered by one /ingest batch, 0 sends every sample
+# to the legacy /gpu/submit and /cpu/submit endpoints instead
+UPLOAD_BATCH_INTERVALS = int(os.getenv("UPLOAD_BATCH_INTERVALS", "1"))
+
+HOST_FIELDS = ("hostname", "ip_address")
+GPU_COLUMNS = ("timestamp", "gpu_id", "username", "memory_used", "command", "status")
+CPU_COLUMNS = ("timestamp", "cpu_usage_percent", "cpu_frequency_mhz")
+
+
+def pack(gpu_entries, cpu_entries):
+    """Pack collected entries into an /ingest batch
+
+    Fields that are the same for the whole host (hostname, IP address, GPU
+    names and total memory, CPU core counts) are sent once, samples become
+    rows of the columns above.
+    """
+    entries = gpu_entries or cpu_entries
+    host = {field: entries[-1][field] for field in HOST_FIELDS}
+    if gpu_entries:
+        gpus = {}
+        for entry in gpu_entries:
+            gpus[entry["gpu_id"]] = {
+                "gpu_id": entry["gpu_id"],
+                "gpu_name": entry["gpu_name"],
+                "memory_total": entry["memory_total"],
+            }
+        host["gpus"] = list(gpus.values())
+        host["inventory_version"] = gpu_entries[-1].get("inventory_version")
+    if cpu_entries:
+        host["cpu_cores_logical"] = cpu_entries[-1]["cpu_cores_logical"]
+        host["cpu_cores_physical"] = cpu_entries[-1]["cpu_cores_physical"]
+    return {
+        "host": host,
+        "gpu": {"columns": GPU_COLUMNS, "rows": [[entry[c] for c in GPU_COLUMNS] for entry in gpu_entries]},
+        "cpu": {"columns": CPU_COLUMNS, "rows": [[entry[c] for c in CPU_COLUMNS] for entry in cpu_entries]},
+    }
+
+
+class Batcher:
+    """Accumulate GPU and CPU samples and send them as a single /ingest batch
+
+    Collectors add their entries on every sample; ``collect_and_send`` is
+    scheduled like a collector, every UPLOAD_BATCH_INTERVALS intervals, and
+    hands the packed batch to the sender.
+    """
+
+    def __init__(self, sender=None):
+        self.sender = sender or get_sender()
+        self._lock = threading.Lock()
+        self._pending = {"gpu": [], "cpu": []}
+
+    def add(self, kind, usage_data):
+        with self._lock:
+            self._pending[kind].extend(usage_data)
+
+    def collect_and_send(self, timestamp=None):
+        with self._lock:
+            pending, self._pending = self._pending, {"gpu": [], "cpu": []}
+        if pending["gpu"] or pending["cpu"]:
+            self.sender.submit("/ingest", pack(pending["gpu"], pending["cpu"]))
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """Return the batcher shared by all collectors of this process"""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = Batcher()
+    return _batcher
+
+
+def send(kind, endpoint, usage_data):
+    """Hand collected entries to the batcher, or straight to the sender without batching"""
+    if UPLOAD_BATCH_INTERVALS > 0:
+        get_batcher().add(kind, usage_data)
+    else:
+        get_sender().submit(endpoint, usage_data)
@@ -1,9 +1,12 @@
 import time
 from dotenv import load_dotenv
 import os
+import threading
 import traceback
-from gpu.collect import collect_gpu_stats_and_send
-from cpu.collect import collect_cpu_stats_and_send
+from datetime import datetime
+from gpu.collect import get_collector
+from cpu.collect import CPUCollector
+from batch import UPLOAD_BATCH_INTERVALS, get_batcher
 
 load_dotenv()
 
@@ -13,14 +16,41 @@ if not UPDATE_INTERVAL:
 else:
     UPDATE_INTERVAL = int(UPDATE_INTERVAL)
 
+# each collector can run on its own cadence, both default to UPDATE_INTERVAL
+GPU_UPDATE_INTERVAL = int(os.getenv("GPU_UPDATE_INTERVAL", UPDATE_INTERVAL))
+CPU_UPDATE_INTERVAL = int(os.getenv("CPU_UPDATE_INTERVAL", UPDATE_INTERVAL))
 
-while True:
-    try:
-        collect_gpu_stats_and_send()
-        collect_cpu_stats_and_send()
-    except Exception as e:
-        print(f"Cannot send data to server at {time.strftime('%Y-%m-%d %H:%M:%S')}. The error is: ",e)
-        print("Traceback:")
-        traceback.print_exc()
-        print('-'*120)
-    time.sleep(UPDATE_INTERVAL)
\ No newline at end of file
+
+def run_every(interval, collector, name):
+    """Collect and send on every wall-clock multiple of ``interval`` seconds
+
+    Samples are stamped with their tick, so they stay aligned however long
+    a collection takes; ticks missed by a slow collection are skipped.
+    """
+    while True:
+        tick = (time.time() // interval + 1) * interval
+        time.sleep(max(tick - time.time(), 0))
+        try:
+            collector.collect_and_send(datetime.fromtimestamp(tick))
+        except Exception as e:
+            print(f"Cannot collect {name} data at {time.strftime('%Y-%m-%d %H:%M:%S')}. The error is: ",e)
+            print("Traceback:")
+            traceback.print_exc()
+            print('-'*120)
+
+
+schedule = [
+    ("GPU", GPU_UPDATE_INTERVAL, get_collector()),
+    ("CPU", CPU_UPDATE_INTERVAL, CPUCollector()),
+]
+if UPLOAD_BATCH_INTERVALS > 0:
+    # samples of both collectors are sent together, every few intervals
+    schedule.append(("upload", UPDATE_INTERVAL * UPLOAD_BATCH_INTERVALS, get_batcher()))
+threads = [
+    threading.Thread(target=run_every, args=(interval, collector, name), name=f"nodetrack-{name.lower()}", daemon=True)
+    for name, interval, collector in schedule
+]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
@@ -1,49 +1,66 @@
-import json
 from datetime import datetime
-import requests
-from dotenv import load_dotenv
 import os
 import psutil
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import get_first_non_loopback_ip, get_hostname
+from utils import CachedInventory, load_host_facts
+import batch
 
-load_dotenv()
 
-SERVER_ADDRESS = os.getenv("SERVER_ADDRESS")
-
-# raise error if not SERVER_ADDRESS
-if SERVER_ADDRESS is None:
-    raise Exception("SERVER_ADDRESS is not set. Set it in your .env file.")
+def _busy_and_total_time(cpu_times):
+    """Busy and total CPU seconds of a psutil.cpu_times() snapshot"""
+    total = sum(cpu_times)
+    # guest time is already accounted for in user/nice on Linux
+    total -= getattr(cpu_times, "guest", 0) + getattr(cpu_times, "guest_nice", 0)
+    idle = cpu_times.idle + getattr(cpu_times, "iowait", 0)
+    return total - idle, total
 
 
 class CPUCollector:
     """CPU stats collector using psutil (works on both Linux and Windows)"""
 
     def __init__(self):
-        self.hostname = get_hostname()
-        self.ip_address = get_first_non_loopback_ip()
+        self.inventory = CachedInventory(self._load_inventory)
+        self._last_cpu_times = psutil.cpu_times()
+
+    def _load_inventory(self):
+        """Static facts of the node, refreshed by the inventory cache"""
+        return dict(
+            load_host_facts(),
+            cpu_cores_logical=psutil.cpu_count(logical=True),  # For actual utilization capacity
+            cpu_cores_physical=psutil.cpu_count(logical=False),  # For hardware info
+        )
 
-    def collect_stats(self):
+    def _cpu_percent_since_last_sample(self):
+        """Overall CPU usage between the previous snapshot and now, without blocking"""
+        cpu_times = psutil.cpu_times()
+        last_busy, last_total = _busy_and_total_time(self._last_cpu_times)
+        busy, total = _busy_and_total_time(cpu_times)
+        self._last_cpu_times = cpu_times
+        if total <= last_total:
+            return 0.0
+        return min(max((busy - last_busy) / (total - last_total) * 100, 0.0), 100.0)
+
+    def collect_stats(self, timestamp=None):
         """Collect overall node CPU statistics"""
         try:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            timestamp = (timestamp or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
 
-            # Get overall CPU metrics with proper interval for accurate reading
-            overall_cpu_percent = psutil.cpu_percent(interval=10)
-            cpu_count_logical = psutil.cpu_count(logical=True)  # For actual utilization capacity
-            cpu_count_physical = psutil.cpu_count(logical=False)  # For hardware info
+            # Overall CPU usage since the previous sample, from cpu_times() deltas
+            overall_cpu_percent = self._cpu_percent_since_last_sample()
             cpu_freq = psutil.cpu_freq()
+            inventory = self.inventory.get()
 
             # Create single record for the node's overall CPU usage
             usage_data = [{
                 "timestamp": timestamp,
-                "hostname": self.hostname,
-                "ip_address": self.ip_address,
+                "hostname": inventory["hostname"],
+                "ip_address": inventory["ip_address"],
                 "cpu_usage_percent": round(overall_cpu_percent, 2),
-                "cpu_cores_logical": cpu_count_logical,
-                "cpu_cores_physical": cpu_count_physical,
-                "cpu_frequency_mhz": round(cpu_freq.current, 2) if cpu_freq else None
+                "cpu_cores_logical": inventory["cpu_cores_logical"],
+                "cpu_cores_physical": inventory["cpu_cores_physical"],
+                "cpu_frequency_mhz": round(cpu_freq.current, 2) if cpu_freq else None,
+                "inventory_version": self.inventory.version,
             }]
 
             return usage_data
@@ -53,27 +70,13 @@ class CPUCollector:
             return []
 
     def send_stats(self, usage_data):
-        """Send stats to server or save locally on failure"""
-        try:
-            response = requests.post(f"http://{SERVER_ADDRESS}:5000/cpu/submit", json=usage_data)
-            response.raise_for_status()
-            print(f"Successfully sent {len(usage_data)} CPU records to server")
-        except Exception as e:
-            print(f"Error sending CPU data to master: {str(e)}")
-            # Fallback to local storage if network fails
-            with open("cpu_usage_local.log", "a") as f:
-                for entry in usage_data:
-                    f.write(json.dumps(entry) + "\n")
+        """Queue stats for the next batch, or for the background sender without batching"""
+        batch.send("cpu", "/cpu/submit", usage_data)
 
-    def collect_and_send(self):
+    def collect_and_send(self, timestamp=None):
         """Collect stats and send them"""
-        usage_data = self.collect_stats()
+        usage_data = self.collect_stats(timestamp)
         if usage_data:
             self.send_stats(usage_data)
         else:
             print("No CPU data collected")
-
-
-def collect_cpu_stats_and_send():
-    collector = CPUCollector()
-    collector.collect_and_send()
\ No newline at end of file
@@ -0,0 +1,162 @@
+import os
+import psutil
+
+MB = 1024 * 1024
+
+# "nvml", "gpustat" or "auto" (NVML when it can be initialized, gpustat otherwise)
+GPU_BACKEND = os.getenv("GPU_BACKEND", "auto")
+
+
+class ProcessCache:
+    """Cache pid -> (username, command) across samples
+
+    Looking up the owner and command line of a process costs several
+    /proc reads, so they are only done the first time a pid shows up on a
+    GPU. Pids that are no longer running on any GPU are evicted after each
+    sample, which keeps a reused pid from inheriting a stale owner.
+    """
+
+    def __init__(self):
+        self._processes = {}
+
+    def lookup(self, pid):
+        if pid not in self._processes:
+            self._processes[pid] = self._describe(pid)
+        return self._processes[pid]
+
+    def retain(self, pids):
+        """Evict every pid not in ``pids``"""
+        for pid in self._processes.keys() - set(pids):
+            del self._processes[pid]
+
+    def __len__(self):
+        return len(self._processes)
+
+    @staticmethod
+    def _describe(pid):
+        try:
+            process = psutil.Process(pid)
+            username = process.username()
+            cmdline = process.cmdline()
+        except (psutil.Error, OSError):
+            return "?", "?"
+        # short command names, as in `ps -o comm` and gpustat
+        return username, os.path.basename(cmdline[0]) if cmdline else "?"
+
+
+class NVMLBackend:
+    """Query GPUs through NVML with persistent device handles
+
+    NVML is initialized once and every sample costs one running-processes
+    query per device and kind (compute and graphics), plus cached owner
+    lookups for pids that weren't seen before. The handles are opened
+    again when the device count changes, and NVML is initialized again
+    after an NVML error such as a lost GPU.
+    """
+
+    name = "nvml"
+
+    def __init__(self, nvml=None):
+        if nvml is None:
+            import pynvml as nvml
+        self.nvml = nvml
+        self.nvml.nvmlInit()
+        self.processes = ProcessCache()
+        self._open_devices()
+
+    def _open_devices(self):
+        self.handles = [
+            self.nvml.nvmlDeviceGetHandleByIndex(i)
+            for i in range(self.nvml.nvmlDeviceGetCount())
+        ]
+
+    def query_gpus(self):
+        """Name and total memory (MB) of every GPU, by index"""
+        self._open_devices()
+        gpus = []
+        for handle in self.handles:
+            name = self.nvml.nvmlDeviceGetName(handle)
+            if isinstance(name, bytes):
+                name = name.decode()
+            memory = self.nvml.nvmlDeviceGetMemoryInfo(handle)
+            gpus.append({"name": name, "memory_total": memory.total // MB})
+        return gpus
+
+    def sample(self):
+        """``(gpu index, processes)`` for every GPU, processes shaped as gpustat's"""
+        try:
+            if self.nvml.nvmlDeviceGetCount() != len(self.handles):
+                # GPUs were added or removed, the collector then reloads its inventory
+                self._open_devices()
+            return self._sample()
+        except self.nvml.NVMLError as e:
+            print(f"NVML error ({e}), initializing NVML again")
+            self._reinit()
+            return self._sample()
+
+    def _reinit(self):
+        try:
+            self.nvml.nvmlShutdown()
+        except self.nvml.NVMLError:
+            pass
+        self.nvml.nvmlInit()
+        self._open_devices()
+
+    def _sample(self):
+        stats = []
+        seen = set()
+        for index, handle in enumerate(self.handles):
+            running = {}
+            for query in (self.nvml.nvmlDeviceGetComputeRunningProcesses,
+                          self.nvml.nvmlDeviceGetGraphicsRunningProcesses):
+                for nv_process in query(handle):
+                    running.setdefault(nv_process.pid, nv_process.usedGpuMemory)
+            processes = []
+            for pid, used_memory in running.items():
+                username, command = self.processes.lookup(pid)
+                processes.append({
+                    "pid": pid,
+                    "username": username,
+                    "command": command,
+                    # None when the driver can't report per-process memory
+                    "gpu_memory_usage": used_memory // MB if used_memory else 0,
+                })
+            seen.update(running)
+            stats.append((index, processes))
+        self.processes.retain(seen)
+        return stats
+
+
+class GPUStatBackend:
+    """Query GPUs through gpustat, slower but dependable fallback"""
+
+    name = "gpustat"
+
+    def __init__(self):
+        import gpustat
+        self.gpustat = gpustat
+
+    def query_gpus(self):
+        return [
+            {"name": gpu.name, "memory_total": gpu.memory_total}
+            for gpu in self.gpustat.GPUStatCollection.new_query()
+        ]
+
+    def sample(self):
+        return [(gpu.index, gpu.processes) for gpu in self.gpustat.GPUStatCollection.new_query()]
+
+
+def get_backend(name=GPU_BACKEND):
+    """Return the GPU backend to use, or None when neither NVML nor gpustat works"""
+    if name in ("auto", "nvml"):
+        try:
+            return NVMLBackend()
+        except Exception as e:
+            if name == "nvml":
+                raise
+            print(f"NVML is unavailable ({e}), falling back to gpustat")
+    try:
+        return GPUStatBackend()
+    except ImportError:
+        print("gpustat not installed. Install it with: pip install gpustat")
+        return None
@@ -0,0 +1,203 @@
+"""Micro-benchmarks of the GPU collectors, runnable without any GPU
+
+``nvml`` runs the NVML and gpustat backends against the same fake NVML
+module. The fake devices report real pids of this machine, which keeps the
+per-process owner and command lookups as expensive as on a real node.
+
+``windows`` runs WindowsGPUCollector on a fake PowerShell runner that
+charges a fixed cost per launch, and reports the cycle time against the
+number of GPU processes.
+
+    python gpu/benchmark.py nvml --gpus 8 --processes 300 --samples 20
+    python gpu/benchmark.py windows --launch-ms 300 --processes 10 50 200
+"""
+import argparse
+import base64
+import json
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+from unittest import mock
+import psutil
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SERVER_ADDRESS", "localhost")  # nothing is sent
+from gpu.backends import NVMLBackend, GPUStatBackend, MB
+from gpu.collect import WindowsGPUCollector
+
+Memory = namedtuple("Memory", "total free used")
+Utilization = namedtuple("Utilization", "gpu memory")
+NVProcess = namedtuple("NVProcess", "pid usedGpuMemory")
+
+
+class FakeNVML:
+    """Stand-in for the pynvml module, with ``processes`` spread over ``gpus`` devices"""
+
+    NVML_TEMPERATURE_GPU = 0
+
+    class NVMLError(Exception):
+        pass
+
+    class NVMLError_GpuIsLost(NVMLError):
+        pass
+
+    class NVMLError_Unknown(NVMLError):
+        pass
+
+    def __init__(self, gpus, pids):
+        self.gpus = gpus
+        self.running = {index: [] for index in range(gpus)}
+        for i, pid in enumerate(pids):
+            self.running[i % gpus].append(NVProcess(pid, 512 * MB))
+
+    def nvmlInit(self):
+        pass
+
+    def nvmlShutdown(self):
+        pass
+
+    def nvmlSystemGetDriverVersion(self):
+        return "550.54.15"
+
+    def nvmlDeviceGetCount(self):
+        return self.gpus
+
+    def nvmlDeviceGetHandleByIndex(self, index):
+        return index
+
+    def nvmlDeviceGetIndex(self, handle):
+        return handle
+
+    def nvmlDeviceGetName(self, handle):
+        return "NVIDIA A100-SXM4-80GB"
+
+    def nvmlDeviceGetUUID(self, handle):
+        return f"GPU-{handle:08d}"
+
+    def nvmlDeviceGetMemoryInfo(self, handle):
+        used = sum(process.usedGpuMemory for process in self.running[handle])
+        return Memory(80 * 1024 * MB, 80 * 1024 * MB - used, used)
+
+    def nvmlDeviceGetComputeRunningProcesses(self, handle):
+        return list(self.running[handle])
+
+    def nvmlDeviceGetGraphicsRunningProcesses(self, handle):
+        return []
+
+    def nvmlDeviceGetTemperature(self, handle, sensor):
+        return 40
+
+    def nvmlDeviceGetFanSpeed(self, handle):
+        return 30
+
+    def nvmlDeviceGetUtilizationRates(self, handle):
+        return Utilization(50, 20)
+
+    def nvmlDeviceGetEncoderUtilization(self, handle):
+        return 0, 0
+
+    def nvmlDeviceGetDecoderUtilization(self, handle):
+        return 0, 0
+
+    def nvmlDeviceGetPowerUsage(self, handle):
+        return 250000
+
+    def nvmlDeviceGetEnforcedPowerLimit(self, handle):
+        return 400000
+
+
+class FakePowerShell:
+    """Fake command runner answering WindowsGPUCollector's PowerShell commands
+
+    Every launch sleeps ``launch_ms`` to mimic the startup cost of
+    powershell.exe and is counted in ``launches``.
+    """
+
+    def __init__(self, gpus, processes, launch_ms=0):
+        self.gpus = gpus
+        self.pids = [1000 + i for i in range(processes)]
+        self.launch_ms = launch_ms
+        self.launches = 0
+
+    def __call__(self, cmd):
+        self.launches += 1
+        time.sleep(self.launch_ms / 1000)
+        if "nvidia-smi" in cmd:
+            return "\n".join("NVIDIA RTX A6000, 49140" for _ in range(self.gpus)).encode()
+        if "Get-Counter" in cmd:
+            return json.dumps([
+                {"InstanceName": f"pid_{pid}_luid_0x00000000_0x0000C4B1_phys_{i % self.gpus}",
+                 "CookedValue": 512 * MB}
+                for i, pid in enumerate(self.pids)
+            ]).encode()
+        script = base64.b64decode(cmd.split()[-1]).decode("utf-16le")
+        return json.dumps([
+            {"ProcessId": int(pid), "Name": "python.exe", "Owner": f"LAB\\user{pid}"}
+            for pid in re.findall(r"ProcessId = (\d+)", script)
+        ]).encode()
+
+
+def measure(backend, samples):
+    """Average milliseconds per sample, after one warm-up sample"""
+    backend.sample()
+    started = time.perf_counter()
+    for _ in range(samples):
+        backend.sample()
+    return (time.perf_counter() - started) * 1000 / samples
+
+
+def benchmark_nvml(args):
+    fake = FakeNVML(args.gpus, psutil.pids()[:args.processes])
+    print(f"{args.gpus} GPUs, {sum(map(len, fake.running.values()))} processes, {args.samples} samples")
+
+    nvml_ms = measure(NVMLBackend(nvml=fake), args.samples)
+    with mock.patch("gpustat.core.N", fake):
+        gpustat_ms = measure(GPUStatBackend(), args.samples)
+
+    print(f"nvml:    {nvml_ms:8.2f} ms/sample")
+    print(f"gpustat: {gpustat_ms:8.2f} ms/sample")
+    print(f"speedup: {gpustat_ms / nvml_ms:8.1f}x")
+
+
+def benchmark_windows(args):
+    print(f"{args.gpus} GPUs, {args.launch_ms} ms per PowerShell launch")
+    print(f"{'processes':>9} {'first cycle':>12} {'next cycles':>12} {'launches':>9}")
+    for processes in args.processes:
+        runner = FakePowerShell(args.gpus, processes, args.launch_ms)
+        collector = WindowsGPUCollector(run=runner)
+
+        started = time.perf_counter()
+        collector.collect_stats()
+        first_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        for _ in range(args.samples):
+            collector.collect_stats()
+        next_ms = (time.perf_counter() - started) * 1000 / args.samples
+
+        print(f"{processes:>9} {first_ms:>9.0f} ms {next_ms:>9.0f} ms {runner.launches:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    nvml = subparsers.add_parser("nvml", help="NVML against gpustat backend")
+    nvml.add_argument("--gpus", type=int, default=8)
+    nvml.add_argument("--processes", type=int, default=300)
+    nvml.add_argument("--samples", type=int, default=20)
+    nvml.set_defaults(run=benchmark_nvml)
+
+    windows = subparsers.add_parser("windows", help="Windows collector cycle time")
+    windows.add_argument("--gpus", type=int, default=4)
+    windows.add_argument("--processes", type=int, nargs="+", default=[10, 50, 200])
+    windows.add_argument("--launch-ms", type=float, default=300)
+    windows.add_argument("--samples", type=int, default=3)
+    windows.set_defaults(run=benchmark_windows)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
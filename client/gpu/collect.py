@@ -1,61 +1,67 @@
 import json
 from datetime import datetime
-import requests
-import socket
-from dotenv import load_dotenv
 import os
 import platform
 import subprocess
 import base64
 import sys
-import netifaces
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import CachedInventory, load_host_facts
+import batch
+from gpu.backends import get_backend
 
-load_dotenv()
 
-SERVER_ADDRESS = os.getenv("SERVER_ADDRESS")
+class GPUCollector:
+    """Base class for GPU stats collection
 
-# raise error if not SERVER_ADDRESS
-if SERVER_ADDRESS is None:
-    raise Exception("SERVER_ADDRESS is not set. Set it in your .env file.")
+    Collectors are long-lived: static facts (hostname, IP address, GPU names
+    and total memory) are kept in a CachedInventory and only the dynamic
+    usage is queried on every sample.
+    """
+    
+    def __init__(self):
+        self.inventory = CachedInventory(self._load_inventory)
 
-def get_first_non_loopback_ip():
-    for interface in netifaces.interfaces():
-        addresses = netifaces.ifaddresses(interface)
-        if netifaces.AF_INET in addresses:
-            for link in addresses[netifaces.AF_INET]:
-                ip_addr = link['addr']
-                if not ip_addr.startswith('127.'):
-                    return ip_addr # Return the first non-loopback IPv4 address found
-    return None # No non-loopback IP found
+    def _load_inventory(self):
+        """Static facts of the node, refreshed by the inventory cache"""
+        return dict(load_host_facts(), gpus=self._query_gpus())
 
+    def _query_gpus(self):
+        """Name and total memory (MB) of every GPU, by index.
 
-class GPUCollector:
-    """Base class for GPU stats collection"""
-    
-    def __init__(self):
-        self.hostname = socket.gethostname()
-        self.ip_address = get_first_non_loopback_ip()
+        Should be implemented by platform-specific classes"""
+        raise NotImplementedError
+
+    def _entry(self, timestamp, gpu_id, username=None, memory_used=0, command=None, status="idle"):
+        """Build one usage entry, static fields coming from the loaded inventory"""
+        inventory = self.inventory.facts
+        gpus = inventory["gpus"]
+        gpu = gpus[gpu_id] if gpu_id < len(gpus) else {"name": "Unknown", "memory_total": 0}
+        return {
+            "timestamp": timestamp,
+            "hostname": inventory["hostname"],
+            "ip_address": inventory["ip_address"],
+            "gpu_id": gpu_id,
+            "gpu_name": gpu["name"],
+            "username": username,
+            "memory_used": memory_used,
+            "memory_total": gpu["memory_total"],
+            "command": command,
+            "status": status,
+            "inventory_version": self.inventory.version,
+        }
         
-    def collect_stats(self):
+    def collect_stats(self, timestamp=None):
         """Should be implemented by platform-specific classes"""
         raise NotImplementedError
         
     def send_stats(self, usage_data):
-        """Send stats to server or save locally on failure"""
-        try:
-            response = requests.post(f"http://{SERVER_ADDRESS}:5000/gpu/submit", json=usage_data)
-            response.raise_for_status()
-            print(f"Successfully sent {len(usage_data)} records to server")
-        except Exception as e:
-            print(f"Error sending data to master: {str(e)}")
-            # Fallback to local storage if network fails
-            with open("gpu_usage_local.log", "a") as f:
-                for entry in usage_data:
-                    f.write(json.dumps(entry) + "\n")
+        """Queue stats for the next batch, or for the background sender without batching"""
+        batch.send("gpu", "/gpu/submit", usage_data)
 
-    def collect_and_send(self):
+    def collect_and_send(self, timestamp=None):
         """Collect stats and send them"""
-        usage_data = self.collect_stats()
+        usage_data = self.collect_stats(timestamp)
         if usage_data:
             self.send_stats(usage_data)
         else:
@@ -63,87 +69,104 @@ class GPUCollector:
 
 
 class LinuxGPUCollector(GPUCollector):
-    """GPU stats collector for Linux systems using gpustat"""
+    """GPU stats collector for Linux systems, using NVML directly or gpustat as a fallback"""
 
-    def collect_stats(self):
-        try:
-            import gpustat
-        except ImportError:
-            print("gpustat not installed. Install it with: pip install gpustat")
+    def __init__(self, backend=None):
+        super().__init__()
+        self.backend = backend or get_backend()
+
+    def _query_gpus(self):
+        if self.backend is None:
+            return []
+        return self.backend.query_gpus()
+
+    def collect_stats(self, timestamp=None):
+        if self.backend is None:
             return []
 
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        stats = gpustat.GPUStatCollection.new_query()
+        timestamp = (timestamp or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+        stats = self.backend.sample()
+        if len(stats) != len(self.inventory.get()["gpus"]):
+            # GPUs were added or removed since the inventory was loaded
+            self.inventory.invalidate()
+            self.inventory.get()
 
         usage_data = []
-        for gpu in stats:
-            if not gpu.processes:
+        for index, processes in stats:
+            if not processes:
                 # Add entry for idle GPU
-                entry = {
-                    "timestamp": timestamp,
-                    "hostname": self.hostname,
-                    "ip_address": self.ip_address,
-                    "gpu_id": gpu.index,
-                    "gpu_name": gpu.name,
-                    "username": None,
-                    "memory_used": 0,
-                    "memory_total": gpu.memory_total,
-                    "command": None,
-                    "status": "idle",
-                }
-                usage_data.append(entry)
+                usage_data.append(self._entry(timestamp, index))
             else:
                 # Add entries for active processes
-                for process in gpu.processes:
-                    entry = {
-                        "timestamp": timestamp,
-                        "hostname": self.hostname,
-                        "ip_address": self.ip_address,
-                        "gpu_id": gpu.index,
-                        "gpu_name": gpu.name,
-                        "username": process["username"],
-                        "memory_used": process["gpu_memory_usage"],
-                        "memory_total": gpu.memory_total,
-                        "command": process["command"],
-                        "status": "active",
-                    }
-                    usage_data.append(entry)
+                for process in processes:
+                    usage_data.append(self._entry(
+                        timestamp,
+                        index,
+                        username=process["username"],
+                        memory_used=process["gpu_memory_usage"],
+                        command=process["command"],
+                        status="active",
+                    ))
 
         return usage_data
 
 
+def run_command(cmd):
+    """Run a shell command and return its raw output"""
+    return subprocess.check_output(cmd, shell=True)
+
+
+def _as_list(data):
+    """ConvertTo-Json emits a bare object instead of an array for a single item"""
+    if not data:
+        return []
+    return data if isinstance(data, list) else [data]
+
+
 class WindowsGPUCollector(GPUCollector):
-    """GPU stats collector for Windows systems using PowerShell"""
+    """GPU stats collector for Windows systems using PowerShell
 
-    def _get_gpu_info(self):
-        """Get basic GPU information including accurate memory"""
-        try:
-            # Query GPU information - use nvidia-smi for better memory reporting
-            cmd = '''powershell -command "nvidia-smi --query-gpu=name,memory.total --format=csv,noheader,nounits"'''.strip()
-            output = subprocess.check_output(cmd, shell=True)
-            if output:
-                output = output.decode("utf-8")
-            else:
-                return []
-            gpus = []
-            for line in output.splitlines():
-                gpus.append({
-                    'Name': line.split(',')[0].strip(),
-                    'TotalMemoryMB': line.split(',')[1].strip(),
-                })
-
-            return gpus
-        except Exception as e:
-            print('Error with colecting gpu info')
-            return []
+    Commands go through ``run``, so the collector can be driven by a fake
+    runner away from Windows. Process owners are resolved with a single WMI
+    query per sample for the pids that weren't seen before, and cached
+    until their process stops using the GPUs.
+    """
 
+    def __init__(self, run=run_command):
+        super().__init__()
+        self.run = run
+        self._owners = {}
 
-    def _get_process_owner(self, pid):
-        """Get the owner of a process"""
+    def _get_gpu_info(self):
+        """Get basic GPU information including accurate memory
+
+        A failing nvidia-smi raises, so that the inventory cache doesn't keep
+        an empty GPU list until its next refresh.
+        """
+        # Query GPU information - use nvidia-smi for better memory reporting
+        cmd = '''powershell -command "nvidia-smi --query-gpu=name,memory.total --format=csv,noheader,nounits"'''.strip()
+        output = self.run(cmd)
+        if output:
+            output = output.decode("utf-8")
+        else:
+            return []
+        gpus = []
+        for line in output.splitlines():
+            gpus.append({
+                'Name': line.split(',')[0].strip(),
+                'TotalMemoryMB': line.split(',')[1].strip(),
+            })
+
+        return gpus
+
+    def _get_process_owners(self, pids):
+        """Get the owner of every process in ``pids`` with one WMI query"""
+        if not pids:
+            return {}
         try:
-            # Note: Using the pid parameter instead of hardcoded 3540
+            process_filter = " OR ".join(f"ProcessId = {pid}" for pid in sorted(pids))
             ps_command = f'''
-            Get-WmiObject -Class Win32_Process -Filter "ProcessId = {pid}" |
+            Get-WmiObject -Class Win32_Process -Filter "{process_filter}" |
             Select-Object ProcessId, Name, @{{Name='Owner';Expression={{
                 $owner = $_.GetOwner()
                 "$($owner.Domain)\\$($owner.User)"
@@ -155,102 +178,96 @@ class WindowsGPUCollector(GPUCollector):
             encoded_command = base64.b64encode(encoded_bytes).decode('ascii')
 
             # Execute the encoded command
-            cmd = f'powershell -EncodedCommand {encoded_command}'
-            output = subprocess.check_output(cmd, shell=True)
+            output = self.run(f'powershell -EncodedCommand {encoded_command}')
 
             # Parse JSON output
-            process_info = json.loads(output)
-            return process_info
+            return {int(process["ProcessId"]): process for process in _as_list(json.loads(output))}
         except Exception as e:
-            print(f"Error getting process owner: {str(e)}")
-            return {"Name": "Unknown", "Owner": "Unknown", "CommandLine": "Unknown"}
-
-    def collect_stats(self):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            print(f"Error getting process owners: {str(e)}")
+            return {}
+
+    def _resolve_owners(self, pids):
+        """Cached process info of every pid in ``pids``, evicting pids that are gone"""
+        for pid in self._owners.keys() - pids:
+            del self._owners[pid]
+        missing = pids - self._owners.keys()
+        found = self._get_process_owners(missing)
+        for pid in missing:
+            # processes WMI didn't report have exited meanwhile, don't cache them
+            if pid in found:
+                self._owners[pid] = found[pid]
+        return {
+            pid: self._owners.get(pid, {"Name": "Unknown", "Owner": "Unknown", "CommandLine": "Unknown"})
+            for pid in pids
+        }
+
+    def _query_gpus(self):
+        return [
+            {"name": gpu.get("Name", "Unknown"), "memory_total": gpu.get("TotalMemoryMB", 0)}
+            for gpu in self._get_gpu_info()
+        ]
+
+    def collect_stats(self, timestamp=None):
+        timestamp = (timestamp or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
         usage_data = []
 
         try:
-            # Get GPU info
-            gpus = self._get_gpu_info()
+            # GPU names and memory come from the cached inventory
+            gpus = self.inventory.get()["gpus"]
+            if not gpus:
+                # nvidia-smi reported nothing, don't wait for the next refresh
+                self.inventory.invalidate()
+                gpus = self.inventory.get()["gpus"]
 
             # Get GPU memory usage by process
             cmd = '''powershell -command "(Get-Counter '\GPU Process Memory(*)\Local Usage').CounterSamples | Select-Object InstanceName, CookedValue | Sort-Object -Property CookedValue -Descending | ConvertTo-Json"'''
-            output = subprocess.check_output(cmd, shell=True)
-            memory_data = json.loads(output)
+            output = self.run(cmd)
+            memory_data = _as_list(json.loads(output))
 
             # If no processes are using GPU, add entries for idle GPUs
             if not memory_data:
-                for i, gpu in enumerate(gpus):
-                    entry = {
-                        "timestamp": timestamp,
-                        "hostname": self.hostname,
-                        "ip_adderss": self.ip_address,
-                        "gpu_id": i,
-                        "gpu_name": gpu.get("Name", "Unknown"),
-                        "username": None,
-                        "memory_used": 0,
-                        "memory_total": gpu.get("TotalMemoryMB", 0),
-                        "command": None,
-                        "status": "idle",
-                    }
-                    usage_data.append(entry)
-                return usage_data
-            # Process GPU usage information
+                self._resolve_owners(set())
+                return [self._entry(timestamp, i) for i in range(len(gpus))]
+
+            # Extract PID and GPU ID
+            samples = []
             for entry in memory_data:
                 instance_name = entry['InstanceName']
-                memory_used = entry['CookedValue'] / (1024 * 1024)  # Convert to MB
-
-                # Extract PID and GPU ID
-                pid = instance_name.split('_')[1]
-                gpu_id = int(instance_name.split('_')[-1])
-
+                samples.append((
+                    int(instance_name.split('_')[1]),
+                    int(instance_name.split('_')[-1]),
+                    entry['CookedValue'] / (1024 * 1024),  # Convert to MB
+                ))
 
-                # Get process info
-                process_info = self._get_process_owner(pid)
+            if any(gpu_id >= len(gpus) for _, gpu_id, _ in samples):
+                # a GPU the inventory doesn't know about yet
+                self.inventory.invalidate()
+                gpus = self.inventory.get()["gpus"]
 
-                # Get GPU name (match by index)
-                if gpu_id < len(gpus):
-                    gpu_name = gpus[gpu_id].get("Name", "Unknown")
+            # Get process info of every process at once
+            owners = self._resolve_owners({pid for pid, _, _ in samples})
 
-                # Get memory total
-                memory_total = 0
-                if gpu_id < len(gpus):
-                    memory_total = gpus[gpu_id].get("TotalMemoryMB", 0)
+            # Process GPU usage information
+            for pid, gpu_id, memory_used in samples:
+                process_info = owners[pid]
 
                 # Parse username from Owner (Domain\User)
                 username = process_info.get('Owner',"Unknown")
 
-                entry = {
-                    "timestamp": timestamp,
-                    "hostname": self.hostname,
-                    "ip_address": self.ip_address,
-                    "gpu_id": gpu_id,
-                    "gpu_name": gpu_name,
-                    "username": username,
-                    "memory_used": round(memory_used, 2),
-                    "memory_total": memory_total,
-                    "command": process_info.get("CommandLine", process_info.get("Name", "Unknown")),
-                    "status": "active",
-                }
-                usage_data.append(entry)
+                usage_data.append(self._entry(
+                    timestamp,
+                    gpu_id,
+                    username=username,
+                    memory_used=round(memory_used, 2),
+                    command=process_info.get("CommandLine", process_info.get("Name", "Unknown")),
+                    status="active",
+                ))
 
             # Add entry for any idle GPUs
             used_gpu_ids = set(entry["gpu_id"] for entry in usage_data)
-            for i, gpu in enumerate(gpus):
+            for i in range(len(gpus)):
                 if i not in used_gpu_ids:
-                    entry = {
-                        "timestamp": timestamp,
-                        "hostname": self.hostname,
-                        "ip_address": self.ip_address,
-                        "gpu_id": i,
-                        "gpu_name": gpu.get("Name", "Unknown"),
-                        "username": None,
-                        "memory_used": 0,
-                        "memory_total": gpu.get("TotalMemoryMB", 0),
-                        "command": None,
-                        "status": "idle",
-                    }
-                    usage_data.append(entry)
+                    usage_data.append(self._entry(timestamp, i))
 
         except Exception as e:
            print(f"Error collecting Windows GPU stats: {str(e)}")
@@ -268,9 +285,3 @@ def get_collector():
     else:
         print(f"Unsupported operating system: {system}")
         sys.exit(1)
-
-
-
-def collect_gpu_stats_and_send():
-    collector = get_collector()
-    collector.collect_and_send()
\ No newline at end of file
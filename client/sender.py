@@ -0,0 +1,254 @@
+import atexit
+import gzip
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from spool import Spool
+
+try:
+    import zstandard
+except ImportError:  # bodies are gzip compressed instead
+    zstandard = None
+
+load_dotenv()
+
+SERVER_ADDRESS = os.getenv("SERVER_ADDRESS")
+
+# raise error if not SERVER_ADDRESS
+if SERVER_ADDRESS is None:
+    raise Exception("SERVER_ADDRESS is not set. Set it in your .env file.")
+
+CONNECT_TIMEOUT = float(os.getenv("SEND_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("SEND_READ_TIMEOUT", "30"))
+SEND_QUEUE_SIZE = int(os.getenv("SEND_QUEUE_SIZE", "100"))
+SPOOL_REPLAY_INTERVAL = float(os.getenv("SPOOL_REPLAY_INTERVAL", "30"))  # seconds
+SPOOL_REPLAY_ROWS = int(os.getenv("SPOOL_REPLAY_ROWS", "20000"))  # rows per replay request
+UPLOAD_COMPRESSION = os.getenv("UPLOAD_COMPRESSION", "zstd")  # "zstd" or "gzip"
+METRICS_INTERVAL = 60  # seconds between two backpressure metrics reports
+
+# fallback logs written by older clients, moved into the spool at startup
+LEGACY_LOGS = {
+    "gpu_usage_local.log": "/gpu/submit",
+    "cpu_usage_local.log": "/cpu/submit",
+}
+LEGACY_RECORD_ROWS = 5000
+
+# endpoints taking a compressed JSON body
+COMPRESSED_ENDPOINTS = {"/ingest", "/replay"}
+
+
+def record_rows(record):
+    """Number of samples carried by a payload record"""
+    data = record["data"]
+    if isinstance(data, dict):
+        # an /ingest batch
+        return sum(len(data.get(kind, {}).get("rows", [])) for kind in ("gpu", "cpu"))
+    return len(data)
+
+
+class Sender:
+    """Ship collected stats to the master from a background thread
+
+    Payloads are queued and POSTed over a pooled keep-alive session with
+    explicit connect/read timeouts, so a slow master never stalls
+    collection. Payloads that can't be sent, or don't fit in the bounded
+    queue, go to the on-disk spool. A replayer thread drains the spool in
+    compressed batches once the master is reachable again.
+
+    Every payload carries this process' client id and a sequence number,
+    which the master uses to ingest it at most once.
+    """
+
+    def __init__(self, server_address, queue_size=SEND_QUEUE_SIZE,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), spool=None):
+        self.base_url = f"http://{server_address}:5000"
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.spool = spool or Spool()
+        self.client_id = uuid.uuid4().hex
+        self._seq = itertools.count()
+        self._reachable = False
+        self._compression = "zstd" if UPLOAD_COMPRESSION == "zstd" and zstandard is not None else "gzip"
+        self._metrics = {"enqueued": 0, "sent": 0, "failed": 0, "dropped": 0, "max_depth": 0,
+                         "spooled": 0, "replayed": 0}
+        self._metrics_lock = threading.Lock()
+        self._reported_at = time.monotonic()
+        self._adopt_legacy_logs()
+        self._thread = threading.Thread(target=self._run, name="nodetrack-sender", daemon=True)
+        self._thread.start()
+        self._replayer = threading.Thread(target=self._replay_forever, name="nodetrack-replayer", daemon=True)
+        self._replayer.start()
+        atexit.register(self.close)
+
+    def submit(self, endpoint, usage_data):
+        """Queue ``usage_data`` for a POST to ``endpoint`` without blocking"""
+        record = self._record(endpoint, usage_data)
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # backpressure: the master can't keep up, spool the data instead of waiting
+            self._count("dropped")
+            print(f"Send queue is full, spooling {record_rows(record)} records")
+            self._spool(record)
+            return False
+        with self._metrics_lock:
+            self._metrics["enqueued"] += 1
+            self._metrics["max_depth"] = max(self._metrics["max_depth"], self.queue.qsize())
+        return True
+
+    def metrics(self):
+        """Snapshot of the sender counters and the current queue depth"""
+        with self._metrics_lock:
+            return dict(self._metrics, depth=self.queue.qsize(), spooled_segments=len(self.spool.segments()))
+
+    def close(self):
+        """Spool whatever is still queued"""
+        while True:
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self._spool(record)
+            self.queue.task_done()
+        self.spool.close()
+
+    def _record(self, endpoint, usage_data):
+        return {"client": self.client_id, "seq": next(self._seq), "endpoint": endpoint, "data": usage_data}
+
+    def _count(self, name, value=1):
+        with self._metrics_lock:
+            self._metrics[name] += value
+
+    def _spool(self, record):
+        self.spool.append(record)
+        self._count("spooled")
+
+    def _adopt_legacy_logs(self):
+        for path, endpoint in LEGACY_LOGS.items():
+            if not os.path.exists(path):
+                continue
+            entries = []
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue
+            for start in range(0, len(entries), LEGACY_RECORD_ROWS):
+                self.spool.append(self._record(endpoint, entries[start:start + LEGACY_RECORD_ROWS]))
+            self.spool.sync()
+            os.remove(path)
+            print(f"Moved {len(entries)} records of {path} to the spool")
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            try:
+                self._post(record)
+            finally:
+                self.queue.task_done()
+            if time.monotonic() - self._reported_at >= METRICS_INTERVAL:
+                self._reported_at = time.monotonic()
+                print(f"Sender metrics: {self.metrics()}")
+
+    def _post(self, record):
+        endpoint = record["endpoint"]
+        try:
+            response = self._request(
+                endpoint,
+                record["data"],
+                headers={"X-Nodetrack-Client": record["client"], "X-Nodetrack-Seq": str(record["seq"])},
+            )
+            response.raise_for_status()
+            self._reachable = True
+            self._count("sent")
+            print(f"Successfully sent {record_rows(record)} records to {endpoint}")
+        except Exception as e:
+            self._reachable = False
+            self._count("failed")
+            print(f"Error sending data to master ({endpoint}): {str(e)}")
+            self._spool(record)
+
+    def _request(self, endpoint, payload, headers=None):
+        """POST ``payload`` as JSON, compressed for the endpoints that accept it"""
+        url = f"{self.base_url}{endpoint}"
+        if endpoint not in COMPRESSED_ENDPOINTS:
+            return self.session.post(url, json=payload, headers=headers, timeout=self.timeout)
+
+        body = json.dumps(payload).encode()
+        while True:
+            if self._compression == "zstd":
+                data = zstandard.ZstdCompressor().compress(body)
+            else:
+                data = gzip.compress(body)
+            response = self.session.post(
+                url,
+                data=data,
+                headers=dict(headers or {}, **{"Content-Type": "application/json", "Content-Encoding": self._compression}),
+                timeout=self.timeout,
+            )
+            if response.status_code != 415 or self._compression == "gzip":
+                return response
+            # the master has no zstd support, stick to gzip
+            print("Master can't decompress zstd, falling back to gzip")
+            self._compression = "gzip"
+
+    def _replay_forever(self):
+        replayed_at = time.monotonic()
+        while True:
+            time.sleep(max(self.spool.fsync_interval, 0.1))
+            self.spool.sync()
+            if time.monotonic() - replayed_at < SPOOL_REPLAY_INTERVAL:
+                continue
+            replayed_at = time.monotonic()
+            try:
+                self._replay()
+            except Exception as e:
+                print(f"Error replaying the spool: {str(e)}")
+
+    def _replay(self):
+        """Send sealed segments, oldest first, until the spool is empty or a request fails"""
+        segments = self.spool.segments()
+        if not segments and self._reachable:
+            # the master is back: make the records spooled meanwhile replayable
+            self.spool.seal()
+            segments = self.spool.segments()
+
+        while segments:
+            batch, records, rows = [], [], 0
+            while segments and rows < SPOOL_REPLAY_ROWS:
+                path = segments.pop(0)
+                batch.append(path)
+                segment_records = self.spool.read(path)
+                records.extend(segment_records)
+                rows += sum(record_rows(record) for record in segment_records)
+
+            response = self._request("/replay", records)
+            response.raise_for_status()
+            for path in batch:
+                self.spool.remove(path)
+            self._reachable = True
+            self._count("replayed", len(records))
+            print(f"Replayed {len(records)} spooled payloads ({rows} records)")
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def get_sender():
+    """Return the sender shared by all collectors of this process"""
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            _sender = Sender(SERVER_ADDRESS)
+    return _sender
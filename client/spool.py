@@ -0,0 +1,132 @@
+import glob
+import json
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SPOOL_DIR = os.getenv("SPOOL_DIR", "spool")
+SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_BYTES", str(512 * 1024 * 1024)))
+SPOOL_MAX_AGE = int(os.getenv("SPOOL_MAX_AGE", str(7 * 24 * 3600)))  # seconds
+SPOOL_FSYNC_INTERVAL = float(os.getenv("SPOOL_FSYNC_INTERVAL", "1"))  # seconds
+
+SEGMENT_SUFFIX = ".seg"
+
+
+class Spool:
+    """Append-only on-disk spool of payloads that couldn't reach the master
+
+    Records are appended as JSON lines to the active segment, which is
+    sealed once it reaches ``segment_bytes``. Writes are fsynced at most
+    every ``fsync_interval`` seconds (see sync), so a crash loses at most
+    that window. The oldest sealed segments are deleted when the spool
+    outgrows ``max_bytes`` or when they are older than ``max_age`` seconds.
+    """
+
+    def __init__(self, directory=SPOOL_DIR, segment_bytes=SPOOL_SEGMENT_BYTES,
+                 max_bytes=SPOOL_MAX_BYTES, max_age=SPOOL_MAX_AGE,
+                 fsync_interval=SPOOL_FSYNC_INTERVAL):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._active = None
+        self._active_path = None
+        self._synced_at = time.monotonic()
+        self._dirty = False
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, record):
+        line = (json.dumps(record) + "\n").encode()
+        with self._lock:
+            if self._active is None:
+                self._open_segment()
+            self._active.write(line)
+            self._dirty = True
+            if time.monotonic() - self._synced_at >= self.fsync_interval:
+                self._sync()
+            if self._active.tell() >= self.segment_bytes:
+                self._seal()
+
+    def sync(self):
+        """fsync pending writes, called periodically by the replayer"""
+        with self._lock:
+            self._sync()
+
+    def seal(self):
+        """Seal the active segment so that its records can be replayed"""
+        with self._lock:
+            self._seal()
+
+    def segments(self):
+        """Sealed segments, oldest first"""
+        with self._lock:
+            return [path for path in self._all_segments() if path != self._active_path]
+
+    def read(self, path):
+        """Records of a sealed segment, a torn last line is skipped"""
+        records = []
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    print(f"Skipping a corrupted record in {path}")
+        return records
+
+    def remove(self, path):
+        with self._lock:
+            os.remove(path)
+
+    def close(self):
+        with self._lock:
+            self._seal()
+
+    def _all_segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, "*" + SEGMENT_SUFFIX)))
+
+    def _open_segment(self):
+        # names sort in creation order, the counter breaks ties within a millisecond
+        stamp = time.time_ns() // 1_000_000
+        for counter in range(1000):
+            path = os.path.join(self.directory, f"{stamp:016d}-{counter:03d}{SEGMENT_SUFFIX}")
+            if not os.path.exists(path):
+                break
+        self._active = open(path, "ab")
+        self._active_path = path
+
+    def _sync(self):
+        if self._active is not None and self._dirty:
+            self._active.flush()
+            os.fsync(self._active.fileno())
+            self._dirty = False
+        self._synced_at = time.monotonic()
+
+    def _seal(self):
+        if self._active is None:
+            return
+        self._sync()
+        self._active.close()
+        self._active = None
+        self._active_path = None
+        self._enforce_caps()
+
+    def _enforce_caps(self):
+        segments = self._all_segments()
+        sizes = {path: os.path.getsize(path) for path in segments}
+        total = sum(sizes.values())
+        expired_before = time.time() - self.max_age
+        dropped = 0
+        for path in segments:
+            if total <= self.max_bytes and os.path.getmtime(path) >= expired_before:
+                break
+            os.remove(path)
+            total -= sizes[path]
+            dropped += 1
+        if dropped:
+            print(f"Spool caps reached, dropped the {dropped} oldest segments")
@@ -0,0 +1,140 @@
+import base64
+import os
+import subprocess
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SERVER_ADDRESS", "localhost")  # nothing is sent
+from gpu.backends import NVMLBackend
+from gpu.benchmark import FakeNVML, FakePowerShell
+from gpu.collect import LinuxGPUCollector, WindowsGPUCollector
+
+
+class FlakyNVML(FakeNVML):
+    """FakeNVML whose next process query fails as if its GPU fell off the bus"""
+
+    lost = False
+    inits = 0
+
+    def nvmlInit(self):
+        self.inits += 1
+        self.lost = False
+
+    def nvmlDeviceGetComputeRunningProcesses(self, handle):
+        if self.lost:
+            raise self.NVMLError_GpuIsLost("GPU is lost")
+        return super().nvmlDeviceGetComputeRunningProcesses(handle)
+
+
+class NVMLBackendTests(unittest.TestCase):
+    def setUp(self):
+        self.nvml = FlakyNVML(2, [os.getpid()])
+        self.backend = NVMLBackend(nvml=self.nvml)
+
+    def add_gpu(self):
+        self.nvml.running[self.nvml.gpus] = []
+        self.nvml.gpus += 1
+
+    def test_sample(self):
+        stats = self.backend.sample()
+        self.assertEqual([index for index, _ in stats], [0, 1])
+        self.assertEqual([process["pid"] for process in stats[0][1]], [os.getpid()])
+        self.assertEqual(stats[0][1][0]["gpu_memory_usage"], 512)
+        self.assertEqual(stats[1][1], [])
+
+    def test_sample_follows_device_count(self):
+        self.backend.sample()
+        self.add_gpu()
+        self.assertEqual([index for index, _ in self.backend.sample()], [0, 1, 2])
+
+    def test_initializes_again_after_nvml_error(self):
+        self.nvml.lost = True
+        self.assertEqual(len(self.backend.sample()), 2)
+        self.assertEqual(self.nvml.inits, 2)
+
+    def test_collector_reloads_inventory_on_hot_plug(self):
+        collector = LinuxGPUCollector(backend=self.backend)
+        version = collector.inventory.get() and collector.inventory.version
+        self.assertEqual(len(collector.collect_stats()), 2)
+        self.add_gpu()
+        entries = collector.collect_stats()
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(entries[2]["gpu_name"], "NVIDIA A100-SXM4-80GB")
+        self.assertEqual(entries[2]["memory_total"], 80 * 1024)
+        self.assertNotEqual(entries[2]["inventory_version"], version)
+
+
+class RecordingPowerShell(FakePowerShell):
+    """FakePowerShell keeping the WMI queries it answered, nvidia-smi fails while ``broken``"""
+
+    broken = False
+
+    def __init__(self, gpus, processes):
+        super().__init__(gpus, processes)
+        self.wmi_queries = []
+
+    def __call__(self, cmd):
+        if "nvidia-smi" in cmd and self.broken:
+            raise subprocess.CalledProcessError(1, cmd)
+        if "-EncodedCommand" in cmd:
+            self.wmi_queries.append(cmd)
+        return super().__call__(cmd)
+
+
+class WindowsGPUCollectorTests(unittest.TestCase):
+    def setUp(self):
+        self.run = RecordingPowerShell(gpus=2, processes=3)
+        self.collector = WindowsGPUCollector(run=self.run)
+
+    def test_collect_stats(self):
+        entries = self.collector.collect_stats()
+        self.assertEqual(
+            sorted((entry["gpu_id"], entry["username"]) for entry in entries),
+            [(0, "LAB\\user1000"), (0, "LAB\\user1002"), (1, "LAB\\user1001")],
+        )
+        self.assertEqual({entry["gpu_name"] for entry in entries}, {"NVIDIA RTX A6000"})
+
+    def test_one_wmi_query_for_new_processes_only(self):
+        self.collector.collect_stats()
+        self.assertEqual(len(self.run.wmi_queries), 1)
+        self.collector.collect_stats()
+        self.assertEqual(len(self.run.wmi_queries), 1)
+
+        self.run.pids.append(2000)
+        self.collector.collect_stats()
+        self.assertEqual(len(self.run.wmi_queries), 2)
+        self.assertIn("ProcessId = 2000", _script(self.run.wmi_queries[-1]))
+        self.assertNotIn("ProcessId = 1000", _script(self.run.wmi_queries[-1]))
+
+    def test_owners_of_stopped_processes_are_evicted(self):
+        self.collector.collect_stats()
+        self.run.pids.remove(1001)
+        self.collector.collect_stats()
+        self.assertEqual(set(self.collector._owners), {1000, 1002})
+
+        # a reused pid is looked up again
+        self.run.pids.append(1001)
+        self.collector.collect_stats()
+        self.assertIn("ProcessId = 1001", _script(self.run.wmi_queries[-1]))
+
+    def test_failed_gpu_query_is_not_cached(self):
+        self.run.broken = True
+        self.assertEqual(self.collector.collect_stats(), [])
+        self.run.broken = False
+        entries = self.collector.collect_stats()
+        self.assertEqual({entry["memory_total"] for entry in entries}, {"49140"})
+
+    def test_unknown_gpu_reloads_inventory(self):
+        self.collector.collect_stats()
+        self.run.gpus = 4
+        entries = self.collector.collect_stats()
+        self.assertEqual(len({entry["gpu_id"] for entry in entries}), 4)
+        self.assertNotIn("Unknown", {entry["gpu_name"] for entry in entries})
+
+
+def _script(cmd):
+    return base64.b64decode(cmd.split()[-1]).decode("utf-16le")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import gzip
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+import requests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SERVER_ADDRESS", "localhost")  # nothing is sent
+import sender
+from spool import Spool
+
+
+class FakeSession:
+    """Session answering each POST with the next status code of ``statuses``"""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.posts = []
+
+    def post(self, url, **kwargs):
+        self.posts.append((url, kwargs))
+        response = requests.Response()
+        response.status_code = self.statuses.pop(0)
+        response.url = url
+        return response
+
+
+class SenderTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool = Spool(directory.name, fsync_interval=0)
+        # no sender or replayer threads, the tests drive them
+        with mock.patch("sender.threading.Thread"), mock.patch("sender.atexit.register"):
+            self.sender = sender.Sender("localhost", spool=self.spool)
+        self.sender._compression = "zstd" if sender.zstandard is not None else "gzip"
+
+    def spool_records(self, count):
+        for _ in range(count):
+            self.spool.append(self.sender._record("/gpu/submit", [{"gpu_id": "0"}]))
+            self.spool.seal()
+
+    def body(self, post):
+        _, kwargs = post
+        data = kwargs["data"]
+        if kwargs["headers"]["Content-Encoding"] == "gzip":
+            data = gzip.decompress(data)
+        else:
+            data = sender.zstandard.ZstdDecompressor().decompress(data)
+        return json.loads(data)
+
+    def test_replay(self):
+        self.spool_records(2)
+        self.sender.session = FakeSession(200)
+        self.sender._replay()
+        url, _ = self.sender.session.posts[0]
+        self.assertTrue(url.endswith("/replay"))
+        self.assertEqual([record["seq"] for record in self.body(self.sender.session.posts[0])], [0, 1])
+        self.assertEqual(self.spool.segments(), [])
+
+    def test_replay_failure_keeps_segments(self):
+        self.spool_records(2)
+        segments = self.spool.segments()
+        for status in (500, 503, 404):
+            self.sender.session = FakeSession(status)
+            with self.assertRaises(requests.HTTPError):
+                self.sender._replay()
+            self.assertEqual(self.spool.segments(), segments)
+
+    def test_replay_seals_once_reachable(self):
+        self.spool.append(self.sender._record("/gpu/submit", []))
+        self.sender.session = FakeSession()
+        self.sender._replay()
+        self.assertEqual(self.sender.session.posts, [])
+
+        self.sender._reachable = True
+        self.sender.session = FakeSession(200)
+        self.sender._replay()
+        self.assertEqual(len(self.sender.session.posts), 1)
+        self.assertEqual(self.spool.segments(), [])
+
+    @unittest.skipIf(sender.zstandard is None, "zstandard isn't installed")
+    def test_gzip_fallback(self):
+        self.spool_records(1)
+        self.sender.session = FakeSession(415, 200)
+        self.sender._replay()
+        encodings = [kwargs["headers"]["Content-Encoding"] for _, kwargs in self.sender.session.posts]
+        self.assertEqual(encodings, ["zstd", "gzip"])
+        self.assertEqual(self.body(self.sender.session.posts[1])[0]["seq"], 0)
+        self.assertEqual(self.spool.segments(), [])
+
+        # later requests don't try zstd again
+        self.spool_records(1)
+        self.sender.session = FakeSession(200)
+        self.sender._replay()
+        self.assertEqual(self.sender.session.posts[0][1]["headers"]["Content-Encoding"], "gzip")
+
+    def test_gzip_unsupported(self):
+        self.sender._compression = "gzip"
+        self.spool_records(1)
+        self.sender.session = FakeSession(415)
+        with self.assertRaises(requests.HTTPError):
+            self.sender._replay()
+        self.assertEqual(len(self.spool.segments()), 1)
+
+    def test_post_failure_spooled(self):
+        self.sender.session = FakeSession(503)
+        self.sender._post(self.sender._record("/gpu/submit", [{"gpu_id": "0"}]))
+        self.spool.seal()
+        path, = self.spool.segments()
+        self.assertEqual(self.spool.read(path)[0]["seq"], 0)
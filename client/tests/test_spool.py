@@ -0,0 +1,78 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spool import Spool
+
+
+class SpoolTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def spool(self, **kwargs):
+        spool = Spool(self.directory.name, **dict({"fsync_interval": 0}, **kwargs))
+        self.addCleanup(spool.close)
+        return spool
+
+    def record(self, seq, size=0):
+        return {"client": "c", "seq": seq, "endpoint": "/ingest", "data": "x" * size}
+
+    def test_segments_in_order(self):
+        spool = self.spool()
+        for seq in range(3):
+            spool.append(self.record(seq))
+            spool.seal()
+        spool.append(self.record(3))
+
+        # the active segment isn't replayable until sealed
+        segments = spool.segments()
+        self.assertEqual([[record["seq"] for record in spool.read(path)] for path in segments], [[0], [1], [2]])
+        spool.seal()
+        self.assertEqual(spool.read(spool.segments()[-1]), [self.record(3)])
+
+    def test_full_segment_sealed(self):
+        spool = self.spool(segment_bytes=100)
+        spool.append(self.record(0))
+        self.assertEqual(spool.segments(), [])
+        spool.append(self.record(1, size=100))
+        self.assertEqual(len(spool.segments()), 1)
+
+    def test_torn_last_line(self):
+        spool = self.spool()
+        spool.append(self.record(0))
+        spool.append(self.record(1))
+        spool.seal()
+        path, = spool.segments()
+        # a crash in the middle of a write
+        with open(path, "ab") as f:
+            f.write(b'{"client": "c", "seq": 2, "endp')
+        self.assertEqual(spool.read(path), [self.record(0), self.record(1)])
+
+    def test_remove(self):
+        spool = self.spool()
+        spool.append(self.record(0))
+        spool.seal()
+        spool.remove(spool.segments()[0])
+        self.assertEqual(spool.segments(), [])
+
+    def test_size_cap(self):
+        spool = self.spool(max_bytes=350)
+        for seq in range(4):
+            spool.append(self.record(seq, size=100))
+            spool.seal()
+        # the oldest segments are dropped first
+        self.assertEqual([spool.read(path)[0]["seq"] for path in spool.segments()], [2, 3])
+
+    def test_age_cap(self):
+        spool = self.spool(max_age=3600)
+        for seq in range(2):
+            spool.append(self.record(seq))
+            spool.seal()
+        expired = time.time() - 7200
+        os.utime(spool.segments()[0], (expired, expired))
+        spool.append(self.record(2))
+        spool.seal()
+        self.assertEqual([spool.read(path)[0]["seq"] for path in spool.segments()], [1, 2])
@@ -1,6 +1,13 @@
+import hashlib
+import json
+import os
 import socket
+import time
 import netifaces
 
+# seconds between two refreshes of the static host inventory
+INVENTORY_REFRESH_INTERVAL = int(os.getenv("INVENTORY_REFRESH_INTERVAL", "3600"))
+
 
 def get_first_non_loopback_ip():
     """Get the first non-loopback IP address"""
@@ -16,4 +23,44 @@ def get_first_non_loopback_ip():
 
 def get_hostname():
     """Get the hostname of the machine"""
-    return socket.gethostname()
\ No newline at end of file
+    return socket.gethostname()
+
+
+class CachedInventory:
+    """Static host facts cached across samples
+
+    ``load`` returns a JSON-serializable dict of facts. It only runs again
+    once ``refresh_interval`` seconds have passed, when the set of network
+    interfaces changes or after ``invalidate``. ``version`` is a short hash
+    of the current facts, so the master can tell when they changed.
+    """
+
+    def __init__(self, load, refresh_interval=INVENTORY_REFRESH_INTERVAL):
+        self._load = load
+        self.refresh_interval = refresh_interval
+        self.facts = None
+        self.version = None
+        self._loaded_at = None
+        self._interfaces = None
+
+    def get(self):
+        interfaces = netifaces.interfaces()
+        expired = self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_interval
+        if expired or interfaces != self._interfaces:
+            self.facts = self._load()
+            self.version = hashlib.sha1(json.dumps(self.facts, sort_keys=True).encode()).hexdigest()[:12]
+            self._loaded_at = time.monotonic()
+            self._interfaces = interfaces
+        return self.facts
+
+    def invalidate(self):
+        """Reload the facts on the next ``get``"""
+        self._loaded_at = None
+
+
+def load_host_facts():
+    """Hostname and IP address of this machine"""
+    return {
+        "hostname": get_hostname(),
+        "ip_address": get_first_non_loopback_ip(),
+    }
@@ -0,0 +1,39 @@
+import base64
+
+
+def pack_bitmask(flags):
+    """Pack booleans into a base64 string, flag i being bit (i % 8) of byte i // 8"""
+    packed = bytearray((len(flags) + 7) // 8)
+    for index, flag in enumerate(flags):
+        if flag:
+            packed[index // 8] |= 1 << (index % 8)
+    return base64.b64encode(bytes(packed)).decode('ascii')
+
+
+def columnar_series(rows, convert=float):
+    """Turn gap-filled ``(node id, bucket, value)`` rows into columnar arrays.
+
+    ``rows`` must be ordered by node and bucket, every node covering the same
+    buckets. Returns the shared list of ISO timestamps and, per node id, the
+    converted values (0.0 where a bucket is empty) and the packed bitmask of
+    non-empty buckets.
+    """
+    timestamps = []
+    columns = {}
+    first_node = None
+    values = active = None
+    for node_id, bucket, value in rows:
+        if node_id not in columns:
+            if first_node is None:
+                first_node = node_id
+            values, active = [], []
+            columns[node_id] = (values, active)
+        if node_id == first_node:
+            timestamps.append(bucket.isoformat())
+        values.append(convert(value) if value is not None else 0.0)
+        active.append(value is not None)
+
+    return timestamps, {
+        node_id: {'values': values, 'active': pack_bitmask(active)}
+        for node_id, (values, active) in columns.items()
+    }
@@ -0,0 +1,77 @@
+import csv
+import io
+from itertools import islice
+from django.conf import settings
+from django.db import connection
+
+
+def copy_rows(cursor, table, columns, rows):
+    """Stream ``rows`` into ``table`` with a single COPY ... FROM STDIN"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(_csv_value(value) for value in row)
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+    )
+
+
+def copy_insert_ignoring_conflicts(model, columns, rows):
+    """Insert ``rows`` into ``model``'s table through COPY, skipping conflicting rows.
+
+    COPY can't skip conflicts by itself, so rows are copied into a temporary
+    staging table first and moved with INSERT ... ON CONFLICT DO NOTHING.
+    The staging table lives for the session and is emptied on commit, so
+    this has to run inside a transaction. Returns the number of rows inserted.
+
+    Databases without COPY, such as the sqlite one of development setups,
+    get batches of INGEST_BATCH_SIZE rows inserted the same way instead.
+    """
+    table = model._meta.db_table
+    staging = f"{table}_staging"
+    column_list = ', '.join(columns)
+    if connection.vendor != 'postgresql':
+        return _insert_ignoring_conflicts(model, columns, rows)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging} "
+            f"(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        )
+        copy_rows(cursor, staging, columns, rows)
+        cursor.execute(
+            f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {staging} "
+            f"ON CONFLICT DO NOTHING"
+        )
+        inserted = cursor.rowcount
+        # the staging table is reused by the next call of this transaction
+        cursor.execute(f"TRUNCATE {staging}")
+    return inserted
+
+
+def _insert_ignoring_conflicts(model, columns, rows):
+    fields = [model._meta.get_field(column) for column in columns]
+    placeholders = ', '.join(['%s'] * len(columns))
+    sql = (
+        f"INSERT INTO {model._meta.db_table} ({', '.join(columns)}) VALUES ({placeholders}) "
+        f"ON CONFLICT DO NOTHING"
+    )
+    rows = iter(rows)
+    inserted = 0
+    with connection.cursor() as cursor:
+        while batch := list(islice(rows, settings.INGEST_BATCH_SIZE)):
+            cursor.executemany(sql, [
+                [field.get_db_prep_save(value, connection) for field, value in zip(fields, row)]
+                for row in batch
+            ])
+            inserted += cursor.rowcount
+    return inserted
+
+
+def _csv_value(value):
+    # an unquoted empty field is NULL in COPY's csv format
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
@@ -0,0 +1,69 @@
+import csv
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+
+def get_export_range(query_params):
+    """Parse start_date/end_date, defaulting to the last 30 days like the reports"""
+    start_date = query_params.get('start_date')
+    end_date = query_params.get('end_date')
+    if not start_date or not end_date:
+        end_time = timezone.now() + timedelta(days=1)
+        return end_time - timedelta(days=30), end_time
+
+    start_time = datetime.fromisoformat(start_date)
+    end_time = datetime.fromisoformat(end_date)
+    if timezone.is_naive(start_time):
+        start_time = timezone.make_aware(start_time)
+    if timezone.is_naive(end_time):
+        end_time = timezone.make_aware(end_time)
+    return start_time, end_time
+
+
+class Echo:
+    """File-like object that hands back what is written, for streaming csv.writer output"""
+
+    def write(self, value):
+        return value
+
+
+def _ndjson_lines(labels, rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(labels, row))) + '\n'
+
+
+def _csv_lines(labels, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(labels)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_values(queryset, columns):
+    """The rows of ``queryset`` stream_export writes, one value per column"""
+    return queryset.values_list(*[lookup for _, lookup in columns])
+
+
+def stream_export(queryset, columns, export_format, filename):
+    """Stream ``queryset`` as NDJSON or CSV with constant memory.
+
+    ``columns`` is a sequence of (output label, field lookup) pairs. Rows are
+    read through a server-side cursor, EXPORT_CHUNK_SIZE at a time.
+    """
+    content_type, extension = EXPORT_FORMATS[export_format]
+    labels = [label for label, _ in columns]
+    rows = export_values(queryset, columns).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    lines = _csv_lines(labels, rows) if export_format == 'csv' else _ndjson_lines(labels, rows)
+
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    return response
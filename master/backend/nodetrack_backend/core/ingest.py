@@ -0,0 +1,213 @@
+import json
+import time
+import zlib
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ParseError, UnsupportedMediaType
+from core.models import Node, SubmittedBatch
+
+try:
+    import zstandard
+except ImportError:  # zstd bodies are then rejected, gzip still works
+    zstandard = None
+
+# headers identifying a client payload, see claim_batch
+CLIENT_ID_HEADER = 'X-Nodetrack-Client'
+SEQ_HEADER = 'X-Nodetrack-Seq'
+
+
+def validate_entries(serializer_class, entries):
+    """Validate a submitted list of entries with a single many=True serializer.
+
+    Malformed entries are dropped instead of failing the whole request, which
+    is how the submit endpoints have always treated them, and so are items
+    that aren't objects at all.
+    """
+    if not isinstance(entries, list):
+        return []
+    entries = [entry for entry in entries if isinstance(entry, dict)]
+    serializer = serializer_class(data=entries, many=True)
+    if serializer.is_valid():
+        return serializer.validated_data
+
+    # DRF reports item errors either as a list aligned with the input or as a
+    # dict keyed by index, depending on its version/settings
+    errors = serializer.errors
+    if isinstance(errors, dict):
+        invalid = {index for index in errors if isinstance(index, int)}
+    else:
+        invalid = {index for index, error in enumerate(errors) if error}
+    valid_entries = [entry for index, entry in enumerate(entries) if index not in invalid]
+
+    serializer = serializer_class(data=valid_entries, many=True)
+    return serializer.validated_data if serializer.is_valid() else []
+
+
+def aware(timestamp):
+    """Make sure a submitted timestamp is timezone aware"""
+    if timezone.is_naive(timestamp):
+        return timezone.make_aware(timestamp)
+    return timestamp
+
+
+class IngestTimer:
+    """Measure how long a single submit request spent ingesting its payload"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 2)
+
+
+def get_batch_id(request):
+    """``(client id, sequence number)`` of a submitted payload, None for legacy clients"""
+    client_id = request.headers.get(CLIENT_ID_HEADER)
+    seq = request.headers.get(SEQ_HEADER)
+    if not client_id or seq is None:
+        return None
+    try:
+        return client_id, int(seq)
+    except ValueError:
+        raise ParseError(f'{SEQ_HEADER} must be an integer')
+
+
+def earliest_sample(samples):
+    """Time of the earliest of ``samples``, a kind -> entries mapping, None when there are none"""
+    return min((aware(entry['timestamp']) for entries in samples.values() for entry in entries), default=None)
+
+
+def claim_batch(node, client_id, seq, first_sample=None):
+    """Record a payload as ingested, False when it already was.
+
+    Must run in the transaction that writes the payload rows, so that a
+    payload is either fully stored and claimed or neither.
+    """
+    _, created = SubmittedBatch.objects.get_or_create(
+        client_id=client_id, seq=seq, defaults={'node': node, 'first_sample': first_sample}
+    )
+    return created
+
+
+def prune_submitted_batches():
+    """Delete the batch markers older than INGEST_BATCH_RETENTION_DAYS, returns how many"""
+    cutoff = timezone.now() - timedelta(days=settings.INGEST_BATCH_RETENTION_DAYS)
+    deleted, _ = SubmittedBatch.objects.filter(received_at__lt=cutoff).delete()
+    return deleted
+
+
+def ingest_submission(primary_ip, hostname, samples, batch=None):
+    """Ingest validated samples for the node at ``primary_ip`` exactly once.
+
+    ``samples`` maps a kind ('gpu' or 'cpu') to its validated entries, all
+    of them are written in a single transaction. Returns the number of
+    records created, or None when ``batch`` was already ingested.
+    """
+    # Import here to avoid circular imports
+    from gpu_monitor.ingest import forget_lookups, forget_node_gpus
+
+    # Get or create node using primary IP, once for the whole payload
+    node, _ = Node.objects.get_or_create(
+        ip_address=primary_ip,
+        defaults={'hostname': hostname},
+    )
+    try:
+        return _write_submission(node, samples, batch)
+    except IntegrityError:
+        # foreign keys are checked when the transaction commits: a GPU, user
+        # or command cached by this process was deleted meanwhile, resolve
+        # everything again
+        forget_node_gpus(node.pk)
+        forget_lookups()
+        return _write_submission(node, samples, batch)
+
+
+def _write_submission(node, samples, batch):
+    from cpu_monitor.ingest import ingest_cpu_usage
+    from gpu_monitor.ingest import ingest_gpu_usage
+    writers = {'gpu': ingest_gpu_usage, 'cpu': ingest_cpu_usage}
+
+    with transaction.atomic():
+        if batch is not None and not claim_batch(node, *batch, earliest_sample(samples)):
+            return None
+        return sum(writers[kind](node, entries) for kind, entries in samples.items() if entries)
+
+
+def unpack_batch(payload):
+    """Expand an /ingest batch into GPU and CPU entries shaped as the submit endpoints'.
+
+    A batch sends host level fields once and samples as compact rows::
+
+        {"host": {"hostname", "ip_address", "inventory_version",
+                  "cpu_cores_logical", "cpu_cores_physical",
+                  "gpus": [{"gpu_id", "gpu_name", "memory_total"}, ...]},
+         "gpu": {"columns": [...], "rows": [[...], ...]},
+         "cpu": {"columns": [...], "rows": [[...], ...]}}
+
+    Raises ParseError when the batch isn't shaped like this.
+    """
+    try:
+        host = payload['host']
+        common = {
+            'hostname': host['hostname'],
+            'ip_address': host['ip_address'],
+            'inventory_version': host.get('inventory_version'),
+        }
+        gpus = {gpu['gpu_id']: gpu for gpu in host.get('gpus', [])}
+        gpu_entries = []
+        for row in _rows(payload.get('gpu')):
+            entry = dict(common, **row)
+            gpu = gpus.get(entry.get('gpu_id'), {})
+            entry.setdefault('gpu_name', gpu.get('gpu_name'))
+            entry.setdefault('memory_total', gpu.get('memory_total'))
+            gpu_entries.append(entry)
+        cpu_common = dict(
+            common,
+            cpu_cores_logical=host.get('cpu_cores_logical'),
+            cpu_cores_physical=host.get('cpu_cores_physical'),
+        )
+        cpu_entries = [dict(cpu_common, **row) for row in _rows(payload.get('cpu'))]
+    except (TypeError, KeyError, AttributeError) as e:
+        raise ParseError(f'Malformed batch: {e!r}')
+    return gpu_entries, cpu_entries
+
+
+def _rows(table):
+    if not table:
+        return []
+    columns = table['columns']
+    return [dict(zip(columns, row)) for row in table['rows']]
+
+
+def read_json_body(request):
+    """Parse a JSON request body that may be gzip or zstd compressed.
+
+    The decompressed size is capped by INGEST_MAX_BYTES.
+    """
+    body = request.body
+    encoding = request.headers.get('Content-Encoding', 'identity').lower()
+    if encoding == 'gzip':
+        decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(body, settings.INGEST_MAX_BYTES)
+        except zlib.error as e:
+            raise ParseError(f'Invalid gzip body: {e}')
+        if decompressor.unconsumed_tail:
+            raise ParseError(f'Body is larger than {settings.INGEST_MAX_BYTES} bytes once decompressed')
+    elif encoding == 'zstd' and zstandard is not None:
+        reader = zstandard.ZstdDecompressor().stream_reader(body)
+        try:
+            body = reader.read(settings.INGEST_MAX_BYTES + 1)
+        except zstandard.ZstdError as e:
+            raise ParseError(f'Invalid zstd body: {e}')
+        if len(body) > settings.INGEST_MAX_BYTES:
+            raise ParseError(f'Body is larger than {settings.INGEST_MAX_BYTES} bytes once decompressed')
+    elif encoding != 'identity':
+        raise UnsupportedMediaType(encoding, f'Unsupported Content-Encoding: {encoding}')
+    try:
+        return json.loads(body)
+    except ValueError as e:
+        raise ParseError(f'Invalid JSON body: {e}')
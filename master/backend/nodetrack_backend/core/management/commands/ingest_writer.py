@@ -0,0 +1,34 @@
+import socket
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.queue import IngestWriter
+
+
+class Command(BaseCommand):
+    help = 'Drain the ingest queue filled by the submit endpoints into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--consumer', default=socket.gethostname(),
+            help='Name of this writer in the consumer group, stable across restarts (default: hostname)',
+        )
+        parser.add_argument(
+            '--batch-rows', type=int, default=settings.INGEST_WRITER_BATCH_ROWS,
+            help='Samples written per batch (default: INGEST_WRITER_BATCH_ROWS)',
+        )
+        parser.add_argument(
+            '--flush-ms', type=int, default=settings.INGEST_WRITER_FLUSH_MS,
+            help='Longest wait for a batch to fill up, in milliseconds (default: INGEST_WRITER_FLUSH_MS)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"Writing {settings.INGEST_QUEUE_STREAM} as {options['consumer']}: "
+            f"batches of {options['batch_rows']} rows, flushed every {options['flush_ms']} ms"
+        )
+        IngestWriter(
+            options['consumer'],
+            batch_rows=options['batch_rows'],
+            flush_ms=options['flush_ms'],
+            log=self.stdout.write,
+        ).run()
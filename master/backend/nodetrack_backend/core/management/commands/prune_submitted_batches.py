@@ -0,0 +1,24 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.ingest import prune_submitted_batches
+
+
+class Command(BaseCommand):
+    help = 'Delete the markers of ingested client payloads older than INGEST_BATCH_RETENTION_DAYS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running and prune every this many seconds (default: prune once)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = prune_submitted_batches()
+            self.stdout.write(
+                f"Pruned {deleted} batch markers older than {settings.INGEST_BATCH_RETENTION_DAYS} days"
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from core.timescale import apply_policies, compression_report
+
+
+def _size(n):
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if n < 1024:
+            return f'{n:.0f} {unit}'
+        n /= 1024
+    return f'{n:.1f} TB'
+
+
+class Command(BaseCommand):
+    help = 'Apply the hypertable compression, rollup refresh and retention settings, and report the compression ratios'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--report-only', action='store_true',
+            help='Only report the compression achieved so far, leave the policies as they are',
+        )
+
+    def handle(self, *args, **options):
+        if not options['report_only']:
+            apply_policies(log=self.stdout.write)
+
+        for row in compression_report():
+            ratio = f"{row['ratio']}x" if row['ratio'] else 'n/a'
+            self.stdout.write(
+                f"{row['hypertable']}: {row['compressed_chunks']}/{row['chunks']} chunks compressed, "
+                f"{_size(row['before_bytes'])} -> {_size(row['after_bytes'])} (ratio {ratio}), "
+                f"{_size(row['total_bytes'])} in total"
+            )
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmittedBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_id', models.CharField(max_length=32)),
+                ('seq', models.BigIntegerField()),
+                ('received_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submitted_batches', to='core.node')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('client_id', 'seq'), name='unique_client_batch')],
+            },
+        ),
+    ]
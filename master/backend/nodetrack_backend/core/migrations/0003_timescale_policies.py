@@ -0,0 +1,29 @@
+from django.db import migrations
+from core.timescale import apply_policies, remove_policies
+
+# hypertable -> (segmentby, orderby) as of this migration, later ones change them
+COMPRESSED_HYPERTABLES = {
+    'gpu_monitor_gpuusage': ('gpu_id', 'time DESC, username'),
+    'cpu_monitor_cpuusage': ('node_id', 'time DESC'),
+}
+
+
+def add_policies(apps, schema_editor):
+    apply_policies(schema_editor.connection, hypertables=COMPRESSED_HYPERTABLES)
+
+
+def drop_policies(apps, schema_editor):
+    remove_policies(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_submitted_batch'),
+        ('cpu_monitor', '0004_cpuusage_natural_key'),
+        ('gpu_monitor', '0004_gpuusage_natural_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_policies, drop_policies),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_timescale_policies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submittedbatch',
+            name='first_sample',
+            field=models.DateTimeField(help_text='Time of the earliest sample of the payload', null=True),
+        ),
+    ]
@@ -15,4 +15,27 @@ class Node(models.Model):
         ordering = ['ip_address']
     
     def __str__(self):
-        return self.hostname
\ No newline at end of file
+        return self.hostname
+
+class SubmittedBatch(models.Model):
+    """A client payload already ingested, identified by the client's sequence number.
+
+    Clients replay payloads they couldn't confirm, so every payload carries
+    ``(client_id, seq)`` and is ingested only when its marker can be claimed,
+    in the same transaction as its rows. Markers are pruned once older than
+    INGEST_BATCH_RETENTION_DAYS, past the age clients give up replaying.
+    """
+    client_id = models.CharField(max_length=32)
+    seq = models.BigIntegerField()
+    node = models.ForeignKey(Node, on_delete=models.CASCADE, related_name='submitted_batches')
+    received_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # for the GPU accounting to recompute the days a late replay added samples to
+    first_sample = models.DateTimeField(null=True, help_text="Time of the earliest sample of the payload")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['client_id', 'seq'], name='unique_client_batch'),
+        ]
+
+    def __str__(self):
+        return f"{self.client_id}#{self.seq}"
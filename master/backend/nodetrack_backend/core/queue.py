@@ -0,0 +1,290 @@
+import json
+import time
+import traceback
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, InterfaceError, OperationalError, close_old_connections, connection, transaction
+from django.utils.dateparse import parse_datetime
+from django_redis import get_redis_connection
+from psycopg2.extras import execute_values
+from rest_framework import status
+from rest_framework.response import Response
+from core.copy import copy_insert_ignoring_conflicts
+from core.ingest import earliest_sample, prune_submitted_batches
+from core.models import Node, SubmittedBatch
+from cpu_monitor.ingest import CPU_USAGE_COLUMNS, cpu_usage_rows, latest_cpu_samples
+from cpu_monitor.models import CPUUsage
+from gpu_monitor.ingest import (
+    GPU_USAGE_COLUMNS, forget_lookups, forget_node_gpus, gpu_usage_rows, merge_gpu_usage, resolve_gpus,
+)
+from gpu_monitor.models import GPUUsage
+
+WRITER_GROUP = 'writers'
+# seconds between two prunings of the batch markers by a writer
+PRUNE_INTERVAL = 3600
+
+
+class QueueFull(Exception):
+    """The ingest stream holds more messages than INGEST_QUEUE_MAX_DEPTH"""
+
+
+def get_redis():
+    return get_redis_connection('default')
+
+
+def enqueue_samples(primary_ip, hostname, samples, batch=None):
+    """Push validated samples of a node onto the ingest stream for the writer.
+
+    ``samples`` maps a kind ('gpu' or 'cpu') to its validated entries.
+    Raises QueueFull when the writer is too far behind, so that clients keep
+    the payload in their spool instead.
+    """
+    redis = get_redis()
+    if redis.xlen(settings.INGEST_QUEUE_STREAM) >= settings.INGEST_QUEUE_MAX_DEPTH:
+        raise QueueFull(f'{settings.INGEST_QUEUE_STREAM} holds {settings.INGEST_QUEUE_MAX_DEPTH} messages')
+    message = {
+        'primary_ip': primary_ip,
+        'hostname': hostname,
+        'batch': batch,
+        'samples': {kind: entries for kind, entries in samples.items() if entries},
+    }
+    rows = sum(len(entries) for entries in message['samples'].values())
+    redis.xadd(settings.INGEST_QUEUE_STREAM, {
+        'payload': json.dumps(message, cls=DjangoJSONEncoder),
+        'rows': rows,
+    })
+    return rows
+
+
+def queue_submission(primary_ip, hostname, samples, batch, received, timer):
+    """Enqueue validated samples and answer 202 Accepted, or 503 when the queue is full"""
+    try:
+        queued = enqueue_samples(primary_ip, hostname, samples, batch)
+    except QueueFull as e:
+        return Response({
+            'status': 'error',
+            'message': f'Ingest queue is full: {e}'
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    return Response({
+        'status': 'accepted',
+        'message': f'Queued {queued} usage records',
+        'received': received,
+        'queued': queued,
+        'elapsed_ms': timer.elapsed_ms,
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+def get_queue_metrics():
+    """Depth of the ingest stream and progress of its writers"""
+    redis = get_redis()
+    stream = settings.INGEST_QUEUE_STREAM
+    metrics = {'stream': stream, 'depth': redis.xlen(stream), 'pending': 0, 'lag': None, 'writers': 0}
+    groups = redis.xinfo_groups(stream) if redis.exists(stream) else []
+    for group in groups:
+        if group['name'] in (WRITER_GROUP, WRITER_GROUP.encode()):
+            metrics.update(pending=group['pending'], lag=group.get('lag'), writers=group['consumers'])
+    return metrics
+
+
+class IngestWriter:
+    """Drain the ingest stream into TimescaleDB in large COPY batches
+
+    Messages are read through a consumer group and accumulated until
+    ``batch_rows`` samples are waiting or ``flush_ms`` milliseconds went by
+    since the first one. A batch is written in a single transaction, with
+    the exactly-once claims of its payloads, then acknowledged and deleted
+    from the stream. Messages of a writer that died are claimed by the
+    others once they have been pending for ``claim_idle_ms``. Every
+    PRUNE_INTERVAL seconds, the batch markers past their retention are
+    deleted.
+    """
+
+    def __init__(self, consumer, batch_rows=None, flush_ms=None, claim_idle_ms=60000, log=print):
+        self.consumer = consumer
+        self.log = log
+        self.batch_rows = batch_rows or settings.INGEST_WRITER_BATCH_ROWS
+        self.flush_ms = flush_ms or settings.INGEST_WRITER_FLUSH_MS
+        self.claim_idle_ms = claim_idle_ms
+        self.stream = settings.INGEST_QUEUE_STREAM
+        self.redis = get_redis()
+        self._nodes = {}
+        self._pruned_at = None
+
+    def run(self):
+        self._create_group()
+        # messages this consumer read but didn't acknowledge before a restart
+        backlog = self._read('0', count=1000, block=None)
+        while True:
+            messages = backlog or self._next_batch()
+            backlog = []
+            if messages:
+                self._flush(messages)
+            self._prune()
+
+    def _create_group(self):
+        try:
+            self.redis.xgroup_create(self.stream, WRITER_GROUP, id='0', mkstream=True)
+        except Exception as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def _read(self, last_id, count, block):
+        response = self.redis.xreadgroup(
+            WRITER_GROUP, self.consumer, {self.stream: last_id}, count=count, block=block
+        )
+        return [(message_id, fields) for _, messages in response or [] for message_id, fields in messages if fields]
+
+    def _next_batch(self):
+        claimed = self.redis.xautoclaim(
+            self.stream, WRITER_GROUP, self.consumer, self.claim_idle_ms, start_id='0-0', count=1000
+        )[1]
+        messages = [(message_id, fields) for message_id, fields in claimed if fields]
+        rows = sum(_rows(fields) for _, fields in messages)
+        deadline = time.monotonic() + self.flush_ms / 1000
+        while rows < self.batch_rows:
+            remaining_ms = int((deadline - time.monotonic()) * 1000)
+            if remaining_ms <= 0:
+                break
+            read = self._read('>', count=1000, block=remaining_ms)
+            messages += read
+            rows += sum(_rows(fields) for _, fields in read)
+        return messages
+
+    def _flush(self, messages):
+        started = time.perf_counter()
+        one_by_one = False
+        while True:
+            try:
+                if one_by_one:
+                    inserted = self._write_one_by_one(messages)
+                else:
+                    inserted = self._write([_decode(fields) for _, fields in messages])
+                break
+            except (OperationalError, InterfaceError):
+                # the database is unavailable, keep the batch and try again; messages
+                # written one by one before the outage are skipped as already stored
+                self.log(f'Database unavailable, retrying the batch of {len(messages)} messages:\n{traceback.format_exc()}')
+                self._forget()
+                close_old_connections()
+                connection.close()
+                time.sleep(5)
+            except (DatabaseError, KeyError, TypeError, ValueError):
+                self.log(f'Cannot write a batch of {len(messages)} messages, writing them one by one:\n{traceback.format_exc()}')
+                self._forget()
+                one_by_one = True
+
+        ids = [message_id for message_id, _ in messages]
+        self.redis.xack(self.stream, WRITER_GROUP, *ids)
+        self.redis.xdel(self.stream, *ids)
+        elapsed = time.perf_counter() - started
+        self.log(
+            f'Wrote {inserted} rows from {len(messages)} messages in {elapsed * 1000:.0f} ms '
+            f'({inserted / elapsed if elapsed else 0:.0f} rows/s), queue depth {self.redis.xlen(self.stream)}'
+        )
+
+    def _prune(self):
+        if self._pruned_at is not None and time.monotonic() - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = time.monotonic()
+        try:
+            deleted = prune_submitted_batches()
+        except DatabaseError:
+            self.log(f'Cannot prune the batch markers:\n{traceback.format_exc()}')
+            return
+        if deleted:
+            self.log(f'Pruned {deleted} batch markers older than {settings.INGEST_BATCH_RETENTION_DAYS} days')
+
+    def _write_one_by_one(self, messages):
+        inserted = 0
+        for message_id, fields in messages:
+            try:
+                inserted += self._write([_decode(fields)])
+            except (OperationalError, InterfaceError):
+                raise
+            except (DatabaseError, KeyError, TypeError, ValueError):
+                # a message that can never be written would block the queue
+                self.log(f'Dropping ingest message {message_id}: {fields}\n{traceback.format_exc()}')
+                self._forget()
+        return inserted
+
+    def _forget(self):
+        """Drop the cached rows a rolled back transaction may have created"""
+        for node in self._nodes.values():
+            forget_node_gpus(node.pk)
+        self._nodes.clear()
+        forget_lookups()
+
+    def _write(self, payloads):
+        with transaction.atomic():
+            for payload in payloads:
+                payload['node'] = self._node(payload['primary_ip'], payload['hostname'])
+            payloads = self._claim(payloads)
+
+            # as with ON CONFLICT DO NOTHING, the first payload wins when
+            # several carry the same sample
+            gpu_usage = {}
+            cpu_rows = {}
+            for payload in payloads:
+                node, samples = payload['node'], payload['samples']
+                if samples.get('gpu'):
+                    gpu_pks = resolve_gpus(node, samples['gpu'])
+                    for key, usage in merge_gpu_usage(node, gpu_pks, samples['gpu']).items():
+                        gpu_usage.setdefault(key, usage)
+                for row in cpu_usage_rows(node.pk, latest_cpu_samples(samples.get('cpu', []))):
+                    # keyed by (node, time)
+                    cpu_rows.setdefault(row[:2], row)
+
+            inserted = 0
+            if gpu_usage:
+                inserted += copy_insert_ignoring_conflicts(
+                    GPUUsage, GPU_USAGE_COLUMNS, gpu_usage_rows(gpu_usage)
+                )
+            if cpu_rows:
+                inserted += copy_insert_ignoring_conflicts(CPUUsage, CPU_USAGE_COLUMNS, cpu_rows.values())
+        return inserted
+
+    def _node(self, primary_ip, hostname):
+        node = self._nodes.get(primary_ip)
+        if node is None:
+            node, _ = Node.objects.get_or_create(ip_address=primary_ip, defaults={'hostname': hostname})
+            self._nodes[primary_ip] = node
+        return node
+
+    def _claim(self, payloads):
+        """Payloads not ingested before, claiming them in the current transaction"""
+        batched = {}
+        unbatched = []
+        for payload in payloads:
+            if payload.get('batch'):
+                batched.setdefault(tuple(payload['batch']), payload)
+            else:
+                unbatched.append(payload)
+        if not batched:
+            return unbatched
+
+        with connection.cursor() as cursor:
+            claimed = execute_values(
+                cursor.cursor,
+                f"INSERT INTO {SubmittedBatch._meta.db_table} (client_id, seq, node_id, first_sample, received_at) "
+                f"VALUES %s ON CONFLICT (client_id, seq) DO NOTHING RETURNING client_id, seq",
+                [
+                    (client_id, seq, payload['node'].pk, earliest_sample(payload['samples']))
+                    for (client_id, seq), payload in batched.items()
+                ],
+                template='(%s, %s, %s, %s, now())',
+                fetch=True,
+            )
+        return unbatched + [batched[(client_id, seq)] for client_id, seq in claimed]
+
+
+def _rows(fields):
+    return int(fields.get(b'rows') or fields.get('rows') or 0)
+
+
+def _decode(fields):
+    payload = json.loads(fields.get(b'payload') or fields['payload'])
+    for entries in payload['samples'].values():
+        for entry in entries:
+            entry['timestamp'] = parse_datetime(entry['timestamp'])
+    return payload
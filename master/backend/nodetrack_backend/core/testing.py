@@ -0,0 +1,67 @@
+import re
+from django.db import connection, transaction
+
+
+class QueryPlanTestMixin:
+    """EXPLAIN helpers for tests of the query plans on a hypertable and its rollups
+
+    Test cases set ``HYPERTABLE`` and the continuous aggregates built on it
+    in ``ROLLUP_VIEWS``, and call refresh_rollups once their rows are
+    inserted, so that the rollups are materialized as they are in
+    production and only their most recent buckets are computed from the
+    raw rows. TimescaleDB can't refresh a continuous aggregate inside a
+    transaction, hence TransactionTestCase.
+    """
+
+    HYPERTABLE = None
+    ROLLUP_VIEWS = ()
+    # days of samples inserted, one 1 day chunk per day
+    DAYS = 10
+
+    def refresh_rollups(self):
+        with connection.cursor() as cursor:
+            for view in self.ROLLUP_VIEWS:
+                cursor.execute(f"CALL refresh_continuous_aggregate('{view}', NULL, NULL)")
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        return self.explain_sql(sql, params)
+
+    def explain_sql(self, sql, params):
+        with transaction.atomic(), connection.cursor() as cursor:
+            # the tables are tiny, make the planner show the plan it'd pick on real data
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def chunks(self, plan, tables):
+        """Chunks of the hypertables ``tables`` read by ``plan``"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT id FROM _timescaledb_catalog.hypertable WHERE table_name = ANY(%s)", [list(tables)]
+            )
+            ids = '|'.join(str(hypertable_id) for hypertable_id, in cursor.fetchall())
+        return set(re.findall(rf'\b_hyper_(?:{ids})_\d+_chunk\b', plan))
+
+    def materialized_chunks(self, plan):
+        """Chunks of the hypertables materializing ROLLUP_VIEWS read by ``plan``"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT materialization_hypertable_name FROM timescaledb_information.continuous_aggregates "
+                "WHERE view_name = ANY(%s)",
+                [list(self.ROLLUP_VIEWS)],
+            )
+            tables = [table for table, in cursor.fetchall()]
+        return self.chunks(plan, tables)
+
+    def assertRangeScan(self, plan, index=None):
+        """``plan`` reads only the raw chunks of the queried range, through ``index``"""
+        self.assertLess(len(self.chunks(plan, [self.HYPERTABLE])), self.DAYS, plan)
+        if index:
+            self.assertIn(index, plan)
+
+    def assertReadsRollups(self, plan):
+        """``plan`` reads materialized rollups, and raw rows only for the buckets not materialized yet"""
+        self.assertTrue(self.materialized_chunks(plan), plan)
+        # the bucket in progress, and the one before when it ends past midnight
+        self.assertLessEqual(len(self.chunks(plan, [self.HYPERTABLE])), 2, plan)
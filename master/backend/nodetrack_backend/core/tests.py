@@ -1,3 +1,235 @@
-from django.test import TestCase
+import gzip
+import importlib
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+from django.conf import settings
+from django.db import DataError, OperationalError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from core.ingest import claim_batch, read_json_body, unpack_batch, zstandard
+from core.models import Node, SubmittedBatch
+from core.queue import IngestWriter
+from cpu_monitor.ingest import validate_cpu_entries
+from gpu_monitor.ingest import validate_gpu_entries
 
-# Create your tests here.
+# the node client, packing the batches of /ingest
+CLIENT_DIR = settings.BASE_DIR.parents[2] / 'client'
+
+
+def client_batch_module():
+    """The client's batch module, None when the client isn't checked out next to the master"""
+    if not (CLIENT_DIR / 'batch.py').exists():
+        return None
+    sys.path.insert(0, str(CLIENT_DIR))
+    os.environ.setdefault('SERVER_ADDRESS', 'localhost')  # nothing is sent
+    try:
+        return importlib.import_module('batch')
+    except ImportError:
+        return None
+    finally:
+        sys.path.remove(str(CLIENT_DIR))
+
+
+class BatchRoundTripTests(SimpleTestCase):
+    """Batches packed by the client unpack into the entries the submit endpoints validate"""
+
+    TIMESTAMP = '2024-05-01 12:00:00'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.batch = client_batch_module()
+        if cls.batch is None:
+            raise unittest.SkipTest('the client is not importable')
+
+    def gpu_entry(self, gpu_id, username=None, memory_used=0, command=None, status='idle'):
+        return {
+            'timestamp': self.TIMESTAMP, 'hostname': 'node1', 'ip_address': '10.0.0.1',
+            'gpu_id': gpu_id, 'gpu_name': 'A100', 'username': username, 'memory_used': memory_used,
+            'memory_total': 40960, 'command': command, 'status': status, 'inventory_version': 'v1',
+        }
+
+    def cpu_entry(self):
+        return {
+            'timestamp': self.TIMESTAMP, 'hostname': 'node1', 'ip_address': '10.0.0.1',
+            'cpu_usage_percent': 12.5, 'cpu_cores_logical': 64, 'cpu_cores_physical': 32,
+            'cpu_frequency_mhz': 2400.0, 'inventory_version': 'v1',
+        }
+
+    def test_round_trip(self):
+        gpu_entries = [self.gpu_entry(0, 'alice', 1024, 'python train.py', 'active'), self.gpu_entry(1)]
+        cpu_entries = [self.cpu_entry()]
+        payload = json.loads(json.dumps(self.batch.pack(gpu_entries, cpu_entries)))
+
+        gpu_unpacked, cpu_unpacked = unpack_batch(payload)
+        gpu_valid = validate_gpu_entries(gpu_unpacked)
+        cpu_valid = validate_cpu_entries(cpu_unpacked)
+        self.assertEqual(len(gpu_valid), 2)
+        self.assertEqual(len(cpu_valid), 1)
+        for entry, valid in zip(gpu_entries, gpu_valid):
+            self.assertEqual(valid['gpu_id'], str(entry['gpu_id']))
+            for field in ('hostname', 'ip_address', 'gpu_name', 'memory_used', 'memory_total',
+                          'username', 'command', 'inventory_version'):
+                self.assertEqual(valid[field], entry[field], field)
+        for field in ('cpu_usage_percent', 'cpu_cores_logical', 'cpu_cores_physical', 'cpu_frequency_mhz'):
+            self.assertEqual(cpu_valid[0][field], cpu_entries[0][field], field)
+
+    def test_single_kind(self):
+        payload = json.loads(json.dumps(self.batch.pack([], [self.cpu_entry()])))
+        gpu_entries, cpu_entries = unpack_batch(payload)
+        self.assertEqual(gpu_entries, [])
+        self.assertEqual(len(validate_cpu_entries(cpu_entries)), 1)
+
+
+class UnpackBatchTests(SimpleTestCase):
+    """Batches that aren't shaped like the client's are a ParseError, not a server error"""
+
+    HOST = {'hostname': 'node1', 'ip_address': '10.0.0.1'}
+
+    def test_malformed(self):
+        for payload in (
+            {},
+            {'host': 'node1'},
+            {'host': {'hostname': 'node1'}},
+            {'host': dict(self.HOST, gpus=[5])},
+            {'host': self.HOST, 'gpu': ['timestamp']},
+            {'host': self.HOST, 'gpu': {'rows': [[1]]}},
+            {'host': self.HOST, 'gpu': {'columns': ['gpu_id'], 'rows': [5]}},
+            {'host': self.HOST, 'cpu': {'columns': 5, 'rows': [[1]]}},
+            {'host': self.HOST, 'cpu': {'columns': [['timestamp']], 'rows': [[1]]}},
+        ):
+            with self.subTest(payload=payload), self.assertRaises(ParseError):
+                unpack_batch(payload)
+
+
+@override_settings(INGEST_MAX_BYTES=1024)
+class ReadJSONBodyTests(SimpleTestCase):
+    """Compressed bodies are capped once decompressed, and a broken one is a ParseError"""
+
+    def request(self, body, encoding):
+        return RequestFactory().post(
+            '/ingest', data=body, content_type='application/json', headers={'Content-Encoding': encoding}
+        )
+
+    def body(self, size):
+        return json.dumps(['x' * size]).encode()
+
+    def test_gzip(self):
+        self.assertEqual(read_json_body(self.request(gzip.compress(self.body(100)), 'gzip')), ['x' * 100])
+
+    def test_gzip_oversized(self):
+        with self.assertRaises(ParseError):
+            read_json_body(self.request(gzip.compress(self.body(2048)), 'gzip'))
+
+    def test_gzip_invalid(self):
+        for body in (b'not gzip', gzip.compress(self.body(100))[:-20]):
+            with self.subTest(body=body), self.assertRaises(ParseError):
+                read_json_body(self.request(body, 'gzip'))
+
+    @unittest.skipIf(zstandard is None, "zstandard isn't installed")
+    def test_zstd(self):
+        body = zstandard.ZstdCompressor().compress(self.body(100))
+        self.assertEqual(read_json_body(self.request(body, 'zstd')), ['x' * 100])
+
+    @unittest.skipIf(zstandard is None, "zstandard isn't installed")
+    def test_zstd_oversized(self):
+        with self.assertRaises(ParseError):
+            read_json_body(self.request(zstandard.ZstdCompressor().compress(self.body(2048)), 'zstd'))
+
+    @unittest.skipIf(zstandard is None, "zstandard isn't installed")
+    def test_zstd_invalid(self):
+        for body in (b'not zstd', zstandard.ZstdCompressor().compress(self.body(100))[:-20]):
+            with self.subTest(body=body), self.assertRaises(ParseError):
+                read_json_body(self.request(body, 'zstd'))
+
+    def test_invalid_json(self):
+        with self.assertRaises(ParseError):
+            read_json_body(self.request(b'{"host": ', 'identity'))
+
+
+class ClaimBatchTests(TestCase):
+    """A payload is claimed once per ``(client, seq)``, whichever node sends it again"""
+
+    def setUp(self):
+        self.node = Node.objects.create(ip_address='10.0.0.1', hostname='node1')
+
+    def test_claim_once(self):
+        with transaction.atomic():
+            self.assertTrue(claim_batch(self.node, 'client', 1))
+        with transaction.atomic():
+            self.assertFalse(claim_batch(self.node, 'client', 1))
+        self.assertEqual(SubmittedBatch.objects.count(), 1)
+
+    def test_other_seq_or_client(self):
+        with transaction.atomic():
+            self.assertTrue(claim_batch(self.node, 'client', 1))
+            self.assertTrue(claim_batch(self.node, 'client', 2))
+            self.assertTrue(claim_batch(self.node, 'other', 1))
+        self.assertEqual(SubmittedBatch.objects.count(), 3)
+
+
+class IngestWriterFlushTests(SimpleTestCase):
+    """A batch the writer can't store is retried while the database is down, never dropped"""
+
+    MESSAGES = [(b'1-0', {b'rows': b'1'}), (b'2-0', {b'rows': b'1'})]
+
+    def setUp(self):
+        with mock.patch('core.queue.get_redis'):
+            self.writer = IngestWriter('test', log=lambda message: None)
+        for target in ('core.queue.connection', 'core.queue.close_old_connections', 'core.queue.time.sleep'):
+            patcher = mock.patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('core.queue._decode', side_effect=lambda fields: fields)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def flush(self, *outcomes):
+        """Flush MESSAGES, ``_write`` raising or returning each of ``outcomes`` in turn"""
+        self.writer._write = mock.Mock(side_effect=outcomes)
+        self.writer._flush(self.MESSAGES)
+        self.writer.redis.xack.assert_called_once_with(self.writer.stream, 'writers', b'1-0', b'2-0')
+        return [len(call.args[0]) for call in self.writer._write.call_args_list]
+
+    def test_outage(self):
+        self.assertEqual(self.flush(OperationalError(), 2), [2, 2])
+
+    def test_one_by_one(self):
+        # the first message can never be written, the second one still is
+        self.assertEqual(self.flush(DataError(), DataError(), 1), [2, 1, 1])
+
+    def test_outage_one_by_one(self):
+        self.assertEqual(self.flush(DataError(), 1, OperationalError(), 0, 1), [2, 1, 1, 1, 1])
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'INSERT ... ON CONFLICT of the ingest writer')
+class IngestWriterClaimTests(TestCase):
+    """The ingest writer claims each ``(client, seq)`` once, within a batch and across batches"""
+
+    def setUp(self):
+        self.node = Node.objects.create(ip_address='10.0.0.1', hostname='node1')
+        with mock.patch('core.queue.get_redis'):
+            self.writer = IngestWriter('test')
+
+    def payload(self, batch):
+        samples = {'cpu': [{'timestamp': timezone.now()}]}
+        return {'node': self.node, 'samples': samples, 'batch': batch}
+
+    def test_claim_once(self):
+        with transaction.atomic():
+            claimed = self.writer._claim([self.payload(['client', 1]), self.payload(['client', 1])])
+        self.assertEqual(len(claimed), 1)
+        with transaction.atomic():
+            claimed = self.writer._claim([self.payload(['client', 1]), self.payload(['client', 2])])
+        self.assertEqual([payload['batch'] for payload in claimed], [['client', 2]])
+        self.assertEqual(SubmittedBatch.objects.count(), 2)
+
+    def test_unbatched(self):
+        with transaction.atomic():
+            claimed = self.writer._claim([self.payload(None), self.payload(None)])
+        self.assertEqual(len(claimed), 2)
+        self.assertFalse(SubmittedBatch.objects.exists())
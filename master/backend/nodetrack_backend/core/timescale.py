@@ -0,0 +1,182 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection as default_connection
+
+# hypertable -> (segmentby, orderby) of its compressed chunks. Columns of the
+# unique sample constraints have to be segmenting or ordering columns.
+# Migrations pass the settings of their own schema instead, these are the
+# ones of the current models.
+COMPRESSED_HYPERTABLES = {
+    'gpu_monitor_gpuusage': ('node_id, gpu_id', 'time DESC, user_id'),
+    'cpu_monitor_cpuusage': ('node_id', 'time DESC'),
+}
+
+# rollup tier -> continuous aggregates, see migrations 0003 of gpu_monitor and cpu_monitor
+ROLLUP_TIERS = {
+    'hourly': ('gpu_monitor_gpuusage_hourly', 'gpu_monitor_nodeusage_hourly', 'cpu_monitor_cpuusage_hourly'),
+    'daily': ('gpu_monitor_gpuusage_daily', 'gpu_monitor_nodeusage_daily', 'cpu_monitor_cpuusage_daily'),
+}
+
+# start_offset of the refresh policies when TIMESCALE_<TIER>_REFRESH_DAYS is 0,
+# shortened to end before the retention drops rows, see refresh_window_days
+REFRESH_WINDOW_DAYS = {'hourly': 30, 'daily': 90}
+# shortest window of each tier, two buckets before the end_offset of its policies
+MIN_REFRESH_WINDOW_DAYS = {'hourly': 1, 'daily': 3}
+# end_offset and schedule_interval of the refresh policies, see migrations 0003
+REFRESH_POLICIES = {'hourly': ('1 hour', '30 minutes'), 'daily': ('1 day', '1 hour')}
+
+
+def retention_days():
+    """Days each tier is kept for, 0 keeps it forever"""
+    return {
+        'raw': settings.TIMESCALE_RAW_RETENTION_DAYS,
+        'hourly': settings.TIMESCALE_HOURLY_RETENTION_DAYS,
+        'daily': settings.TIMESCALE_DAILY_RETENTION_DAYS,
+    }
+
+
+def refresh_window_days():
+    """Days back the refresh policies of each rollup tier recompute
+
+    Raw rows dropped within the window would be dropped from the rollups
+    built on them at the next refresh, and rollup rows dropped within it
+    computed again, so the window has to end before both retentions.
+    """
+    days = retention_days()
+    windows = {}
+    for tier, default in REFRESH_WINDOW_DAYS.items():
+        limit = min((retention - 1 for retention in (days['raw'], days[tier]) if retention), default=None)
+        window = getattr(settings, f'TIMESCALE_{tier.upper()}_REFRESH_DAYS')
+        if not window:
+            window = default if limit is None else min(default, limit)
+        if window < MIN_REFRESH_WINDOW_DAYS[tier]:
+            raise ImproperlyConfigured(
+                f"The {tier} rollups refresh at least {MIN_REFRESH_WINDOW_DAYS[tier]} days, "
+                f"TIMESCALE_RAW_RETENTION_DAYS and TIMESCALE_{tier.upper()}_RETENTION_DAYS must exceed them"
+            )
+        if limit is not None and window > limit:
+            raise ImproperlyConfigured(
+                f"TIMESCALE_{tier.upper()}_REFRESH_DAYS must be shorter than TIMESCALE_RAW_RETENTION_DAYS "
+                f"and TIMESCALE_{tier.upper()}_RETENTION_DAYS"
+            )
+        windows[tier] = window
+    return windows
+
+
+def compression_enabled(cursor, table):
+    cursor.execute(
+        "SELECT compression_enabled FROM timescaledb_information.hypertables WHERE hypertable_name = %s",
+        [table],
+    )
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def set_compression(cursor, table, segmentby, orderby):
+    """Enable compression of ``table``, segmented by ``segmentby`` and ordered by ``orderby``"""
+    cursor.execute(
+        f"ALTER TABLE {table} SET (timescaledb.compress, "
+        f"timescaledb.compress_segmentby = '{segmentby}', timescaledb.compress_orderby = '{orderby}')"
+    )
+
+
+def update_compression_settings(connection, table, segmentby, orderby, log=print):
+    """Change the segmentby and orderby of ``table`` when none of its chunks is compressed yet"""
+    with connection.cursor() as cursor:
+        if not compression_enabled(cursor, table):
+            return
+        cursor.execute(
+            "SELECT count(*) FROM timescaledb_information.chunks WHERE hypertable_name = %s AND is_compressed",
+            [table],
+        )
+        if cursor.fetchone()[0]:
+            log(f"{table} has compressed chunks, decompress them to segment by {segmentby}")
+            return
+        set_compression(cursor, table, segmentby, orderby)
+
+
+def disable_compression(connection, table):
+    """Decompress every chunk of ``table`` and turn its compression off, so its columns can change
+
+    apply_policies enables it again.
+    """
+    with connection.cursor() as cursor:
+        if not compression_enabled(cursor, table):
+            return
+        cursor.execute(f"SELECT remove_compression_policy('{table}', if_exists => true)")
+        cursor.execute(f"SELECT decompress_chunk(c, if_compressed => true) FROM show_chunks('{table}') c")
+        cursor.execute(f"ALTER TABLE {table} SET (timescaledb.compress = false)")
+
+
+def apply_policies(connection=default_connection, log=print, hypertables=COMPRESSED_HYPERTABLES):
+    """Create or update the compression, rollup refresh and retention policies from the settings
+
+    Policies are replaced rather than added, so this can run again whenever
+    the settings change. ``hypertables`` maps every hypertable to the
+    segmentby and orderby it's compressed with, when it isn't yet.
+    """
+    days = retention_days()
+    windows = refresh_window_days()
+    compress_after = settings.TIMESCALE_COMPRESS_AFTER_DAYS
+    with connection.cursor() as cursor:
+        for table, (segmentby, orderby) in hypertables.items():
+            cursor.execute(f"SELECT remove_compression_policy('{table}', if_exists => true)")
+            if compress_after:
+                if not compression_enabled(cursor, table):
+                    # the settings can't change anymore once chunks are compressed
+                    set_compression(cursor, table, segmentby, orderby)
+                cursor.execute(f"SELECT add_compression_policy('{table}', INTERVAL '{compress_after} days')")
+                log(f"{table}: chunks compressed after {compress_after} days")
+
+        for tier, views in ROLLUP_TIERS.items():
+            end_offset, schedule = REFRESH_POLICIES[tier]
+            for view in views:
+                cursor.execute(f"SELECT remove_continuous_aggregate_policy('{view}', if_exists => true)")
+                cursor.execute(
+                    f"SELECT add_continuous_aggregate_policy('{view}', "
+                    f"start_offset => INTERVAL '{windows[tier]} days', end_offset => INTERVAL '{end_offset}', "
+                    f"schedule_interval => INTERVAL '{schedule}')"
+                )
+                log(f"{view}: last {windows[tier]} days refreshed every {schedule}")
+
+        tiers = [('raw', table) for table in hypertables]
+        tiers += [(tier, view) for tier, views in ROLLUP_TIERS.items() for view in views]
+        for tier, relation in tiers:
+            cursor.execute(f"SELECT remove_retention_policy('{relation}', if_exists => true)")
+            if days[tier]:
+                cursor.execute(f"SELECT add_retention_policy('{relation}', INTERVAL '{days[tier]} days')")
+                log(f"{relation}: {tier} rows dropped after {days[tier]} days")
+
+
+def remove_policies(connection=default_connection):
+    with connection.cursor() as cursor:
+        relations = list(COMPRESSED_HYPERTABLES) + [view for views in ROLLUP_TIERS.values() for view in views]
+        for relation in relations:
+            cursor.execute(f"SELECT remove_retention_policy('{relation}', if_exists => true)")
+        for table in COMPRESSED_HYPERTABLES:
+            cursor.execute(f"SELECT remove_compression_policy('{table}', if_exists => true)")
+
+
+def compression_report(connection=default_connection):
+    """Chunks compressed so far and the size they had before and after, per hypertable"""
+    report = []
+    with connection.cursor() as cursor:
+        for table in COMPRESSED_HYPERTABLES:
+            cursor.execute(
+                "SELECT total_chunks, number_compressed_chunks, "
+                "before_compression_total_bytes, after_compression_total_bytes "
+                "FROM hypertable_compression_stats(%s)",
+                [table],
+            )
+            total_chunks, compressed_chunks, before, after = cursor.fetchone()
+            cursor.execute("SELECT hypertable_size(%s)", [table])
+            report.append({
+                'hypertable': table,
+                'chunks': total_chunks or 0,
+                'compressed_chunks': compressed_chunks or 0,
+                'before_bytes': before or 0,
+                'after_bytes': after or 0,
+                'ratio': round(before / after, 2) if before and after else None,
+                'total_bytes': cursor.fetchone()[0],
+            })
+    return report
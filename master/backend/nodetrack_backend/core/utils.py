@@ -1,20 +1,93 @@
+import os
+import time
+import threading
 import yaml
 from pathlib import Path
 from django.conf import settings
 
+
+class ClusterNodesResolver:
+    """Resolve client IPs to the primary IP of their node.
+
+    cluster_nodes.yaml is parsed once into a dict mapping every primary and
+    secondary IP to its primary IP, and parsed again only when the file's
+    mtime changes. The mtime itself is checked at most every
+    ``check_interval`` seconds, so lookups are plain dict hits. Optionally,
+    IPs missing from the file are accepted when they belong to a known Node.
+    """
+
+    def __init__(self, config_path, fallback_to_nodes=False, check_interval=5):
+        self.config_path = Path(config_path)
+        self.fallback_to_nodes = fallback_to_nodes
+        self.check_interval = check_interval
+        self._index = {}
+        self._node_ips = set()
+        self._mtime = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def resolve(self, client_ip):
+        client_ip = str(client_ip)
+        self._refresh()
+        primary_ip = self._index.get(client_ip)
+        if primary_ip is None and client_ip in self._node_ips:
+            return client_ip
+        return primary_ip
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return
+            self._reload_config()
+            if self.fallback_to_nodes:
+                self._reload_node_ips()
+            self._checked_at = now
+
+    def _reload_config(self):
+        try:
+            mtime = os.stat(self.config_path).st_mtime_ns
+        except FileNotFoundError:
+            self._index, self._mtime = {}, None
+            return
+        if mtime == self._mtime:
+            return
+
+        with open(self.config_path, 'r') as file:
+            config = yaml.safe_load(file) or {}
+
+        index = {}
+        for node in config.get('nodes', []):
+            primary_ip = node.get('primary_ip')
+            if not primary_ip:
+                continue
+            primary_ip = str(primary_ip)
+            for secondary_ip in node.get('secondary_ips') or []:
+                index.setdefault(str(secondary_ip), primary_ip)
+            # a primary IP always resolves to itself
+            index[primary_ip] = primary_ip
+        self._index, self._mtime = index, mtime
+
+    def _reload_node_ips(self):
+        # Import here to avoid circular imports
+        from core.models import Node
+        self._node_ips = set(Node.objects.values_list('ip_address', flat=True))
+
+
+_resolver = None
+
+
+def get_resolver():
+    global _resolver
+    if _resolver is None:
+        _resolver = ClusterNodesResolver(
+            Path(settings.BASE_DIR) / 'cluster_nodes.yaml',
+            fallback_to_nodes=settings.CLUSTER_NODES_FALLBACK_TO_DB,
+        )
+    return _resolver
+
+
 def get_primary_ip(client_ip):
-    client_ip = str(client_ip)
-    config_path = Path(settings.BASE_DIR) / 'cluster_nodes.yaml'
-    try:
-        with open(config_path, 'r') as file:
-            config = yaml.safe_load(file)
-    except FileNotFoundError:
-        return None
-    
-    for node in config.get('nodes', []):
-        primary_ip = node.get('primary_ip')
-        secondary_ips = node.get('secondary_ips', [])
-        # Check if it's the primary IP or one of the secondary IPs
-        if client_ip == primary_ip or client_ip in secondary_ips:
-            return primary_ip
-    return None
\ No newline at end of file
+    return get_resolver().resolve(client_ip)
@@ -1,11 +1,220 @@
+import traceback
+from django.conf import settings
+from django.db import InterfaceError, OperationalError
 from django.db.models import Count
+from django.http import Http404
+from ipware.ip import get_client_ip
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ParseError
 from django.views.decorators.cache import cache_page
 from django.views.decorators.vary import vary_on_headers
+from core.ingest import IngestTimer, get_batch_id, ingest_submission, read_json_body, unpack_batch
+from core.queue import QueueFull, enqueue_samples, get_queue_metrics, queue_submission
 from core.models import Node
 from core.permissions import HasAPIToken
+from core.utils import get_primary_ip
+from cpu_monitor.ingest import validate_cpu_entries
+from gpu_monitor.ingest import validate_gpu_entries
+
+
+def _submit_samples(kind, validate):
+    """Samples of a /gpu/submit or /cpu/submit payload, a list of entries"""
+    def samples(data):
+        if not isinstance(data, list) or len(data) > settings.INGEST_MAX_ROWS:
+            return None
+        entries = validate(data)
+        if not entries:
+            return None
+        return entries[0]['hostname'], {kind: entries}
+    return samples
+
+
+def _batch_samples(payload):
+    """Samples of an /ingest batch, both GPU and CPU"""
+    if not isinstance(payload, dict):
+        return None
+    gpu_entries, cpu_entries = unpack_batch(payload)
+    if len(gpu_entries) + len(cpu_entries) > settings.INGEST_MAX_ROWS:
+        return None
+    return _validate_samples(gpu_entries, cpu_entries)
+
+
+def _validate_samples(gpu_entries, cpu_entries):
+    """Hostname and validated samples of unpacked batch entries"""
+    gpu_entries = validate_gpu_entries(gpu_entries)
+    cpu_entries = validate_cpu_entries(cpu_entries)
+    if not gpu_entries and not cpu_entries:
+        return None
+    hostname = (gpu_entries or cpu_entries)[0]['hostname']
+    return hostname, {'gpu': gpu_entries, 'cpu': cpu_entries}
+
+
+# endpoint a client payload was meant for -> function returning its
+# (hostname, samples) for ingest_submission, None when nothing is usable
+PAYLOAD_SAMPLES = {
+    '/gpu/submit': _submit_samples('gpu', validate_gpu_entries),
+    '/cpu/submit': _submit_samples('cpu', validate_cpu_entries),
+    '/ingest': _batch_samples,
+}
+
+
+@api_view(['POST'])
+def ingest_batch(request):
+    """Handle a compressed batch of GPU and CPU samples, see core.ingest.unpack_batch.
+
+    The body may be gzip or zstd compressed and cover several collection
+    intervals. Like the submit endpoints, a batch carrying client and
+    sequence headers is ingested at most once.
+    """
+    client_ip, is_routable = get_client_ip(request)
+    if not client_ip:
+        return Response({
+            'status': 'error',
+            'message': 'IP address not found in request'
+        })
+
+    # Validate IP and get primary IP mapping
+    primary_ip = get_primary_ip(client_ip)
+    if not primary_ip:
+        raise Http404("IP address is Not found/Not trusted")
+
+    timer = IngestTimer()
+    payload = read_json_body(request)
+    if not isinstance(payload, dict):
+        return Response({
+            'status': 'error',
+            'message': 'Expected a batch object'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    gpu_entries, cpu_entries = unpack_batch(payload)
+    received = len(gpu_entries) + len(cpu_entries)
+    if received > settings.INGEST_MAX_ROWS:
+        return Response({
+            'status': 'error',
+            'message': f'At most {settings.INGEST_MAX_ROWS} samples can be submitted per request'
+        }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    submission = _validate_samples(gpu_entries, cpu_entries)
+    if submission and settings.INGEST_QUEUE:
+        # the ingest writer stores them, see core.queue
+        return queue_submission(primary_ip, *submission, get_batch_id(request), received, timer)
+
+    created_count = 0
+    duplicate = False
+    if submission:
+        created_count = ingest_submission(primary_ip, *submission, get_batch_id(request))
+        # a batch replayed by the client after it was stored already
+        duplicate = created_count is None
+        created_count = created_count or 0
+
+    return Response({
+        'status': 'success',
+        'message': f'Created {created_count} usage records',
+        'received': received,
+        'created': created_count,
+        'duplicate': duplicate,
+        'elapsed_ms': timer.elapsed_ms,
+    })
+
+
+def _replay_record(primary_ip, record):
+    """Ingest, or queue, one spool record, returns its outcome and row count"""
+    samples = PAYLOAD_SAMPLES.get(record.get('endpoint')) if isinstance(record, dict) else None
+    try:
+        batch = (str(record['client']), int(record['seq']))
+        submission = samples(record.get('data')) if samples else None
+    except (TypeError, KeyError, ValueError, ParseError):
+        submission = None
+    if submission is None:
+        return 'skipped', 0
+
+    if settings.INGEST_QUEUE:
+        return 'queued', enqueue_samples(primary_ip, *submission, batch)
+    created = ingest_submission(primary_ip, *submission, batch)
+    if created is None:
+        return 'duplicate', 0
+    return 'created', created
+
+
+@api_view(['POST'])
+def replay_spool(request):
+    """Ingest a batch of payloads replayed from a client's spool.
+
+    The body is a JSON list, optionally gzip or zstd compressed, of spool
+    records ``{"client", "seq", "endpoint", "data"}``. Each record is
+    ingested, or queued for the ingest writer, on its own and at most once,
+    so a batch can safely be sent again after a failure.
+    """
+    client_ip, is_routable = get_client_ip(request)
+    if not client_ip:
+        return Response({
+            'status': 'error',
+            'message': 'IP address not found in request'
+        })
+
+    # Validate IP and get primary IP mapping
+    primary_ip = get_primary_ip(client_ip)
+    if not primary_ip:
+        raise Http404("IP address is Not found/Not trusted")
+
+    timer = IngestTimer()
+    records = read_json_body(request)
+    if not isinstance(records, list):
+        return Response({
+            'status': 'error',
+            'message': 'Expected a list of spool records'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    created_count = queued = duplicates = skipped = 0
+    for record in records:
+        try:
+            outcome, count = _replay_record(primary_ip, record)
+        except QueueFull as e:
+            # the client replays the whole batch later, queued records are claimed once
+            return Response({
+                'status': 'error',
+                'message': f'Ingest queue is full: {e}'
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except (OperationalError, InterfaceError) as e:
+            # not the record's fault, the client keeps its spool and replays it later
+            return Response({
+                'status': 'error',
+                'message': f'Database unavailable: {e}'
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except Exception:
+            # a record the database refuses must not keep the rest of the spool from being replayed
+            traceback.print_exc()
+            outcome, count = 'skipped', 0
+
+        if outcome == 'created':
+            created_count += count
+        elif outcome == 'queued':
+            queued += count
+        elif outcome == 'duplicate':
+            duplicates += 1
+        else:
+            skipped += 1
+
+    return Response({
+        'status': 'success',
+        'message': f'Replayed {len(records)} payloads',
+        'received': len(records),
+        'created': created_count,
+        'queued': queued,
+        'duplicates': duplicates,
+        'skipped': skipped,
+        'elapsed_ms': timer.elapsed_ms,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([HasAPIToken])
+def get_ingest_queue_metrics(request):
+    """Depth of the ingest queue and progress of the ingest writers"""
+    if not settings.INGEST_QUEUE:
+        return Response({'enabled': False})
+    return Response(dict(get_queue_metrics(), enabled=True))
 
 
 @api_view(['GET'])
@@ -47,7 +256,7 @@ def get_overview_stats(request):
         gpu_nodes = set(GPUUsage.objects.filter(
             time__gte=start_time,
             time__lte=end_time
-        ).values_list('gpu__node', flat=True).distinct())
+        ).values_list('node', flat=True).distinct())
 
         cpu_nodes = set(CPUUsage.objects.filter(
             time__gte=start_time,
@@ -61,7 +270,7 @@ def get_overview_stats(request):
         gpu_users = set(GPUUsage.objects.filter(
             time__gte=start_time,
             time__lte=end_time
-        ).values_list('username', flat=True).distinct())
+        ).values_list('user', flat=True).distinct())
 
         # CPU users commented out - no longer tracking per-user CPU data
         # cpu_users = set(CPUUsage.objects.filter(
@@ -0,0 +1,40 @@
+from django.db import transaction
+from core.copy import copy_insert_ignoring_conflicts
+from core.ingest import aware, validate_entries
+from cpu_monitor.models import CPUUsage
+from cpu_monitor.serializers import CPUUsageSubmitSerializer
+
+# columns of the rows built by cpu_usage_rows
+CPU_USAGE_COLUMNS = ['node_id', 'time', 'usage_percent', 'cores_logical', 'cores_physical', 'frequency_mhz']
+
+
+def validate_cpu_entries(bulk_data):
+    """Validate submitted CPU entries"""
+    return validate_entries(CPUUsageSubmitSerializer, bulk_data)
+
+
+def cpu_usage_rows(node_pk, samples):
+    """Rows of CPU_USAGE_COLUMNS of a node's samples, see latest_cpu_samples"""
+    return [
+        (node_pk, sample_time, entry['cpu_usage_percent'], entry['cpu_cores_logical'],
+         entry['cpu_cores_physical'], entry.get('cpu_frequency_mhz'))
+        for sample_time, entry in samples.items()
+    ]
+
+
+def latest_cpu_samples(entries):
+    """One entry per instant, the last submitted one wins within a payload"""
+    return {aware(entry['timestamp']): entry for entry in entries}
+
+
+def ingest_cpu_usage(node, entries):
+    """Store the validated CPU entries of a node in one transaction.
+
+    Samples already stored for the same instant are skipped, so retried
+    submissions write nothing. Returns the number of usage records inserted.
+    """
+    with transaction.atomic():
+        # ON CONFLICT DO NOTHING on (node, time)
+        return copy_insert_ignoring_conflicts(
+            CPUUsage, CPU_USAGE_COLUMNS, cpu_usage_rows(node.pk, latest_cpu_samples(entries))
+        )
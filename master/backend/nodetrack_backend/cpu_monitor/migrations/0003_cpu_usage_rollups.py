@@ -0,0 +1,102 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:42
+
+from django.conf import settings
+from django.db import migrations, models
+from core.timescale import refresh_window_days
+
+# Buckets follow settings.TIME_ZONE so they line up with Django's Trunc* functions
+ROLLUPS = (
+    # suffix, bucket width, refresh lag, refresh schedule; the refresh window
+    # follows the settings, see core.timescale.refresh_window_days
+    ('hourly', '1 hour', '1 hour', '30 minutes'),
+    ('daily', '1 day', '1 day', '1 hour'),
+)
+
+
+def create_rollups_sql():
+    statements = []
+    windows = refresh_window_days()
+    for suffix, width, end_offset, schedule in ROLLUPS:
+        # materialized_only = false keeps the not yet materialized tail readable from raw rows
+        statements += [
+            f"""
+            CREATE MATERIALIZED VIEW cpu_monitor_cpuusage_{suffix}
+            WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+            SELECT time_bucket(INTERVAL '{width}', time, '{settings.TIME_ZONE}') AS bucket,
+                   node_id,
+                   sum(usage_percent) AS usage_sum,
+                   max(usage_percent) AS usage_max,
+                   min(usage_percent) AS usage_min,
+                   count(*) AS sample_count,
+                   sum(frequency_mhz) AS frequency_sum,
+                   count(frequency_mhz) AS frequency_count,
+                   max(cores_logical) AS cores_logical,
+                   max(cores_physical) AS cores_physical
+            FROM cpu_monitor_cpuusage
+            GROUP BY 1, node_id
+            WITH DATA
+            """,
+            f"""
+            SELECT add_continuous_aggregate_policy('cpu_monitor_cpuusage_{suffix}',
+                start_offset => INTERVAL '{windows[suffix]} days',
+                end_offset => INTERVAL '{end_offset}',
+                schedule_interval => INTERVAL '{schedule}')
+            """,
+        ]
+    return statements
+
+
+def drop_rollups_sql():
+    return [f'DROP MATERIALIZED VIEW IF EXISTS cpu_monitor_cpuusage_{suffix}' for suffix, *_ in ROLLUPS]
+
+
+class Migration(migrations.Migration):
+
+    # continuous aggregates are materialized WITH DATA, which can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('cpu_monitor', '0002_remove_cpuusage_cpu_monitor_usernam_9d9701_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CPUUsageDaily',
+            fields=[
+                ('bucket', models.DateTimeField(primary_key=True, serialize=False)),
+                ('usage_sum', models.FloatField(help_text='Sum of CPU usage percentages over the bucket samples')),
+                ('usage_max', models.FloatField(help_text='Max CPU usage percentage')),
+                ('usage_min', models.FloatField(help_text='Min CPU usage percentage')),
+                ('sample_count', models.BigIntegerField(help_text='Number of usage records in the bucket')),
+                ('frequency_sum', models.FloatField(help_text='Sum of the reported CPU frequencies in MHz', null=True)),
+                ('frequency_count', models.BigIntegerField(help_text='Number of usage records reporting a frequency')),
+                ('cores_logical', models.IntegerField(help_text='Max number of logical CPU cores')),
+                ('cores_physical', models.IntegerField(help_text='Max number of physical CPU cores')),
+            ],
+            options={
+                'db_table': 'cpu_monitor_cpuusage_daily',
+                'abstract': False,
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='CPUUsageHourly',
+            fields=[
+                ('bucket', models.DateTimeField(primary_key=True, serialize=False)),
+                ('usage_sum', models.FloatField(help_text='Sum of CPU usage percentages over the bucket samples')),
+                ('usage_max', models.FloatField(help_text='Max CPU usage percentage')),
+                ('usage_min', models.FloatField(help_text='Min CPU usage percentage')),
+                ('sample_count', models.BigIntegerField(help_text='Number of usage records in the bucket')),
+                ('frequency_sum', models.FloatField(help_text='Sum of the reported CPU frequencies in MHz', null=True)),
+                ('frequency_count', models.BigIntegerField(help_text='Number of usage records reporting a frequency')),
+                ('cores_logical', models.IntegerField(help_text='Max number of logical CPU cores')),
+                ('cores_physical', models.IntegerField(help_text='Max number of physical CPU cores')),
+            ],
+            options={
+                'db_table': 'cpu_monitor_cpuusage_hourly',
+                'abstract': False,
+                'managed': False,
+            },
+        ),
+        migrations.RunSQL(create_rollups_sql(), drop_rollups_sql()),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:55
+
+from django.db import migrations, models
+
+# Rows sharing (node, time) are the same sample submitted twice, keep the last one
+DELETE_DUPLICATES_SQL = """
+    DELETE FROM cpu_monitor_cpuusage a
+    USING cpu_monitor_cpuusage b
+    WHERE a.node_id = b.node_id AND a.time = b.time AND a.id < b.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_submitted_batch'),
+        ('cpu_monitor', '0003_cpu_usage_rollups'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DELETE_DUPLICATES_SQL, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='cpuusage',
+            constraint=models.UniqueConstraint(fields=('node', 'time'), name='unique_cpu_usage_sample'),
+        ),
+    ]
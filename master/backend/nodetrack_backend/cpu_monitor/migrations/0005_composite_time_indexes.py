@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_timescale_policies'),
+        ('cpu_monitor', '0004_cpuusage_natural_key'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='cpuusage',
+            name='cpu_monitor_usage_p_3adc7c_idx',
+        ),
+        migrations.AddIndex(
+            model_name='cpuusage',
+            index=models.Index(fields=['node', '-time'], include=('usage_percent',), name='cpuusage_node_time_idx'),
+        ),
+    ]
@@ -27,10 +27,49 @@ class CPUUsage(TimescaleModel):
 
     class Meta:
         indexes = [
-            models.Index(fields=['usage_percent']),
+            # time range scans of one node, usage_percent included for index-only scans
+            models.Index(fields=['node', '-time'], include=['usage_percent'], name='cpuusage_node_time_idx'),
+        ]
+        constraints = [
+            # one sample per node and instant: retried submissions are no-ops
+            models.UniqueConstraint(fields=['node', 'time'], name='unique_cpu_usage_sample'),
         ]
         verbose_name = "CPU Usage Record"
         verbose_name_plural = "CPU Usage Records"
 
     def __str__(self):
         return f"{self.node.hostname} - {self.time} - {self.usage_percent}%"
+
+
+class CPUUsageRollup(models.Model):
+    """Read-only rollup of node CPU usage
+
+    Rows are materialized by TimescaleDB continuous aggregates created in
+    migration 0003. The views run in real-time mode, so buckets that are not
+    materialized yet are computed from the raw hypertable on the fly.
+    """
+    # the continuous aggregate has no id column, bucket stands in as the key Django requires
+    bucket = models.DateTimeField(primary_key=True)
+    node = models.ForeignKey(Node, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    usage_sum = models.FloatField(help_text="Sum of CPU usage percentages over the bucket samples")
+    usage_max = models.FloatField(help_text="Max CPU usage percentage")
+    usage_min = models.FloatField(help_text="Min CPU usage percentage")
+    sample_count = models.BigIntegerField(help_text="Number of usage records in the bucket")
+    frequency_sum = models.FloatField(null=True, help_text="Sum of the reported CPU frequencies in MHz")
+    frequency_count = models.BigIntegerField(help_text="Number of usage records reporting a frequency")
+    cores_logical = models.IntegerField(help_text="Max number of logical CPU cores")
+    cores_physical = models.IntegerField(help_text="Max number of physical CPU cores")
+
+    class Meta:
+        abstract = True
+        managed = False
+
+
+class CPUUsageHourly(CPUUsageRollup):
+    class Meta(CPUUsageRollup.Meta):
+        db_table = 'cpu_monitor_cpuusage_hourly'
+
+
+class CPUUsageDaily(CPUUsageRollup):
+    class Meta(CPUUsageRollup.Meta):
+        db_table = 'cpu_monitor_cpuusage_daily'
@@ -0,0 +1,104 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.db.models import Sum, Max, Min
+from core.models import Node
+from cpu_monitor.models import CPUUsage, CPUUsageHourly, CPUUsageDaily
+
+# period -> (rollup, rollup bucket width)
+ROLLUPS = {
+    'hour': (CPUUsageHourly, timedelta(hours=1)),
+    'day': (CPUUsageDaily, timedelta(days=1)),
+    'week': (CPUUsageDaily, timedelta(days=1)),
+    'month': (CPUUsageDaily, timedelta(days=1)),
+}
+
+# period -> time_bucket_gapfill bucket width
+GAPFILL_WIDTHS = {
+    'hour': '1 hour',
+    'day': '1 day',
+    'week': '1 week',
+    'month': '1 month'
+}
+
+
+def _buckets_in_range(period, start_time, end_time):
+    """Rows of the rollup matching ``period`` whose bucket overlaps [start_time, end_time]"""
+    model, width = ROLLUPS[period]
+    return model.objects.filter(bucket__gt=start_time - width, bucket__lte=end_time)
+
+
+def get_node_stats(period, start_time, end_time):
+    """Per-node CPU statistics, read from the rollup that matches ``period``"""
+    return _buckets_in_range(period, start_time, end_time).values('node__hostname').annotate(
+        usage_total=Sum('usage_sum'),
+        samples=Sum('sample_count'),
+        max_usage=Max('usage_max'),
+        min_usage=Min('usage_min'),
+        total_cores_logical=Max('cores_logical'),
+        total_cores_physical=Max('cores_physical'),
+        frequency_total=Sum('frequency_sum'),
+        frequency_samples=Sum('frequency_count')
+    )
+
+
+def get_summary_stats(period, start_time, end_time):
+    """Cluster-wide logical cores and average CPU frequency over the window"""
+    rows = _buckets_in_range(period, start_time, end_time)
+    total_cores = sum(
+        row['cores'] or 0 for row in rows.values('node').annotate(cores=Max('cores_logical'))
+    )
+    frequency = rows.aggregate(total=Sum('frequency_sum'), samples=Sum('frequency_count'))
+    return {
+        'total_cores': total_cores,
+        'avg_frequency_mhz': frequency['total'] / frequency['samples'] if frequency['samples'] else 0.0,
+    }
+
+
+def get_export_records(start_time, end_time):
+    """Raw usage records of [start_time, end_time] in time order, as exported"""
+    return CPUUsage.objects.filter(time__gte=start_time, time__lte=end_time).order_by('time')
+
+
+def get_node_series(period, start_time, end_time):
+    """Gap-filled average CPU usage of every node per ``period`` bucket.
+
+    Bucketing and gap filling run in SQL with time_bucket_gapfill over the
+    rollup. Returns ``(node id, bucket, usage percent)`` rows ordered by node
+    and bucket, where the usage is None for empty buckets. Every node gets a
+    complete series, with or without data.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(*node_series_query(period, start_time, end_time))
+        yield from cursor
+
+
+def node_series_query(period, start_time, end_time):
+    """SQL and parameters of get_node_series"""
+    model, width = ROLLUPS[period]
+    sql = f"""
+        SELECT node_id,
+               time_bucket_gapfill(
+                   %(width)s::interval, bucket,
+                   timezone => %(timezone)s, start => %(start)s, finish => %(end)s
+               ) AS ts,
+               (sum(usage_sum) / nullif(sum(sample_count), 0))::float AS usage_percent
+        FROM (
+            SELECT node_id, bucket, usage_sum, sample_count
+            FROM {model._meta.db_table}
+            WHERE bucket > %(rollup_start)s AND bucket <= %(end)s
+            UNION ALL
+            -- an empty sample per node, so that nodes without data are gap-filled too
+            SELECT id, %(start)s, NULL, NULL FROM {Node._meta.db_table}
+        ) AS samples
+        GROUP BY node_id, ts
+        ORDER BY node_id, ts
+    """
+    params = {
+        'width': GAPFILL_WIDTHS[period],
+        'timezone': settings.TIME_ZONE,
+        'start': start_time,
+        'end': end_time,
+        'rollup_start': start_time - width,
+    }
+    return sql, params
@@ -8,6 +8,7 @@ class CPUUsageSubmitSerializer(serializers.Serializer):
     cpu_cores_logical = serializers.IntegerField()
     cpu_cores_physical = serializers.IntegerField()
     cpu_frequency_mhz = serializers.FloatField(required=False, allow_null=True)
+    inventory_version = serializers.CharField(required=False, allow_null=True)
 
 
 class CPUReportSummarySerializer(serializers.Serializer):
@@ -1,3 +1,52 @@
-from django.test import TestCase
+import unittest
+from datetime import timedelta
+from django.db import connection
+from django.test import TransactionTestCase
+from django.utils import timezone
+from core.export import export_values
+from core.models import Node
+from core.testing import QueryPlanTestMixin
+from cpu_monitor.models import CPUUsage, CPUUsageHourly, CPUUsageDaily
+from cpu_monitor.queries import get_export_records, get_node_stats, node_series_query
+from cpu_monitor.views import EXPORT_COLUMNS
 
-# Create your tests here.
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'EXPLAIN plans of TimescaleDB hypertables')
+class CPUUsageQueryPlanTests(QueryPlanTestMixin, TransactionTestCase):
+    """Reports read the rollups, raw range queries read the chunks of their range through an index"""
+
+    HYPERTABLE = CPUUsage._meta.db_table
+    ROLLUP_VIEWS = (CPUUsageHourly._meta.db_table, CPUUsageDaily._meta.db_table)
+    PERIODS = ('hour', 'day')
+
+    def setUp(self):
+        nodes = [Node.objects.create(ip_address=f'10.0.0.{i}', hostname=f'node{i}') for i in range(2)]
+        self.end = timezone.now()
+        self.start = self.end - timedelta(days=1)
+        CPUUsage.objects.bulk_create(
+            CPUUsage(node=node, usage_percent=hour % 100, time=self.end - timedelta(hours=hour))
+            for node in nodes
+            for hour in range(self.DAYS * 24)
+        )
+        self.refresh_rollups()
+
+    def test_node_stats(self):
+        for period in self.PERIODS:
+            with self.subTest(period=period):
+                self.assertReadsRollups(self.explain(get_node_stats(period, self.start, self.end)))
+
+    def test_node_series(self):
+        for period in self.PERIODS:
+            with self.subTest(period=period):
+                self.assertReadsRollups(self.explain_sql(*node_series_query(period, self.start, self.end)))
+
+    def test_export(self):
+        plan = self.explain(export_values(get_export_records(self.start, self.end), EXPORT_COLUMNS))
+        self.assertRangeScan(plan, f'{self.HYPERTABLE}_time_idx')
+
+    def test_node_range(self):
+        node = Node.objects.first()
+        plan = self.explain(CPUUsage.objects.filter(
+            node=node, time__gte=self.start, time__lte=self.end
+        ).order_by('-time').values('time', 'usage_percent'))
+        self.assertRangeScan(plan, 'cpuusage_node_time_idx')
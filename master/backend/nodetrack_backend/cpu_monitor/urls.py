@@ -6,4 +6,5 @@ app_name = 'cpu_monitor'
 urlpatterns = [
     path('submit', views.submit_cpu_data, name='submit_cpu_data'),
     path('report', views.generate_cpu_report, name='generate_cpu_report'),
+    path('export', views.export_cpu_data, name='export_cpu_data'),
 ]
\ No newline at end of file
@@ -1,4 +1,4 @@
-from django.db.models import Sum, Avg, Max, Min, Count
+from django.conf import settings
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
@@ -6,15 +6,18 @@ from datetime import datetime, timedelta
 from ipware.ip import get_client_ip
 from django.utils import timezone
 from collections import defaultdict
-from django.db.models.functions import TruncHour, TruncWeek, TruncMonth, TruncDay
 from django.http import Http404
 from django.views.decorators.cache import cache_page
 from django.views.decorators.vary import vary_on_headers
 from core.models import Node
 from core.permissions import HasAPIToken
+from core.columnar import columnar_series
+from core.export import EXPORT_FORMATS, get_export_range, stream_export
+from core.ingest import IngestTimer, get_batch_id, ingest_submission
+from core.queue import queue_submission
 from core.utils import get_primary_ip
-from cpu_monitor.models import CPUUsage
-from cpu_monitor.serializers import CPUUsageSubmitSerializer
+from cpu_monitor.ingest import validate_cpu_entries
+from cpu_monitor.queries import get_export_records, get_node_stats, get_node_series, get_summary_stats
 
 @api_view(['POST'])
 def submit_cpu_data(request):
@@ -32,37 +35,37 @@ def submit_cpu_data(request):
     if not primary_ip:
         raise Http404("IP address is Not found/Not trusted")
 
-    created_count = 0
-
-    for entry in bulk_data:
-        serializer = CPUUsageSubmitSerializer(data=entry)
-        if serializer.is_valid():
-            data = serializer.validated_data
-
-            # Get or create node using primary IP
-            node, _ = Node.objects.get_or_create(
-                ip_address=primary_ip,
-                defaults={'hostname': data['hostname']},
-            )
+    if len(bulk_data) > settings.INGEST_MAX_ROWS:
+        return Response({
+            'status': 'error',
+            'message': f'At most {settings.INGEST_MAX_ROWS} entries can be submitted per request'
+        }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    timer = IngestTimer()
+    entries = validate_cpu_entries(bulk_data)
+    if entries and settings.INGEST_QUEUE:
+        # the ingest writer stores them, see core.queue
+        return queue_submission(
+            primary_ip, entries[0]['hostname'], {'cpu': entries}, get_batch_id(request), len(bulk_data), timer
+        )
 
-            # Create usage record - ensure timestamp is timezone aware
-            timestamp = data['timestamp']
-            if timezone.is_naive(timestamp):
-                timestamp = timezone.make_aware(timestamp)
-
-            CPUUsage.objects.create(
-                node=node,
-                usage_percent=data['cpu_usage_percent'],
-                cores_logical=data['cpu_cores_logical'],
-                cores_physical=data['cpu_cores_physical'],
-                frequency_mhz=data.get('cpu_frequency_mhz'),
-                time=timestamp
-            )
-            created_count += 1
+    created_count = 0
+    duplicate = False
+    if entries:
+        created_count = ingest_submission(
+            primary_ip, entries[0]['hostname'], {'cpu': entries}, get_batch_id(request)
+        )
+        # a payload replayed by the client after it was stored already
+        duplicate = created_count is None
+        created_count = created_count or 0
 
     return Response({
         'status': 'success',
-        'message': f'Created {created_count} CPU usage records'
+        'message': f'Created {created_count} CPU usage records',
+        'received': len(bulk_data),
+        'created': created_count,
+        'duplicate': duplicate,
+        'elapsed_ms': timer.elapsed_ms,
     })
 
 @api_view(['GET'])
@@ -75,6 +78,7 @@ def generate_cpu_report(request):
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
         period = request.query_params.get('period', 'hour')
+        columnar = request.query_params.get('format') == 'columnar'
 
         # Set default date range if not provided
         if not start_date or not end_date:
@@ -92,34 +96,28 @@ def generate_cpu_report(request):
                 end_time = timezone.make_aware(end_time)
 
         # Get time series data
-        time_series_data = get_cpu_time_series_data(period, start_time, end_time)
+        time_series_data = get_cpu_time_series_data(period, start_time, end_time, columnar)
 
         # Per-user stats commented out for performance (can be re-enabled later)
         per_user = {}
 
-        # Get per-node statistics
+        # Get per-node statistics from the rollup matching the period
         per_node = {}
-        node_stats = CPUUsage.timescale.filter(
-            time__gte=start_time,
-            time__lte=end_time
-        ).values('node__hostname').annotate(
-            avg_usage=Avg('usage_percent'),
-            max_usage=Max('usage_percent'),
-            min_usage=Min('usage_percent'),
-            total_cores_logical=Max('cores_logical'),
-            total_cores_physical=Max('cores_physical'),
-            avg_frequency=Avg('frequency_mhz')
-        )
+        node_stats = get_node_stats(period, start_time, end_time)
 
         for stat in node_stats:
             hostname = stat['node__hostname']
+            avg_usage = stat['usage_total'] / stat['samples'] if stat['samples'] else 0.0
+            avg_frequency = (
+                stat['frequency_total'] / stat['frequency_samples'] if stat['frequency_samples'] else 0.0
+            )
             per_node[hostname] = {
-                'avg_usage': float(stat['avg_usage']) if stat['avg_usage'] else 0.0,
+                'avg_usage': float(avg_usage),
                 'max_usage': float(stat['max_usage']) if stat['max_usage'] else 0.0,
                 'min_usage': float(stat['min_usage']) if stat['min_usage'] else 0.0,
                 'total_cores_logical': stat['total_cores_logical'],
                 'total_cores_physical': stat['total_cores_physical'],
-                'avg_frequency': float(stat['avg_frequency']) if stat['avg_frequency'] else 0.0
+                'avg_frequency': float(avg_frequency)
             }
 
         reports = {
@@ -138,93 +136,81 @@ def generate_cpu_report(request):
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-def get_cpu_time_series_data(period='hour', start_time=None, end_time=None):
-
-    assert start_time and end_time, "Start and end time must be provided"
-
-    trunc_function = {
-        'hour': TruncHour,
-        'day': TruncDay,
-        'week': TruncWeek,
-        'month': TruncMonth
-    }
-
-    # Fetch all nodes in a single query
-    nodes = list(Node.objects.all().distinct())
+EXPORT_COLUMNS = (
+    ('time', 'time'),
+    ('hostname', 'node__hostname'),
+    ('usage_percent', 'usage_percent'),
+    ('cores_logical', 'cores_logical'),
+    ('cores_physical', 'cores_physical'),
+    ('frequency_mhz', 'frequency_mhz'),
+)
 
-    # Fetch all CPU usage data for all nodes in a single query
-    all_node_data = (
-        CPUUsage.timescale.filter(
-            node__in=nodes,
-            time__range=(start_time, end_time),
-        )
-        .values("node", "time")
-        .annotate(avg_usage_percent=Avg("usage_percent"))
-        .annotate(truncated_time=trunc_function[period]("time"))
-        .order_by("node", "time")
-    )
-
-    # Group the data by node
-    data_by_node = defaultdict(list)
-    for entry in all_node_data:
-        node_id = entry['node']
-        data_by_node[node_id].append({
-            'truncated_time': entry['truncated_time'],
-            'avg_usage_percent': entry['avg_usage_percent']
-        })
+@api_view(['GET'])
+@permission_classes([HasAPIToken])
+def export_cpu_data(request):
+    """Stream raw CPU usage records of a time range as NDJSON (default) or CSV"""
+    export_format = request.query_params.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return Response({
+            'error': f'Unsupported format, use one of: {", ".join(EXPORT_FORMATS)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        start_time, end_time = get_export_range(request.query_params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Function to truncate timestamps to the appropriate precision
-    truncate_timestamp = lambda ts: ts.replace(minute=0, second=0, microsecond=0) # noqa: E731
+    records = get_export_records(start_time, end_time)
+    return stream_export(records, EXPORT_COLUMNS, export_format, 'cpu_usage')
 
-    nodes_timeseries = []
+def get_cpu_time_series_data(period='hour', start_time=None, end_time=None, columnar=False):
+    """Per-node CPU time series over the period buckets plus summary statistics
 
-    # Calculate the time increment based on the period
-    time_increments = {
-        'hour': timedelta(hours=1),
-        'day': timedelta(days=1),
-        'week': timedelta(weeks=1),
-        'month': timedelta(days=30)  # Approximate month increment
-    }
-    time_increment = time_increments[period]
+    By default each node gets a list of per-bucket objects. With ``columnar``
+    the nodes share a single ``timestamps`` axis and each one gets a typed
+    ``usage_percent`` array and a base64 ``active`` bitmask (bit i of byte i // 8
+    set when bucket i has data), which is several times smaller to encode.
+    """
 
-    # Process data for each node
-    for node in nodes:
-        node_data = data_by_node.get(node.id, [])
+    assert start_time and end_time, "Start and end time must be provided"
 
-        # Group by time bucket and calculate averages
-        time_buckets = defaultdict(list)
-        for entry in node_data:
-            bucket_time = entry['truncated_time']
-            time_buckets[bucket_time].append(entry['avg_usage_percent'])
+    # Fetch all nodes in a single query
+    nodes = list(Node.objects.all().distinct())
 
-        processed_data = {
-            bucket_time: (sum(values) / len(values) if values else 0)
-            for bucket_time, values in time_buckets.items()
+    # Gap-filled node usage, bucketed in SQL and streamed ordered by node and bucket
+    rows = get_node_series(period, start_time, end_time)
+    if columnar:
+        timestamps, columns = columnar_series(rows)
+        empty_column = {'values': [], 'active': ''}
+        time_series = {
+            'timestamps': timestamps,
+            'nodes': {
+                f'node_{node.hostname}': {
+                    'usage_percent': columns.get(node.id, empty_column)['values'],
+                    'active': columns.get(node.id, empty_column)['active'],
+                }
+                for node in nodes
+            },
         }
-
-        # Generate complete time series with missing buckets filled in
-        timeseries = []
-        current_bucket = truncate_timestamp(start_time)
-        end_truncated = truncate_timestamp(end_time)
-
-        while current_bucket <= end_truncated:
-            usage_percent = processed_data.get(current_bucket, 0.0)
-            timeseries.append({
-                'timestamp': current_bucket.isoformat(),
+    else:
+        series_by_node = defaultdict(list)
+        for node_id, bucket, usage_percent in rows:
+            series_by_node[node_id].append({
+                'timestamp': bucket.isoformat(),
                 'usage_percent': float(usage_percent or 0),
-                'is_active': current_bucket in processed_data
+                'is_active': usage_percent is not None
             })
-            current_bucket += time_increment
-
-        timeseries.sort(key=lambda x: x['timestamp'])
-        nodes_timeseries.append({
-            f'node_{node.hostname}': timeseries
-        })
+        time_series = {
+            'nodes_timeseries': [
+                {f'node_{node.hostname}': series_by_node.get(node.id, [])}
+                for node in nodes
+            ]
+        }
 
     # Calculate summary statistics
     total_nodes = len(nodes)
-    total_cores = CPUUsage.objects.aggregate(total=Sum('cores_logical'))['total'] or 0
-    avg_frequency = CPUUsage.objects.aggregate(avg=Avg('frequency_mhz'))['avg'] or 0
+    summary_stats = get_summary_stats(period, start_time, end_time)
+    total_cores = summary_stats['total_cores']
+    avg_frequency = summary_stats['avg_frequency_mhz']
 
     summary = {
         'total_cores': total_cores,
@@ -236,7 +222,5 @@ def get_cpu_time_series_data(period='hour', start_time=None, end_time=None):
         }
     }
 
-    return {
-        'nodes_timeseries': nodes_timeseries,
-        'summary': summary
-    }
+    time_series['summary'] = summary
+    return time_series
@@ -0,0 +1,141 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min, Sum, F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from core.models import SubmittedBatch
+from gpu_monitor.models import GPUAccounting, GPUUsage
+
+# A sample stands for the time until the next sample of the same user on the
+# same GPU. A longer gap than ACCOUNTING_GAP_INTERVALS sampling intervals of
+# the node means the user's processes ended, and so does the lack of a next
+# sample: the sample stands for one interval, so a user isn't billed for the
+# gap until they run something again. A node's interval is the median gap
+# between its sampling instants, ACCOUNTING_DEFAULT_INTERVAL when it has a
+# single one, so clients sampling every 60 or every 300 seconds are accounted
+# alike; no sample stands for more than ACCOUNTING_MAX_SAMPLE_GAP. Intervals
+# are accounted to the day of the sample they start with.
+ACCOUNTING_SQL = f"""
+    INSERT INTO {GPUAccounting._meta.db_table} (bucket, user_id, node_id, gpu_hours, gb_hours, samples)
+    WITH samples AS (
+        SELECT gpu_id, user_id, node_id, time, memory_used
+        FROM {GPUUsage._meta.db_table}
+        -- the samples right after the range end the intervals of its last samples
+        WHERE time >= %(start)s AND time < %(end)s + %(max_gap)s AND node_id IS NOT NULL
+    ),
+    cadences AS (
+        -- the GPUs of a node are sampled together, gaps over idle periods are the outliers
+        SELECT node_id, percentile_cont(0.5) WITHIN GROUP (ORDER BY gap) AS cadence
+        FROM (
+            SELECT node_id, time - lag(time) OVER (PARTITION BY node_id ORDER BY time) AS gap
+            FROM (SELECT DISTINCT node_id, time FROM samples) AS instants
+        ) AS gaps
+        WHERE gap IS NOT NULL
+        GROUP BY node_id
+    )
+    SELECT time_bucket(INTERVAL '1 day', time, %(timezone)s) AS bucket,
+           user_id,
+           node_id,
+           sum(seconds) / 3600 AS gpu_hours,
+           sum(memory_used * seconds) / 1024 / 3600 AS gb_hours,
+           count(*) AS samples
+    FROM (
+        SELECT time, user_id, node_id, memory_used,
+               extract(epoch FROM CASE
+                   WHEN lead(time) OVER w - time <= least(cadence * %(gap_intervals)s, %(max_gap)s)
+                   THEN lead(time) OVER w - time
+                   ELSE least(cadence, %(max_gap)s)
+               END) AS seconds
+        FROM (
+            SELECT samples.*, coalesce(cadences.cadence, %(default_interval)s) AS cadence
+            FROM samples LEFT JOIN cadences USING (node_id)
+        ) AS sampled
+        WINDOW w AS (PARTITION BY gpu_id, user_id ORDER BY time)
+    ) AS intervals
+    WHERE time >= %(start)s AND time < %(end)s
+    GROUP BY 1, user_id, node_id
+"""
+
+
+def accounting_params(start, end):
+    """Parameters of ACCOUNTING_SQL for the days from ``start`` to ``end``"""
+    return {
+        'timezone': settings.TIME_ZONE,
+        'gap_intervals': settings.ACCOUNTING_GAP_INTERVALS,
+        'default_interval': timedelta(seconds=settings.ACCOUNTING_DEFAULT_INTERVAL),
+        'max_gap': timedelta(seconds=settings.ACCOUNTING_MAX_SAMPLE_GAP),
+        'start': start,
+        'end': end,
+    }
+
+
+def day_start(value):
+    return timezone.localtime(value).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def first_retained_day():
+    """First day whose raw samples are all kept by TIMESCALE_RAW_RETENTION_DAYS, None when kept forever"""
+    if not settings.TIMESCALE_RAW_RETENTION_DAYS:
+        return None
+    horizon = timezone.now() - timedelta(days=settings.TIMESCALE_RAW_RETENTION_DAYS)
+    day = day_start(horizon)
+    return day if day == horizon else day + timedelta(days=1)
+
+
+def refresh_accounting(start=None, end=None, received_since=None):
+    """Recompute the GPU accounting of the days from ``start`` to ``end``
+
+    By default, the days from ACCOUNTING_REFRESH_DAYS before the last
+    accounted day up to now are recomputed. So are the days of the samples
+    that clients replayed late, in the payloads received since
+    ``received_since`` (ACCOUNTING_REFRESH_DAYS ago by default). The first
+    run accounts every stored sample. Days the raw retention may have
+    dropped samples of are never recomputed, their accounting is all that's
+    left of them. Returns the range of days recomputed, None when there's
+    none.
+    """
+    if start is None:
+        last = GPUAccounting.objects.aggregate(last=Max('bucket'))['last']
+        if last is not None:
+            start = last - timedelta(days=settings.ACCOUNTING_REFRESH_DAYS)
+            if received_since is None:
+                received_since = timezone.now() - timedelta(days=settings.ACCOUNTING_REFRESH_DAYS)
+            replayed = SubmittedBatch.objects.filter(received_at__gte=received_since).aggregate(
+                first=Min('first_sample')
+            )['first']
+            if replayed is not None:
+                start = min(start, replayed)
+        else:
+            start = GPUUsage.objects.aggregate(first=Min('time'))['first']
+            if start is None:
+                return None
+    start = day_start(start)
+    end = day_start(end or timezone.now()) + timedelta(days=1)
+    retained = first_retained_day()
+    if retained is not None:
+        start = max(start, retained)
+    if start >= end:
+        return None
+
+    with transaction.atomic():
+        GPUAccounting.objects.filter(bucket__gte=start, bucket__lt=end).delete()
+        with connection.cursor() as cursor:
+            cursor.execute(ACCOUNTING_SQL, accounting_params(start, end))
+    return start, end
+
+
+def get_user_accounting(start_time, end_time, monthly=False):
+    """GPU-hours and GB-hours per user over the days overlapping [start_time, end_time]
+
+    With ``monthly``, rows are per user and ``month`` instead.
+    """
+    rows = GPUAccounting.objects.filter(bucket__gt=start_time - timedelta(days=1), bucket__lte=end_time)
+    if monthly:
+        rows = rows.annotate(month=TruncMonth('bucket')).values('month', username=F('user__name'))
+    else:
+        rows = rows.values(username=F('user__name'))
+    return rows.annotate(
+        gpu_hours=Sum('gpu_hours'),
+        gb_hours=Sum('gb_hours'),
+    )
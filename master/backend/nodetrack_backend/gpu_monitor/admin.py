@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import GPU, GPUUsage
+from .models import GPU, Command, GPUUsage, GPUUser
 
 @admin.register(GPU)
 class GPUAdmin(admin.ModelAdmin):
@@ -14,12 +14,22 @@ class GPUAdmin(admin.ModelAdmin):
 
 @admin.register(GPUUsage)
 class GPUUsageAdmin(admin.ModelAdmin):
-    list_display = ('gpu', 'username', 'memory_used_gb', 'time')
-    list_filter = ('username', 'gpu__node', 'time')
-    search_fields = ('username', 'gpu__node__hostname', 'gpu__gpu_id')
+    list_display = ('gpu', 'user', 'memory_used_gb', 'time')
+    list_filter = ('user', 'node', 'time')
+    search_fields = ('user__name', 'node__hostname', 'gpu__gpu_id')
     date_hierarchy = 'time'
     
     def memory_used_gb(self, obj):
         """Display memory in GB for better readability"""
         return f"{obj.memory_used / 1024:.2f} GB"
-    memory_used_gb.short_description = "Memory Used"
\ No newline at end of file
+    memory_used_gb.short_description = "Memory Used"
+
+@admin.register(GPUUser)
+class GPUUserAdmin(admin.ModelAdmin):
+    list_display = ('name',)
+    search_fields = ('name',)
+
+@admin.register(Command)
+class CommandAdmin(admin.ModelAdmin):
+    list_display = ('text',)
+    search_fields = ('text',)
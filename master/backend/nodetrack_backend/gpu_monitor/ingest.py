@@ -0,0 +1,207 @@
+import hashlib
+from collections import OrderedDict
+from django.db import transaction
+from core.copy import copy_insert_ignoring_conflicts
+from core.ingest import aware, validate_entries
+from gpu_monitor.models import GPU, Command, GPUUsage, GPUUser
+from gpu_monitor.serializers import GPUUsageSubmitSerializer
+
+# (node pk, gpu_id) -> GPU pk, shared by every request served by this process
+_gpu_pk_cache = {}
+# node pk -> last GPU inventory version synced by this process
+_inventory_versions = {}
+# username -> GPUUser pk
+_user_pk_cache = {}
+# command line -> Command pk of the COMMAND_CACHE_SIZE most recently used
+# commands, command lines with their arguments are mostly unique
+_command_pk_cache = OrderedDict()
+COMMAND_CACHE_SIZE = 10000
+
+# columns of the rows built by gpu_usage_rows
+GPU_USAGE_COLUMNS = ['gpu_id', 'user_id', 'time', 'node_id', 'command_id', 'memory_used']
+
+
+def forget_node_gpus(node_pk):
+    """Drop the cached GPU lookups of a node"""
+    for key in [key for key in _gpu_pk_cache if key[0] == node_pk]:
+        del _gpu_pk_cache[key]
+    _inventory_versions.pop(node_pk, None)
+
+
+def forget_lookups():
+    """Drop the cached user and command ids, some may have been deleted meanwhile"""
+    _user_pk_cache.clear()
+    _command_pk_cache.clear()
+
+
+def sync_gpu_inventory(node, entries):
+    """Upsert the name and total memory of every GPU reported in ``entries``"""
+    gpus = {
+        entry['gpu_id']: GPU(
+            node=node,
+            gpu_id=entry['gpu_id'],
+            name=entry['gpu_name'],
+            memory_total=entry['memory_total'],
+        )
+        for entry in entries
+    }
+    GPU.objects.bulk_create(
+        gpus.values(),
+        update_conflicts=True,
+        unique_fields=['node', 'gpu_id'],
+        update_fields=['name', 'memory_total'],
+    )
+    for gpu_id, pk in GPU.objects.filter(node=node, gpu_id__in=gpus).values_list('gpu_id', 'pk'):
+        _gpu_pk_cache[(node.pk, gpu_id)] = pk
+
+
+def resolve_gpus(node, entries):
+    """Map every gpu_id found in ``entries`` to the primary key of its GPU row.
+
+    Cached GPUs cost nothing, the rest are fetched in one query and whatever
+    is still unknown is created with a single bulk_create. When the client
+    reports a new inventory version, the GPU rows are upserted first.
+    """
+    version = entries[0].get('inventory_version')
+    if version and _inventory_versions.get(node.pk) != version:
+        sync_gpu_inventory(node, entries)
+        _inventory_versions[node.pk] = version
+
+    wanted = {entry['gpu_id']: entry for entry in entries}
+    resolved = {}
+    missing = []
+    for gpu_id in wanted:
+        pk = _gpu_pk_cache.get((node.pk, gpu_id))
+        if pk is None:
+            missing.append(gpu_id)
+        else:
+            resolved[gpu_id] = pk
+
+    if missing:
+        existing = dict(
+            GPU.objects.filter(node=node, gpu_id__in=missing).values_list('gpu_id', 'pk')
+        )
+        new_gpus = [
+            GPU(
+                node=node,
+                gpu_id=gpu_id,
+                name=wanted[gpu_id]['gpu_name'],
+                memory_total=wanted[gpu_id]['memory_total'],
+            )
+            for gpu_id in missing if gpu_id not in existing
+        ]
+        if new_gpus:
+            # another worker may be registering the same GPUs concurrently
+            GPU.objects.bulk_create(new_gpus, ignore_conflicts=True)
+            existing.update(
+                GPU.objects.filter(node=node, gpu_id__in=missing).values_list('gpu_id', 'pk')
+            )
+        for gpu_id, pk in existing.items():
+            _gpu_pk_cache[(node.pk, gpu_id)] = pk
+            resolved[gpu_id] = pk
+
+    return resolved
+
+
+def resolve_users(names):
+    """Map usernames to GPUUser primary keys, creating the unknown users in bulk
+
+    Users are cached once the transaction that resolved them commits, so a
+    rollback can't leave the ids of users that were never created.
+    """
+    resolved = {name: _user_pk_cache[name] for name in names if name in _user_pk_cache}
+    missing = [name for name in names if name not in resolved]
+    if missing:
+        GPUUser.objects.bulk_create([GPUUser(name=name) for name in missing], ignore_conflicts=True)
+        fetched = dict(GPUUser.objects.filter(name__in=missing).values_list('name', 'pk'))
+        transaction.on_commit(lambda: _user_pk_cache.update(fetched))
+        resolved.update(fetched)
+    return resolved
+
+
+def resolve_commands(texts):
+    """Map command lines to Command primary keys, creating the unknown commands in bulk
+
+    As with resolve_users, commands are cached once the transaction commits.
+    """
+    resolved = {}
+    for text in texts:
+        pk = _command_pk_cache.get(text)
+        if pk is not None:
+            _command_pk_cache.move_to_end(text)
+            resolved[text] = pk
+    missing = {hashlib.sha256(text.encode()).hexdigest(): text for text in texts if text not in resolved}
+    if missing:
+        Command.objects.bulk_create(
+            [Command(digest=digest, text=text) for digest, text in missing.items()], ignore_conflicts=True
+        )
+        fetched = {
+            missing[digest]: pk for digest, pk in Command.objects.filter(digest__in=missing).values_list('digest', 'pk')
+        }
+        transaction.on_commit(lambda: _cache_commands(fetched))
+        resolved.update(fetched)
+    return resolved
+
+
+def _cache_commands(commands):
+    _command_pk_cache.update(commands)
+    while len(_command_pk_cache) > COMMAND_CACHE_SIZE:
+        _command_pk_cache.popitem(last=False)
+
+
+def gpu_usage_rows(usage):
+    """Rows of GPU_USAGE_COLUMNS for merged usage, see merge_gpu_usage"""
+    users = resolve_users({username for _, username, _ in usage})
+    commands = resolve_commands({command for _, _, command in usage.values() if command})
+    return [
+        (gpu_pk, users[username], time, node_pk, commands.get(command), memory_used)
+        for (gpu_pk, username, time), (node_pk, memory_used, command) in usage.items()
+    ]
+
+
+def validate_gpu_entries(bulk_data):
+    """Validate submitted GPU entries, idle entries may omit their memory"""
+    if not isinstance(bulk_data, list):
+        return []
+    for item in bulk_data:
+        if isinstance(item, dict) and not item.get('memory_used'):
+            item['memory_used'] = 0
+    return validate_entries(GPUUsageSubmitSerializer, bulk_data)
+
+
+def merge_gpu_usage(node, gpu_pks, entries):
+    """Usage per ``(gpu pk, username, time)`` of the non idle entries of ``node``
+
+    Values are ``(node pk, total memory used, command)``, the command being
+    the one of the process using the most memory.
+    """
+    usage = {}
+    largest = {}
+    # consider only the usage when the GPU is not idle (there is a process associated with the GPU)
+    for entry in entries:
+        if not entry.get('username'):
+            continue
+        key = (gpu_pks[entry['gpu_id']], entry['username'], aware(entry['timestamp']))
+        _, memory_used, command = usage.get(key, (node.pk, 0, None))
+        if entry['memory_used'] >= largest.get(key, 0):
+            largest[key] = entry['memory_used']
+            command = entry.get('command') or command
+        usage[key] = (node.pk, memory_used + entry['memory_used'], command)
+    return usage
+
+
+def ingest_gpu_usage(node, entries):
+    """Store the validated GPU entries of a node in one transaction.
+
+    Only entries with a username are kept as usage records; idle GPUs are
+    still registered. Processes of a user sampled together on a GPU are
+    merged into one record, and records already stored are skipped, so
+    retried submissions write nothing. Returns the number of usage records
+    inserted.
+    """
+    with transaction.atomic():
+        gpu_pks = resolve_gpus(node, entries)
+        # ON CONFLICT DO NOTHING on (gpu, user, time)
+        return copy_insert_ignoring_conflicts(
+            GPUUsage, GPU_USAGE_COLUMNS, gpu_usage_rows(merge_gpu_usage(node, gpu_pks, entries))
+        )
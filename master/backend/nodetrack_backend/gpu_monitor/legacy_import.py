@@ -0,0 +1,162 @@
+import json
+import time
+from datetime import datetime
+from django.db import transaction
+from core.copy import copy_insert_ignoring_conflicts
+from core.ingest import aware
+from core.models import Node
+from core.utils import get_primary_ip
+from gpu_monitor.ingest import GPU_USAGE_COLUMNS, gpu_usage_rows, merge_gpu_usage
+from gpu_monitor.models import GPU, GPUUsage
+
+
+class LegacyLogImporter:
+    """Import the NDJSON log of the legacy Flask server into GPU/GPUUsage
+
+    Nodes and GPUs are loaded once into in-memory maps. Every chunk of
+    ``chunk_lines`` lines creates the nodes and GPUs it's missing with one
+    bulk_create each, then its usage rows are copied into the hypertable in
+    a single COPY. As with submit_gpu_data, only entries with a username are
+    usage records, idle GPUs are only registered, and samples already stored
+    are skipped, so importing the same log twice writes nothing.
+    """
+
+    def __init__(self, chunk_lines=100000, log=print):
+        self.chunk_lines = chunk_lines
+        self.log = log
+        self.stats = {'lines': 0, 'invalid': 0, 'unknown_node': 0, 'idle': 0, 'records': 0, 'imported': 0}
+        # primary IP -> Node pk, hostname -> Node pk for entries without an IP
+        self._nodes = {}
+        self._hostnames = {}
+        for pk, ip_address, hostname in Node.objects.order_by('-pk').values_list('pk', 'ip_address', 'hostname'):
+            self._nodes[ip_address] = pk
+            self._hostnames[hostname] = pk
+        self._unknown = set()
+        self._carry = []
+        # (node pk, gpu_id) -> GPU pk
+        self._gpus = {
+            (node_pk, gpu_id): pk for pk, node_pk, gpu_id in GPU.objects.values_list('pk', 'node_id', 'gpu_id')
+        }
+
+    def run(self, path):
+        started = time.perf_counter()
+        with open(path, 'rb') as f:
+            while True:
+                lines = [line for _, line in zip(range(self.chunk_lines), f)]
+                self.import_lines(lines, final=not lines)
+                if not lines:
+                    break
+                elapsed = time.perf_counter() - started
+                self.log(
+                    f"Imported {self.stats['imported']} usage records from {self.stats['lines']} lines "
+                    f"({self.stats['lines'] / elapsed:,.0f} lines/s)"
+                )
+        return self.stats
+
+    def import_lines(self, lines, final=False):
+        entries, self._carry = self._carry, []
+        for line in lines:
+            entry = self._parse(line)
+            if entry is None:
+                self.stats['invalid'] += 1
+            else:
+                entries.append(entry)
+        self.stats['lines'] += len(lines)
+        if not final:
+            # the processes of the last sample may go on in the next chunk, and
+            # a record can't be completed once copied: keep them for that chunk
+            split = len(entries)
+            while split and entries[split - 1]['timestamp'] == entries[-1]['timestamp']:
+                split -= 1
+            entries, self._carry = entries[:split], entries[split:]
+
+        self._create_nodes(entries)
+        for entry in entries:
+            entry['node'] = self._node(entry)
+        resolved = [entry for entry in entries if entry['node'] is not None]
+        self.stats['unknown_node'] += len(entries) - len(resolved)
+        entries = resolved
+        self._create_gpus(entries)
+
+        # processes of a user sampled together on a GPU make one record
+        by_node = {}
+        for entry in entries:
+            if entry['username']:
+                by_node.setdefault(entry['node'], []).append(entry)
+            else:
+                self.stats['idle'] += 1
+        usage = {}
+        for node_pk, node_entries in by_node.items():
+            gpu_pks = {entry['gpu_id']: self._gpus[(node_pk, entry['gpu_id'])] for entry in node_entries}
+            usage.update(merge_gpu_usage(Node(pk=node_pk), gpu_pks, node_entries))
+
+        if usage:
+            with transaction.atomic():
+                self.stats['imported'] += copy_insert_ignoring_conflicts(
+                    GPUUsage, GPU_USAGE_COLUMNS, gpu_usage_rows(usage)
+                )
+        self.stats['records'] += len(usage)
+
+    def _parse(self, line):
+        try:
+            entry = json.loads(line)
+            ip_address = entry.get('ip_address')
+            return {
+                'ip_address': ip_address and (get_primary_ip(ip_address) or ip_address),
+                'hostname': entry['hostname'],
+                'gpu_id': str(entry['gpu_id']),
+                'gpu_name': entry.get('gpu_name') or '',
+                'memory_total': entry.get('memory_total') or 0,
+                'username': entry.get('username'),
+                'memory_used': entry.get('memory_used') or 0,
+                'command': entry.get('command'),
+                'timestamp': aware(datetime.fromisoformat(entry['timestamp'])),
+            }
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def _node(self, entry):
+        if entry['ip_address']:
+            return self._nodes.get(entry['ip_address'])
+        return self._hostnames.get(entry['hostname'])
+
+    def _create_nodes(self, entries):
+        missing = {}
+        for entry in entries:
+            if entry['ip_address']:
+                if entry['ip_address'] not in self._nodes:
+                    missing.setdefault(entry['ip_address'], entry['hostname'])
+            elif entry['hostname'] not in self._hostnames and entry['hostname'] not in self._unknown:
+                # entries of the oldest clients carry no IP, a node can't be created for them
+                self._unknown.add(entry['hostname'])
+                self.log(f"No node known for {entry['hostname']}, its entries without IP address are skipped")
+        if not missing:
+            return
+        created = Node.objects.bulk_create(
+            [Node(ip_address=ip_address, hostname=hostname) for ip_address, hostname in missing.items()]
+        )
+        for node in created:
+            self._nodes[node.ip_address] = node.pk
+            self._hostnames.setdefault(node.hostname, node.pk)
+        self.log(f"Created {len(created)} nodes")
+
+    def _create_gpus(self, entries):
+        missing = {}
+        for entry in entries:
+            key = (entry['node'], entry['gpu_id'])
+            if key not in self._gpus:
+                missing.setdefault(key, entry)
+        if missing:
+            GPU.objects.bulk_create(
+                [
+                    GPU(node_id=node_pk, gpu_id=gpu_id, name=entry['gpu_name'], memory_total=entry['memory_total'])
+                    for (node_pk, gpu_id), entry in missing.items()
+                ],
+                ignore_conflicts=True,
+            )
+            node_pks = {node_pk for node_pk, _ in missing}
+            self._gpus.update(
+                ((node_pk, gpu_id), pk)
+                for pk, node_pk, gpu_id in GPU.objects.filter(node__in=node_pks).values_list('pk', 'node_id', 'gpu_id')
+            )
+            self.log(f"Registered {len(missing)} GPUs")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from gpu_monitor.legacy_import import LegacyLogImporter
+
+
+class Command(BaseCommand):
+    help = 'Import the cluster_gpu_usage.log written by the legacy server into the GPU usage hypertable'
+
+    def add_arguments(self, parser):
+        parser.add_argument('log_file', help='NDJSON log of the legacy server, one entry per line')
+        parser.add_argument(
+            '--chunk-lines', type=int, default=100000,
+            help='Lines imported per COPY (default: 100000)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            stats = LegacyLogImporter(options['chunk_lines'], log=self.stdout.write).run(options['log_file'])
+        except FileNotFoundError as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['imported']} usage records ({stats['records'] - stats['imported']} already stored) "
+            f"from {stats['lines']} lines: {stats['idle']} idle entries, {stats['invalid']} invalid lines, "
+            f"{stats['unknown_node']} entries of unknown nodes"
+        ))
@@ -0,0 +1,47 @@
+import time
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from gpu_monitor.accounting import refresh_accounting
+
+
+# longer than any ingest transaction: a payload claimed before a refresh
+# started may only be committed after the refresh read the samples
+RECEIVED_MARGIN = timedelta(minutes=5)
+
+
+def _date(value):
+    return timezone.make_aware(datetime.fromisoformat(value))
+
+
+class Command(BaseCommand):
+    help = 'Recompute the time-weighted GPU accounting of recent days, or of a date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=_date, help='First day to recompute (default: recent days only)')
+        parser.add_argument('--until', type=_date, help='Last day to recompute (default: today)')
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running and refresh every this many seconds (default: refresh once)',
+        )
+
+    def handle(self, *args, **options):
+        since = options['since']
+        received_since = None
+        while True:
+            started = time.perf_counter()
+            run_at = timezone.now()
+            refreshed = refresh_accounting(since, options['until'], received_since)
+            if refreshed is None:
+                self.stdout.write('No GPU usage to account in the retained days')
+            else:
+                start, end = refreshed
+                self.stdout.write(
+                    f"Accounted {start:%Y-%m-%d} to {end:%Y-%m-%d} in {time.perf_counter() - started:.1f}s"
+                )
+            if not options['interval']:
+                break
+            # later runs only pick up what's new, and what was replayed since this one
+            since = None
+            received_since = run_at - RECEIVED_MARGIN
+            time.sleep(options['interval'])
@@ -0,0 +1,141 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:41
+
+from django.conf import settings
+from django.db import migrations, models
+from core.timescale import refresh_window_days
+
+# Buckets follow settings.TIME_ZONE so they line up with Django's Trunc* functions
+ROLLUPS = (
+    # suffix, bucket width, refresh lag, refresh schedule; the refresh window
+    # follows the settings, see core.timescale.refresh_window_days
+    ('hourly', '1 hour', '1 hour', '30 minutes'),
+    ('daily', '1 day', '1 day', '1 hour'),
+)
+
+
+def create_rollups_sql():
+    statements = []
+    windows = refresh_window_days()
+    for suffix, width, end_offset, schedule in ROLLUPS:
+        bucket = f"time_bucket(INTERVAL '{width}', u.time, '{settings.TIME_ZONE}')"
+        # materialized_only = false keeps the not yet materialized tail readable from raw rows
+        statements += [
+            f"""
+            CREATE MATERIALIZED VIEW gpu_monitor_gpuusage_{suffix}
+            WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+            SELECT {bucket} AS bucket,
+                   g.node_id,
+                   u.gpu_id,
+                   u.username,
+                   sum(u.memory_used) AS memory_sum,
+                   max(u.memory_used) AS memory_max,
+                   min(u.memory_used) AS memory_min,
+                   count(*) AS sample_count
+            FROM gpu_monitor_gpuusage u
+            JOIN gpu_monitor_gpu g ON g.id = u.gpu_id
+            GROUP BY 1, g.node_id, u.gpu_id, u.username
+            WITH DATA
+            """,
+            f"""
+            CREATE MATERIALIZED VIEW gpu_monitor_nodeusage_{suffix}
+            WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+            SELECT {bucket} AS bucket,
+                   g.node_id,
+                   sum(u.memory_used) AS memory_sum,
+                   count(DISTINCT u.time) AS sample_times
+            FROM gpu_monitor_gpuusage u
+            JOIN gpu_monitor_gpu g ON g.id = u.gpu_id
+            GROUP BY 1, g.node_id
+            WITH DATA
+            """,
+        ]
+        for view in (f'gpu_monitor_gpuusage_{suffix}', f'gpu_monitor_nodeusage_{suffix}'):
+            statements.append(
+                f"""
+                SELECT add_continuous_aggregate_policy('{view}',
+                    start_offset => INTERVAL '{windows[suffix]} days',
+                    end_offset => INTERVAL '{end_offset}',
+                    schedule_interval => INTERVAL '{schedule}')
+                """
+            )
+    return statements
+
+
+def drop_rollups_sql():
+    return [
+        f'DROP MATERIALIZED VIEW IF EXISTS {view}_{suffix}'
+        for suffix, *_ in ROLLUPS
+        for view in ('gpu_monitor_gpuusage', 'gpu_monitor_nodeusage')
+    ]
+
+
+class Migration(migrations.Migration):
+
+    # continuous aggregates are materialized WITH DATA, which can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('gpu_monitor', '0002_alter_gpu_memory_total_alter_gpuusage_memory_used'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GPUUsageDaily',
+            fields=[
+                ('bucket', models.DateTimeField(primary_key=True, serialize=False)),
+                ('username', models.CharField(max_length=100)),
+                ('memory_sum', models.FloatField(help_text='Sum of memory used over the bucket samples in MB')),
+                ('memory_max', models.FloatField(help_text='Max memory used in MB')),
+                ('memory_min', models.FloatField(help_text='Min memory used in MB')),
+                ('sample_count', models.BigIntegerField(help_text='Number of usage records in the bucket')),
+            ],
+            options={
+                'db_table': 'gpu_monitor_gpuusage_daily',
+                'abstract': False,
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='GPUUsageHourly',
+            fields=[
+                ('bucket', models.DateTimeField(primary_key=True, serialize=False)),
+                ('username', models.CharField(max_length=100)),
+                ('memory_sum', models.FloatField(help_text='Sum of memory used over the bucket samples in MB')),
+                ('memory_max', models.FloatField(help_text='Max memory used in MB')),
+                ('memory_min', models.FloatField(help_text='Min memory used in MB')),
+                ('sample_count', models.BigIntegerField(help_text='Number of usage records in the bucket')),
+            ],
+            options={
+                'db_table': 'gpu_monitor_gpuusage_hourly',
+                'abstract': False,
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='NodeGPUUsageDaily',
+            fields=[
+                ('bucket', models.DateTimeField(primary_key=True, serialize=False)),
+                ('memory_sum', models.FloatField(help_text='Sum of memory used over the bucket samples in MB')),
+                ('sample_times', models.BigIntegerField(help_text='Number of distinct sampling instants in the bucket')),
+            ],
+            options={
+                'db_table': 'gpu_monitor_nodeusage_daily',
+                'abstract': False,
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='NodeGPUUsageHourly',
+            fields=[
+                ('bucket', models.DateTimeField(primary_key=True, serialize=False)),
+                ('memory_sum', models.FloatField(help_text='Sum of memory used over the bucket samples in MB')),
+                ('sample_times', models.BigIntegerField(help_text='Number of distinct sampling instants in the bucket')),
+            ],
+            options={
+                'db_table': 'gpu_monitor_nodeusage_hourly',
+                'abstract': False,
+                'managed': False,
+            },
+        ),
+        migrations.RunSQL(create_rollups_sql(), drop_rollups_sql()),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:55
+
+from django.db import migrations, models
+
+# Rows sharing (gpu, username, time) are processes of the same user sampled
+# together. They are merged into one row holding their total memory, which
+# keeps the per-user sums of the reports unchanged.
+MERGE_DUPLICATES_SQL = [
+    """
+    CREATE TEMPORARY TABLE gpuusage_duplicates ON COMMIT DROP AS
+    SELECT gpu_id, username, time, sum(memory_used) AS memory_used
+    FROM gpu_monitor_gpuusage
+    GROUP BY gpu_id, username, time
+    HAVING count(*) > 1
+    """,
+    """
+    DELETE FROM gpu_monitor_gpuusage u
+    USING gpuusage_duplicates d
+    WHERE u.gpu_id = d.gpu_id AND u.username = d.username AND u.time = d.time
+    """,
+    """
+    INSERT INTO gpu_monitor_gpuusage (gpu_id, username, time, memory_used)
+    SELECT gpu_id, username, time, memory_used FROM gpuusage_duplicates
+    """,
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gpu_monitor', '0003_gpu_usage_rollups'),
+    ]
+
+    operations = [
+        migrations.RunSQL(MERGE_DUPLICATES_SQL, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='gpuusage',
+            constraint=models.UniqueConstraint(fields=('gpu', 'username', 'time'), name='unique_gpu_usage_sample'),
+        ),
+    ]
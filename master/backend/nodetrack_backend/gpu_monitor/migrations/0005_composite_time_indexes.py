@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gpu_monitor', '0004_gpuusage_natural_key'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='gpuusage',
+            name='gpu_monitor_usernam_d0795e_idx',
+        ),
+        migrations.AddIndex(
+            model_name='gpuusage',
+            index=models.Index(fields=['gpu', '-time'], include=('memory_used',), name='gpuusage_gpu_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gpuusage',
+            index=models.Index(fields=['username', '-time'], include=('gpu', 'memory_used'), name='gpuusage_user_time_idx'),
+        ),
+    ]
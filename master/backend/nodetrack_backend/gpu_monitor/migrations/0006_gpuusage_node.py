@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:05
+
+from datetime import timedelta
+import django.db.models.deletion
+from django.db import migrations, models
+from core.timescale import update_compression_settings
+
+# one hypertable chunk per UPDATE, each in its own transaction
+BACKFILL_BATCH = timedelta(days=1)
+
+
+def backfill_node(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT min(time), max(time) FROM gpu_monitor_gpuusage WHERE node_id IS NULL")
+        start, end = cursor.fetchone()
+        while start is not None and start <= end:
+            cursor.execute(
+                """
+                UPDATE gpu_monitor_gpuusage u SET node_id = g.node_id
+                FROM gpu_monitor_gpu g
+                WHERE g.id = u.gpu_id AND u.node_id IS NULL AND u.time >= %s AND u.time < %s
+                """,
+                [start, start + BACKFILL_BATCH],
+            )
+            start += BACKFILL_BATCH
+
+
+def segment_by_node(apps, schema_editor):
+    # the settings as of this migration, 0007 replaces username by user_id
+    update_compression_settings(
+        schema_editor.connection, 'gpu_monitor_gpuusage', 'node_id, gpu_id', 'time DESC, username'
+    )
+
+
+class Migration(migrations.Migration):
+
+    # every backfill batch commits on its own
+    atomic = False
+
+    dependencies = [
+        ('core', '0003_timescale_policies'),
+        ('gpu_monitor', '0005_composite_time_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gpuusage',
+            name='node',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='gpu_usage_records', to='core.node'),
+        ),
+        migrations.RunPython(backfill_node, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='gpuusage',
+            index=models.Index(fields=['node', '-time'], include=('memory_used',), name='gpuusage_node_time_idx'),
+        ),
+        migrations.RunPython(segment_by_node, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,173 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:07
+
+import importlib
+from datetime import timedelta
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from core.timescale import apply_policies, disable_compression, refresh_window_days
+
+rollups_0003 = importlib.import_module('gpu_monitor.migrations.0003_gpu_usage_rollups')
+ROLLUPS = rollups_0003.ROLLUPS
+
+# hypertable -> (segmentby, orderby) once username is replaced by user_id
+COMPRESSED_HYPERTABLES = {
+    'gpu_monitor_gpuusage': ('node_id, gpu_id', 'time DESC, user_id'),
+    'cpu_monitor_cpuusage': ('node_id', 'time DESC'),
+}
+
+# one hypertable chunk per UPDATE, each in its own transaction
+BACKFILL_BATCH = timedelta(days=1)
+
+
+def create_rollups_sql():
+    """The rollups of 0003 grouped by user_id, reading node_id from the records instead of joining GPU"""
+    statements = []
+    windows = refresh_window_days()
+    for suffix, width, end_offset, schedule in ROLLUPS:
+        bucket = f"time_bucket(INTERVAL '{width}', time, '{settings.TIME_ZONE}')"
+        statements += [
+            f"""
+            CREATE MATERIALIZED VIEW gpu_monitor_gpuusage_{suffix}
+            WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+            SELECT {bucket} AS bucket,
+                   node_id,
+                   gpu_id,
+                   user_id,
+                   sum(memory_used) AS memory_sum,
+                   max(memory_used) AS memory_max,
+                   min(memory_used) AS memory_min,
+                   count(*) AS sample_count
+            FROM gpu_monitor_gpuusage
+            GROUP BY 1, node_id, gpu_id, user_id
+            WITH DATA
+            """,
+            f"""
+            CREATE MATERIALIZED VIEW gpu_monitor_nodeusage_{suffix}
+            WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+            SELECT {bucket} AS bucket,
+                   node_id,
+                   sum(memory_used) AS memory_sum,
+                   count(DISTINCT time) AS sample_times
+            FROM gpu_monitor_gpuusage
+            GROUP BY 1, node_id
+            WITH DATA
+            """,
+        ]
+        for view in (f'gpu_monitor_gpuusage_{suffix}', f'gpu_monitor_nodeusage_{suffix}'):
+            statements.append(
+                f"""
+                SELECT add_continuous_aggregate_policy('{view}',
+                    start_offset => INTERVAL '{windows[suffix]} days',
+                    end_offset => INTERVAL '{end_offset}',
+                    schedule_interval => INTERVAL '{schedule}')
+                """
+            )
+    return statements
+
+
+def decompress(apps, schema_editor):
+    # username is a compression orderby column, it can't be dropped while compressed
+    disable_compression(schema_editor.connection, 'gpu_monitor_gpuusage')
+
+
+def backfill_user(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO gpu_monitor_gpuuser (name)
+            SELECT DISTINCT username FROM gpu_monitor_gpuusage
+            ON CONFLICT (name) DO NOTHING
+            """
+        )
+        cursor.execute("SELECT min(time), max(time) FROM gpu_monitor_gpuusage WHERE user_id IS NULL")
+        start, end = cursor.fetchone()
+        while start is not None and start <= end:
+            cursor.execute(
+                """
+                UPDATE gpu_monitor_gpuusage u SET user_id = gu.id
+                FROM gpu_monitor_gpuuser gu
+                WHERE gu.name = u.username AND u.user_id IS NULL AND u.time >= %s AND u.time < %s
+                """,
+                [start, start + BACKFILL_BATCH],
+            )
+            start += BACKFILL_BATCH
+
+
+def compress(apps, schema_editor):
+    apply_policies(schema_editor.connection, hypertables=COMPRESSED_HYPERTABLES)
+
+
+class Migration(migrations.Migration):
+
+    # continuous aggregates are materialized WITH DATA and every backfill batch
+    # commits on its own, neither can run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0003_timescale_policies'),
+        ('gpu_monitor', '0006_gpuusage_node'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Command',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(help_text='SHA-256 of the command line', max_length=64, unique=True)),
+                ('text', models.TextField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GPUUser',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name': 'GPU User',
+                'verbose_name_plural': 'GPU Users',
+            },
+        ),
+        # the rollups group by username
+        migrations.RunSQL(rollups_0003.drop_rollups_sql(), rollups_0003.create_rollups_sql()),
+        migrations.RunPython(decompress, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='gpuusage',
+            name='command',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='usage_records', to='gpu_monitor.command'),
+        ),
+        migrations.AddField(
+            model_name='gpuusage',
+            name='user',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='usage_records', to='gpu_monitor.gpuuser'),
+        ),
+        migrations.RunPython(backfill_user),
+        migrations.AlterField(
+            model_name='gpuusage',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='usage_records', to='gpu_monitor.gpuuser'),
+        ),
+        migrations.RemoveConstraint(
+            model_name='gpuusage',
+            name='unique_gpu_usage_sample',
+        ),
+        migrations.RemoveIndex(
+            model_name='gpuusage',
+            name='gpuusage_user_time_idx',
+        ),
+        migrations.RemoveField(
+            model_name='gpuusage',
+            name='username',
+        ),
+        migrations.AddIndex(
+            model_name='gpuusage',
+            index=models.Index(fields=['user', '-time'], include=('gpu', 'memory_used'), name='gpuusage_user_time_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='gpuusage',
+            constraint=models.UniqueConstraint(fields=('gpu', 'user', 'time'), name='unique_gpu_usage_sample'),
+        ),
+        migrations.RunSQL(create_rollups_sql(), rollups_0003.drop_rollups_sql()),
+        migrations.RunPython(compress, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_timescale_policies'),
+        ('gpu_monitor', '0007_gpu_user_command'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GPUAccounting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(help_text='Start of the day')),
+                ('gpu_hours', models.FloatField(help_text='Hours of GPU time, one per GPU in use')),
+                ('gb_hours', models.FloatField(help_text='GPU memory used integrated over time, in GB-hours')),
+                ('samples', models.IntegerField(help_text='Number of usage records accounted')),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gpu_accounting', to='core.node')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='accounting', to='gpu_monitor.gpuuser')),
+            ],
+            options={
+                'verbose_name': 'GPU Accounting Record',
+                'verbose_name_plural': 'GPU Accounting Records',
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'user', 'node'), name='unique_gpu_accounting')],
+            },
+        ),
+    ]
@@ -19,6 +19,26 @@ class GPU(models.Model):
     def __str__(self):
         return f"{self.node.hostname}-{self.gpu_id}"
 
+class GPUUser(models.Model):
+    """User running processes on GPUs, usage records store its id instead of the name"""
+    name = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        verbose_name = "GPU User"
+        verbose_name_plural = "GPU Users"
+
+    def __str__(self):
+        return self.name
+
+class Command(models.Model):
+    """Command line of a GPU process, stored once for all the records that ran it"""
+    # command lines can exceed what a btree index holds, they are unique by digest
+    digest = models.CharField(max_length=64, unique=True, help_text="SHA-256 of the command line")
+    text = models.TextField()
+
+    def __str__(self):
+        return self.text
+
 class GPUUsage(TimescaleModel):
     """Time series record of GPU memory usage
     
@@ -26,7 +46,15 @@ class GPUUsage(TimescaleModel):
     with the 'time' field as the time dimension.
     """
     gpu = models.ForeignKey(GPU, on_delete=models.CASCADE, related_name='usage_records')
-    username = models.CharField(max_length=100)
+    # the node of ``gpu``, stored on every record so that per-node queries don't join GPU
+    node = models.ForeignKey(
+        Node, on_delete=models.CASCADE, related_name='gpu_usage_records', null=True, db_index=False
+    )
+    user = models.ForeignKey(GPUUser, on_delete=models.CASCADE, related_name='usage_records', db_index=False)
+    # command of the user's largest process on the GPU at that instant
+    command = models.ForeignKey(
+        Command, on_delete=models.SET_NULL, related_name='usage_records', null=True, db_index=False
+    )
     memory_used = models.FloatField(help_text="Memory used in MB") # set this to float
     
     # This replaces the previous 'timestamp' field
@@ -41,10 +69,101 @@ class GPUUsage(TimescaleModel):
     
     class Meta:
         indexes = [
-            models.Index(fields=['username']),
+            # time range scans of one GPU, user or node, memory_used included for index-only scans
+            models.Index(fields=['gpu', '-time'], include=['memory_used'], name='gpuusage_gpu_time_idx'),
+            models.Index(fields=['user', '-time'], include=['gpu', 'memory_used'], name='gpuusage_user_time_idx'),
+            models.Index(fields=['node', '-time'], include=['memory_used'], name='gpuusage_node_time_idx'),
+        ]
+        constraints = [
+            # one sample per GPU, user and instant: retried submissions are no-ops
+            models.UniqueConstraint(fields=['gpu', 'user', 'time'], name='unique_gpu_usage_sample'),
         ]
         verbose_name = "GPU Usage Record"
         verbose_name_plural = "GPU Usage Records"
     
     def __str__(self):
-        return f"{self.gpu} - {self.time} - {self.memory_used}MB"
\ No newline at end of file
+        return f"{self.gpu} - {self.time} - {self.memory_used}MB"
+
+class GPUAccounting(models.Model):
+    """Time-weighted GPU usage of a user on a node over a day
+
+    Each usage sample is weighted by the time until the user's next one on
+    the GPU, or by one sampling interval of the node when that's the last one
+    before a gap, so nodes sampled at different intervals are accounted
+    alike. Rows are recomputed by ``manage.py refresh_accounting``, see
+    gpu_monitor.accounting.
+    """
+    bucket = models.DateTimeField(help_text="Start of the day")
+    user = models.ForeignKey(GPUUser, on_delete=models.CASCADE, related_name='accounting')
+    node = models.ForeignKey(Node, on_delete=models.CASCADE, related_name='gpu_accounting')
+    gpu_hours = models.FloatField(help_text="Hours of GPU time, one per GPU in use")
+    gb_hours = models.FloatField(help_text="GPU memory used integrated over time, in GB-hours")
+    samples = models.IntegerField(help_text="Number of usage records accounted")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'user', 'node'], name='unique_gpu_accounting'),
+        ]
+        verbose_name = "GPU Accounting Record"
+        verbose_name_plural = "GPU Accounting Records"
+
+    def __str__(self):
+        return f"{self.user} - {self.bucket:%Y-%m-%d} - {self.gpu_hours:.1f} GPU-hours"
+
+class GPUUsageRollup(models.Model):
+    """Read-only rollup of GPU usage per node, GPU and user
+
+    Rows are materialized by TimescaleDB continuous aggregates created in
+    migration 0003 and redefined in 0007. The views run in real-time mode,
+    so buckets that are not materialized yet are computed from the raw
+    hypertable on the fly.
+    """
+    # the continuous aggregate has no id column, bucket stands in as the key Django requires
+    bucket = models.DateTimeField(primary_key=True)
+    node = models.ForeignKey(Node, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    gpu = models.ForeignKey(GPU, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    user = models.ForeignKey(GPUUser, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    memory_sum = models.FloatField(help_text="Sum of memory used over the bucket samples in MB")
+    memory_max = models.FloatField(help_text="Max memory used in MB")
+    memory_min = models.FloatField(help_text="Min memory used in MB")
+    sample_count = models.BigIntegerField(help_text="Number of usage records in the bucket")
+
+    class Meta:
+        abstract = True
+        managed = False
+
+
+class GPUUsageHourly(GPUUsageRollup):
+    class Meta(GPUUsageRollup.Meta):
+        db_table = 'gpu_monitor_gpuusage_hourly'
+
+
+class GPUUsageDaily(GPUUsageRollup):
+    class Meta(GPUUsageRollup.Meta):
+        db_table = 'gpu_monitor_gpuusage_daily'
+
+
+class NodeGPUUsageRollup(models.Model):
+    """Read-only rollup of the GPU memory used by a whole node
+
+    ``sample_times`` counts the distinct sampling instants of the node, so
+    ``memory_sum / sample_times`` is the average node usage over the bucket.
+    """
+    bucket = models.DateTimeField(primary_key=True)
+    node = models.ForeignKey(Node, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    memory_sum = models.FloatField(help_text="Sum of memory used over the bucket samples in MB")
+    sample_times = models.BigIntegerField(help_text="Number of distinct sampling instants in the bucket")
+
+    class Meta:
+        abstract = True
+        managed = False
+
+
+class NodeGPUUsageHourly(NodeGPUUsageRollup):
+    class Meta(NodeGPUUsageRollup.Meta):
+        db_table = 'gpu_monitor_nodeusage_hourly'
+
+
+class NodeGPUUsageDaily(NodeGPUUsageRollup):
+    class Meta(NodeGPUUsageRollup.Meta):
+        db_table = 'gpu_monitor_nodeusage_daily'
@@ -0,0 +1,101 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.db.models import Sum, Max, Min, Count, F, FloatField
+from core.models import Node
+from gpu_monitor.models import GPUUsage, GPUUsageHourly, GPUUsageDaily, NodeGPUUsageHourly, NodeGPUUsageDaily
+
+# period -> (per node/gpu/user rollup, per node rollup, rollup bucket width)
+ROLLUPS = {
+    'hour': (GPUUsageHourly, NodeGPUUsageHourly, timedelta(hours=1)),
+    'day': (GPUUsageDaily, NodeGPUUsageDaily, timedelta(days=1)),
+    'week': (GPUUsageDaily, NodeGPUUsageDaily, timedelta(days=1)),
+    'month': (GPUUsageDaily, NodeGPUUsageDaily, timedelta(days=1)),
+}
+
+# period -> time_bucket_gapfill bucket width
+GAPFILL_WIDTHS = {
+    'hour': '1 hour',
+    'day': '1 day',
+    'week': '1 week',
+    'month': '1 month'
+}
+
+
+def _buckets_in_range(model, width, start_time, end_time):
+    """Rollup rows whose bucket overlaps [start_time, end_time]"""
+    return model.objects.filter(bucket__gt=start_time - width, bucket__lte=end_time)
+
+
+def get_user_stats(period, start_time, end_time):
+    """Per-user totals, read from the rollup that matches ``period``"""
+    model, _, width = ROLLUPS[period]
+    return _buckets_in_range(model, width, start_time, end_time).values(username=F('user__name')).annotate(
+        total_memory=Sum('memory_sum'),
+        nodes_used=Count('node', distinct=True),
+        gpus_used=Count('gpu', distinct=True)
+    )
+
+
+def get_node_stats(period, start_time, end_time):
+    """Per-node memory statistics, read from the rollup that matches ``period``"""
+    model, _, width = ROLLUPS[period]
+    return _buckets_in_range(model, width, start_time, end_time).values('node__hostname').annotate(
+        memory_used_sum=Sum('memory_sum'),
+        samples=Sum('sample_count'),
+        max_memory=Max('memory_max'),
+        min_memory=Min('memory_min'),
+        # one GPU capacity per usage record, as summed over the raw rows
+        total_capacity=Sum(F('sample_count') * F('gpu__memory_total'), output_field=FloatField()),
+        max_users=Count('user', distinct=True),
+        total_gpus=Count('gpu', distinct=True)
+    )
+
+
+def get_export_records(start_time, end_time):
+    """Raw usage records of [start_time, end_time] in time order, as exported"""
+    return GPUUsage.objects.filter(time__gte=start_time, time__lte=end_time).order_by('time')
+
+
+def get_node_series(period, start_time, end_time):
+    """Gap-filled average memory used by every node per ``period`` bucket.
+
+    Bucketing and gap filling run in SQL with time_bucket_gapfill over the
+    per-node rollup. Returns ``(node id, bucket, memory used in MB)`` rows
+    ordered by node and bucket, where the memory is None for empty buckets.
+    Every node gets a complete series, with or without data.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(*node_series_query(period, start_time, end_time))
+        yield from cursor
+
+
+def node_series_query(period, start_time, end_time):
+    """SQL and parameters of get_node_series"""
+    _, model, width = ROLLUPS[period]
+    sql = f"""
+        SELECT node_id,
+               time_bucket_gapfill(
+                   %(width)s::interval, bucket,
+                   timezone => %(timezone)s, start => %(start)s, finish => %(end)s
+               ) AS ts,
+               (sum(memory_sum) / nullif(sum(sample_times), 0))::float AS memory_used
+        FROM (
+            SELECT node_id, bucket, memory_sum, sample_times
+            FROM {model._meta.db_table}
+            WHERE bucket > %(rollup_start)s AND bucket <= %(end)s
+            UNION ALL
+            -- an empty sample per node, so that nodes without data are gap-filled too
+            SELECT id, %(start)s, NULL, NULL FROM {Node._meta.db_table}
+        ) AS samples
+        GROUP BY node_id, ts
+        ORDER BY node_id, ts
+    """
+    params = {
+        'width': GAPFILL_WIDTHS[period],
+        'timezone': settings.TIME_ZONE,
+        'start': start_time,
+        'end': end_time,
+        'rollup_start': start_time - width,
+    }
+    return sql, params
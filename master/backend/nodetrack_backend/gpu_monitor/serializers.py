@@ -10,6 +10,9 @@ class GPUUsageSubmitSerializer(serializers.Serializer):
     memory_total = serializers.FloatField()
     ip_address = serializers.IPAddressField()
     username = serializers.CharField(required=False, allow_null=True)
+    command = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    # identifies the client's static GPU inventory, GPU rows are only upserted when it changes
+    inventory_version = serializers.CharField(required=False, allow_null=True)
     
 
 class GPUSerializer(serializers.ModelSerializer):
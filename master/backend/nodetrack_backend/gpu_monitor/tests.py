@@ -1,3 +1,169 @@
-from django.test import TestCase
+import unittest
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from core.export import export_values
+from core.models import Node
+from core.testing import QueryPlanTestMixin
+from gpu_monitor.accounting import (
+    ACCOUNTING_SQL, accounting_params, day_start, first_retained_day, refresh_accounting,
+)
+from gpu_monitor.models import (
+    GPU, GPUAccounting, GPUUsage, GPUUser, GPUUsageHourly, GPUUsageDaily, NodeGPUUsageHourly, NodeGPUUsageDaily,
+)
+from gpu_monitor.queries import get_export_records, get_node_stats, get_user_stats, node_series_query
+from gpu_monitor.views import EXPORT_COLUMNS
 
-# Create your tests here.
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'EXPLAIN plans of TimescaleDB hypertables')
+class GPUUsageQueryPlanTests(QueryPlanTestMixin, TransactionTestCase):
+    """Reports read the rollups, raw range queries read the chunks of their range through an index"""
+
+    HYPERTABLE = GPUUsage._meta.db_table
+    ROLLUP_VIEWS = tuple(
+        model._meta.db_table for model in (GPUUsageHourly, GPUUsageDaily, NodeGPUUsageHourly, NodeGPUUsageDaily)
+    )
+    PERIODS = ('hour', 'day')
+
+    def setUp(self):
+        node = Node.objects.create(ip_address='10.0.0.1', hostname='node1')
+        gpus = [GPU.objects.create(node=node, gpu_id=str(i), name='A100', memory_total=40000) for i in range(2)]
+        users = [GPUUser.objects.create(name=f'user{i}') for i in range(3)]
+        self.end = timezone.now()
+        self.start = self.end - timedelta(days=1)
+        GPUUsage.objects.bulk_create(
+            GPUUsage(gpu=gpu, node=node, user=users[hour % 3], memory_used=hour, time=self.end - timedelta(hours=hour))
+            for gpu in gpus
+            for hour in range(self.DAYS * 24)
+        )
+        self.refresh_rollups()
+
+    def test_user_stats(self):
+        for period in self.PERIODS:
+            with self.subTest(period=period):
+                self.assertReadsRollups(self.explain(get_user_stats(period, self.start, self.end)))
+
+    def test_node_stats(self):
+        for period in self.PERIODS:
+            with self.subTest(period=period):
+                self.assertReadsRollups(self.explain(get_node_stats(period, self.start, self.end)))
+
+    def test_node_series(self):
+        for period in self.PERIODS:
+            with self.subTest(period=period):
+                self.assertReadsRollups(self.explain_sql(*node_series_query(period, self.start, self.end)))
+
+    def test_export(self):
+        plan = self.explain(export_values(get_export_records(self.start, self.end), EXPORT_COLUMNS))
+        self.assertRangeScan(plan, f'{self.HYPERTABLE}_time_idx')
+
+    def test_accounting_range(self):
+        plan = self.explain_sql(ACCOUNTING_SQL, accounting_params(self.start, self.end))
+        self.assertRangeScan(plan)
+
+    def test_user_range(self):
+        user = GPUUser.objects.get(name='user1')
+        plan = self.explain(GPUUsage.objects.filter(
+            user=user, time__gte=self.start, time__lte=self.end
+        ).values('user', 'gpu', 'memory_used'))
+        self.assertRangeScan(plan, 'gpuusage_user_time_idx')
+
+    def test_gpu_range(self):
+        gpu = GPU.objects.first()
+        plan = self.explain(GPUUsage.objects.filter(
+            gpu=gpu, time__gte=self.start, time__lte=self.end
+        ).order_by('-time').values('time', 'memory_used'))
+        self.assertRangeScan(plan, 'gpuusage_gpu_time_idx')
+
+    def test_node_range(self):
+        node = Node.objects.get()
+        plan = self.explain(GPUUsage.objects.filter(
+            node=node, time__gte=self.start, time__lte=self.end
+        ).order_by('-time').values('time', 'memory_used'))
+        self.assertRangeScan(plan, 'gpuusage_node_time_idx')
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'time_bucket of TimescaleDB')
+class GPUAccountingTests(TestCase):
+    """A sample is accounted for the time until the next one, or one interval of its node"""
+
+    MEMORY_USED = 2048
+
+    def setUp(self):
+        self.user = GPUUser.objects.create(name='user1')
+        self.day = day_start(timezone.now() - timedelta(days=2))
+
+    def sample(self, hostname, interval, indexes):
+        """Samples of the user every ``interval`` seconds, at the ``indexes`` th sampling instants"""
+        node = Node.objects.create(ip_address=f'10.0.0.{Node.objects.count() + 1}', hostname=hostname)
+        gpu = GPU.objects.create(node=node, gpu_id='0', name='A100', memory_total=40000)
+        first = self.day + timedelta(hours=1)
+        GPUUsage.objects.bulk_create(
+            GPUUsage(gpu=gpu, node=node, user=self.user, memory_used=self.MEMORY_USED,
+                     time=first + timedelta(seconds=interval * index))
+            for index in indexes
+        )
+
+    def assertAccounted(self, hostname, seconds):
+        row = GPUAccounting.objects.get(node__hostname=hostname, bucket=self.day)
+        self.assertAlmostEqual(row.gpu_hours, seconds / 3600)
+        self.assertAlmostEqual(row.gb_hours, self.MEMORY_USED / 1024 * seconds / 3600)
+
+    def test_intervals(self):
+        for interval in (60, 300):
+            # the last sample stands for one interval too
+            self.sample(f'continuous{interval}', interval, range(10))
+            # processes ended at the 5th sample and started again at the 11th
+            self.sample(f'interrupted{interval}', interval, [*range(5), *range(10, 15)])
+        refresh_accounting(self.day, self.day)
+        for interval in (60, 300):
+            with self.subTest(interval=interval):
+                self.assertAccounted(f'continuous{interval}', 10 * interval)
+                self.assertAccounted(f'interrupted{interval}', 10 * interval)
+
+    def test_single_sample(self):
+        self.sample('single', 300, [0])
+        refresh_accounting(self.day, self.day)
+        self.assertAccounted('single', settings.ACCOUNTING_DEFAULT_INTERVAL)
+
+
+@override_settings(TIMESCALE_RAW_RETENTION_DAYS=30)
+class AccountingRetentionTests(TestCase):
+    """Days the raw retention may have dropped samples of keep their accounting"""
+
+    def setUp(self):
+        self.node = Node.objects.create(ip_address='10.0.0.1', hostname='node1')
+        self.user = GPUUser.objects.create(name='user1')
+        self.today = day_start(timezone.now())
+        # the accounting query itself needs TimescaleDB
+        patcher = mock.patch('gpu_monitor.accounting.connection')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def accounting(self, days_ago):
+        return GPUAccounting.objects.create(
+            bucket=self.today - timedelta(days=days_ago), user=self.user, node=self.node,
+            gpu_hours=1, gb_hours=1, samples=60,
+        )
+
+    def test_retained_days_only(self):
+        dropped, retained = self.accounting(40), self.accounting(10)
+        start, end = refresh_accounting(self.today - timedelta(days=60))
+        self.assertEqual(start, first_retained_day())
+        self.assertTrue(GPUAccounting.objects.filter(pk=dropped.pk).exists())
+        self.assertFalse(GPUAccounting.objects.filter(pk=retained.pk).exists())
+
+    def test_nothing_retained(self):
+        dropped = self.accounting(40)
+        self.assertIsNone(refresh_accounting(self.today - timedelta(days=60), self.today - timedelta(days=40)))
+        self.assertTrue(GPUAccounting.objects.filter(pk=dropped.pk).exists())
+
+    @override_settings(TIMESCALE_RAW_RETENTION_DAYS=0)
+    def test_kept_forever(self):
+        dropped = self.accounting(40)
+        start, end = refresh_accounting(self.today - timedelta(days=60))
+        self.assertEqual(start, day_start(self.today - timedelta(days=60)))
+        self.assertFalse(GPUAccounting.objects.filter(pk=dropped.pk).exists())
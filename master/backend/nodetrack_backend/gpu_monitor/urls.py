@@ -6,4 +6,6 @@ app_name = 'gpu_monitor'
 urlpatterns = [
     path('submit', views.submit_gpu_data, name='submit_gpu_data'),
     path('report', views.generate_gpu_report, name='generate_gpu_report'),
+    path('export', views.export_gpu_data, name='export_gpu_data'),
+    path('accounting', views.get_gpu_accounting, name='get_gpu_accounting'),
 ]
\ No newline at end of file
@@ -1,4 +1,5 @@
-from django.db.models import Sum, Avg, Max, Min, Count
+from django.conf import settings
+from django.db.models import Sum
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
@@ -6,15 +7,20 @@ from datetime import datetime, timedelta
 from ipware.ip import get_client_ip
 from django.utils import timezone  # Import timezone module
 from collections import defaultdict
-from django.db.models.functions import TruncHour, TruncWeek, TruncMonth, TruncDay
 from django.http import Http404
 from django.views.decorators.cache import cache_page
 from django.views.decorators.vary import vary_on_headers
 from core.models import Node
 from core.permissions import HasAPIToken
+from core.columnar import columnar_series
+from core.export import EXPORT_FORMATS, get_export_range, stream_export
+from core.ingest import IngestTimer, get_batch_id, ingest_submission
+from core.queue import queue_submission
 from core.utils import get_primary_ip
-from gpu_monitor.models import GPU, GPUUsage
-from gpu_monitor.serializers import GPUUsageSubmitSerializer
+from gpu_monitor.models import GPU
+from gpu_monitor.ingest import validate_gpu_entries
+from gpu_monitor.queries import get_export_records, get_user_stats, get_node_stats, get_node_series
+from gpu_monitor.accounting import get_user_accounting
 
 @api_view(['POST'])
 def submit_gpu_data(request):
@@ -31,48 +37,37 @@ def submit_gpu_data(request):
     primary_ip = get_primary_ip(clien_ip)
     if not primary_ip:
         raise Http404("IP address is Not found/Not trusted")
-    for item in bulk_data:
-        if not item.get('memory_used'):
-            item['memory_used'] = 0
-        # add ip address from the request
-        # item['ip_address'] = clien_ip # no need as we are now getting it from the  client itself
+    if len(bulk_data) > settings.INGEST_MAX_ROWS:
+        return Response({
+            'status': 'error',
+            'message': f'At most {settings.INGEST_MAX_ROWS} entries can be submitted per request'
+        }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    timer = IngestTimer()
+    entries = validate_gpu_entries(bulk_data)
+    if entries and settings.INGEST_QUEUE:
+        # the ingest writer stores them, see core.queue
+        return queue_submission(
+            primary_ip, entries[0]['hostname'], {'gpu': entries}, get_batch_id(request), len(bulk_data), timer
+        )
+
     created_count = 0
-    
-    for entry in bulk_data:
-        serializer = GPUUsageSubmitSerializer(data=entry)
-        if serializer.is_valid():
-            data = serializer.validated_data
-            
-            # Get or create node using primary IP
-            node, _ = Node.objects.get_or_create(
-                ip_address=primary_ip,
-                defaults={'hostname': data['hostname']},
-            )
-            
-            # Get or create GPU
-            gpu, _ = GPU.objects.get_or_create(
-                node=node,
-                gpu_id=data['gpu_id'],
-                defaults={'memory_total': data['memory_total']}
-            )
-            
-            # Create usage record - ensure timestamp is timezone aware
-            timestamp = data['timestamp']
-            if timezone.is_naive(timestamp):
-                timestamp = timezone.make_aware(timestamp)
-                
-            if data.get('username'): # consider only the usage when the GPU is not idle (there is a process asssociated with the GPU)
-                GPUUsage.objects.create(
-                    gpu=gpu,
-                    username=data['username'],
-                    memory_used=data['memory_used'],
-                    time=timestamp  # Use timezone-aware timestamp
-                )
-                created_count += 1
-            
+    duplicate = False
+    if entries:
+        created_count = ingest_submission(
+            primary_ip, entries[0]['hostname'], {'gpu': entries}, get_batch_id(request)
+        )
+        # a payload replayed by the client after it was stored already
+        duplicate = created_count is None
+        created_count = created_count or 0
+
     return Response({
         'status': 'success', 
-        'message': f'Created {created_count} GPU usage records'
+        'message': f'Created {created_count} GPU usage records',
+        'received': len(bulk_data),
+        'created': created_count,
+        'duplicate': duplicate,
+        'elapsed_ms': timer.elapsed_ms,
     })
 
 @api_view(['GET'])
@@ -85,6 +80,7 @@ def generate_gpu_report(request):
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
         period = request.query_params.get('period', 'hour')
+        columnar = request.query_params.get('format') == 'columnar'
         
         # Set default date range if not provided
         if not start_date or not end_date:
@@ -103,44 +99,33 @@ def generate_gpu_report(request):
         
         
         # Get time series data
-        time_series_data = get_gpu_time_series_data(period, start_time, end_time)
+        time_series_data = get_gpu_time_series_data(period, start_time, end_time, columnar)
         
-        # Get per-user statistics - using TimescaleDB's time_bucket for aggregation
+        # Get per-user statistics from the rollup matching the period
         per_user = {}
-        user_stats = GPUUsage.timescale.filter(
-            time__gte=start_time,
-            time__lte=end_time
-        ).values('username').annotate(
-            total_memory=Sum('memory_used'),
-            nodes_used=Count('gpu__node', distinct=True),
-            gpus_used=Count('gpu', distinct=True)
-        )
+        user_stats = get_user_stats(period, start_time, end_time)
+        
+        # time-weighted totals, independent of the sampling interval
+        accounting = {stat['username']: stat for stat in get_user_accounting(start_time, end_time)}
         
         for stat in user_stats:
             per_user[stat['username']] = {
                 'total_memory': stat['total_memory'],
                 'nodes_used': stat['nodes_used'],
-                'gpus_used': stat['gpus_used']
+                'gpus_used': stat['gpus_used'],
+                'gpu_hours': accounting.get(stat['username'], {}).get('gpu_hours', 0.0),
+                'gb_hours': accounting.get(stat['username'], {}).get('gb_hours', 0.0),
             }
         
-        # Get per-node statistics - using TimescaleDB's time_bucket for aggregation
+        # Get per-node statistics from the rollup matching the period
         per_node = {}
-        node_stats = GPUUsage.timescale.filter(
-            time__gte=start_time,
-            time__lte=end_time
-        ).values('gpu__node__hostname').annotate(
-            avg_memory=Avg('memory_used'),
-            max_memory=Max('memory_used'),
-            min_memory=Min('memory_used'),
-            total_capacity=Sum('gpu__memory_total'),
-            max_users=Count('username', distinct=True),
-            total_gpus=Count('gpu', distinct=True)
-        )
+        node_stats = get_node_stats(period, start_time, end_time)
         
         for stat in node_stats:
-            hostname = stat['gpu__node__hostname']
+            hostname = stat['node__hostname']
+            avg_memory = stat['memory_used_sum'] / stat['samples'] if stat['samples'] else 0.0
             per_node[hostname] = {
-                'avg_memory': float(stat['avg_memory']) if stat['avg_memory'] else 0.0,
+                'avg_memory': float(avg_memory),
                 'max_memory': float(stat['max_memory']) if stat['max_memory'] else 0.0,
                 'min_memory': float(stat['min_memory']) if stat['min_memory'] else 0.0,
                 'total_capacity': float(stat['total_capacity']) if stat['total_capacity'] else 0.0,
@@ -164,17 +149,42 @@ def generate_gpu_report(request):
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-def get_gpu_time_series_data(period='hour', start_time=None, end_time=None):
+EXPORT_COLUMNS = (
+    ('time', 'time'),
+    ('hostname', 'node__hostname'),
+    ('gpu_id', 'gpu__gpu_id'),
+    ('username', 'user__name'),
+    ('memory_used', 'memory_used'),
+)
+
+@api_view(['GET'])
+@permission_classes([HasAPIToken])
+def export_gpu_data(request):
+    """Stream raw GPU usage records of a time range as NDJSON (default) or CSV"""
+    export_format = request.query_params.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return Response({
+            'error': f'Unsupported format, use one of: {", ".join(EXPORT_FORMATS)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        start_time, end_time = get_export_range(request.query_params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    records = get_export_records(start_time, end_time)
+    return stream_export(records, EXPORT_COLUMNS, export_format, 'gpu_usage')
+
+def get_gpu_time_series_data(period='hour', start_time=None, end_time=None, columnar=False):
+    """Per-node GPU time series over the period buckets plus summary statistics
+
+    By default each node gets a list of per-bucket objects. With ``columnar``
+    the nodes share a single ``timestamps`` axis and each one gets a typed
+    ``memory_used`` array and a base64 ``active`` bitmask (bit i of byte i // 8
+    set when bucket i has data), which is several times smaller to encode.
+    """
     
     assert start_time and end_time, "Start and end time must be provided"
     
-    trunc_function = {
-        'hour': TruncHour,
-        'day': TruncDay,
-        'week': TruncWeek,
-        'month': TruncMonth
-    }    
-    
     # Fetch all nodes in a single query
     nodes = list(Node.objects.all().distinct())
     
@@ -184,76 +194,37 @@ def get_gpu_time_series_data(period='hour', start_time=None, end_time=None):
         for node_data in GPU.objects.values('node').annotate(total=Sum('memory_total'))
     }
     
-    # Fetch all GPU usage data for all nodes in a single query
-    all_node_data = (
-        GPUUsage.timescale.filter(
-            gpu__node__in=nodes,
-            time__range=(start_time, end_time),
-        )
-        .values("gpu__node", "time")
-        .annotate(total_memory_used=Sum("memory_used"))
-        .annotate(truncated_time=trunc_function[period]("time"))
-        .order_by("gpu__node", "time")
-    )
-    
-    # Group the data by node
-    data_by_node = defaultdict(list)
-    for entry in all_node_data:
-        node_id = entry['gpu__node']
-        data_by_node[node_id].append({
-            'truncated_time': entry['truncated_time'],
-            'total_memory_used': entry['total_memory_used']
-        })
-    
-    # Function to truncate timestamps to the appropriate precision
-    truncate_timestamp = lambda ts: ts.replace(minute=0, second=0, microsecond=0) # noqa: E731
-    
-    nodes_timeseries = []
-    
-    # Calculate the time increment based on the period
-    time_increments = {
-        'hour': timedelta(hours=1),
-        'day': timedelta(days=1),
-        'week': timedelta(weeks=1),
-        'month': timedelta(days=30)  # Approximate month increment
-    }
-    time_increment = time_increments[period]
-    
-    # Process data for each node
-    for node in nodes:
-        node_memory_total = node_memory_totals.get(node.id, 0)
-        node_data = data_by_node.get(node.id, [])
-        
-        # Group by time bucket and calculate averages
-        time_buckets = defaultdict(list)
-        for entry in node_data:
-            bucket_time = entry['truncated_time']
-            time_buckets[bucket_time].append(entry['total_memory_used'])
-        
-        processed_data = {
-            bucket_time: (sum(values) / len(values) if values else 0)
-            for bucket_time, values in time_buckets.items()
+    # Gap-filled node usage, bucketed in SQL and streamed ordered by node and bucket
+    rows = get_node_series(period, start_time, end_time)
+    if columnar:
+        timestamps, columns = columnar_series(rows, convert=lambda memory_used: memory_used / 1024)  # Convert to GB
+        empty_column = {'values': [], 'active': ''}
+        time_series = {
+            'timestamps': timestamps,
+            'nodes': {
+                f'node_{node.hostname}': {
+                    'memory_total': float(node_memory_totals.get(node.id, 0) / 1024),  # Convert to GB
+                    'memory_used': columns.get(node.id, empty_column)['values'],
+                    'active': columns.get(node.id, empty_column)['active'],
+                }
+                for node in nodes
+            },
         }
-        
-        # Generate complete time series with missing buckets filled in
-        timeseries = []
-        current_bucket = truncate_timestamp(start_time)
-        end_truncated = truncate_timestamp(end_time)
-        
-        while current_bucket <= end_truncated:
-            memory_used = processed_data.get(current_bucket, 0.0)
-            timeseries.append({
-                'timestamp': current_bucket.isoformat(),
-                'memory_total': float(node_memory_total/1024),  # Convert to GB
+    else:
+        series_by_node = defaultdict(list)
+        for node_id, bucket, memory_used in rows:
+            series_by_node[node_id].append({
+                'timestamp': bucket.isoformat(),
+                'memory_total': float(node_memory_totals.get(node_id, 0) / 1024),  # Convert to GB
                 'memory_used': float(memory_used or 0) / 1024,  # Convert to GB
-                'is_active': current_bucket in processed_data
+                'is_active': memory_used is not None
             })
-            current_bucket += time_increment
-            
-        timeseries.sort(key=lambda x: x['timestamp'])
-        nodes_timeseries.append({
-            f'node_{node.hostname}': timeseries
-        })
+        time_series = {
+            'nodes_timeseries': [
+                {f'node_{node.hostname}': series_by_node.get(node.id, [])}
+                for node in nodes
+            ]
+        }
     
     # Calculate summary statistics
     total_nodes = len(nodes)
@@ -270,7 +241,28 @@ def get_gpu_time_series_data(period='hour', start_time=None, end_time=None):
         }
     }
     
-    return {
-        'nodes_timeseries': nodes_timeseries,
-        'summary': summary
-    }
\ No newline at end of file
+    time_series['summary'] = summary
+    return time_series
+
+@api_view(['GET'])
+@permission_classes([HasAPIToken])
+def get_gpu_accounting(request):
+    """GPU-hours and GB-hours per user over a date range, per month with ``period=month``"""
+    try:
+        start_time, end_time = get_export_range(request.query_params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    monthly = request.query_params.get('period') == 'month'
+
+    per_user = defaultdict(dict)
+    for stat in get_user_accounting(start_time, end_time, monthly):
+        totals = {'gpu_hours': stat['gpu_hours'], 'gb_hours': stat['gb_hours']}
+        if monthly:
+            per_user[stat['username']][stat['month'].strftime('%Y-%m')] = totals
+        else:
+            per_user[stat['username']] = totals
+
+    return Response({
+        'date_range': {'start': start_time.isoformat(), 'end': end_time.isoformat()},
+        'per_user': per_user,
+    })
@@ -148,8 +148,65 @@ AUTH_PASSWORD_VALIDATORS = [
 #     ],
 # }
 
+REST_FRAMEWORK = {
+    # `format` is a query parameter of the report endpoints, not a renderer override
+    'URL_FORMAT_OVERRIDE': None,
+}
+
 API_ACCESS_TOKEN = os.environ.get('API_ACCESS_TOKEN')
 
+# Accept submissions from IPs of known nodes even when they are missing from cluster_nodes.yaml
+CLUSTER_NODES_FALLBACK_TO_DB = os.environ.get('CLUSTER_NODES_FALLBACK_TO_DB', 'False').capitalize() == 'True'
+
+# Ingestion settings
+# Largest number of entries a single submit request may carry (e.g. an offline backlog replay)
+INGEST_MAX_ROWS = int(os.environ.get('INGEST_MAX_ROWS', '50000'))
+# Number of rows written per INSERT statement on databases without COPY (see core.copy)
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', '5000'))
+# Largest decompressed body accepted from a client replaying its spool
+INGEST_MAX_BYTES = int(os.environ.get('INGEST_MAX_BYTES', str(64 * 1024 * 1024)))
+# Submit endpoints validate payloads, push them onto a Redis stream and answer 202;
+# `manage.py ingest_writer` writes them to the database. False writes synchronously.
+INGEST_QUEUE = os.environ.get('INGEST_QUEUE', 'True').capitalize() == 'True'
+INGEST_QUEUE_STREAM = os.environ.get('INGEST_QUEUE_STREAM', 'nodetrack:ingest')
+# Payloads waiting in the stream beyond which submissions are refused with 503
+INGEST_QUEUE_MAX_DEPTH = int(os.environ.get('INGEST_QUEUE_MAX_DEPTH', '100000'))
+# The writer flushes once this many samples are waiting, or after INGEST_WRITER_FLUSH_MS
+INGEST_WRITER_BATCH_ROWS = int(os.environ.get('INGEST_WRITER_BATCH_ROWS', '20000'))
+INGEST_WRITER_FLUSH_MS = int(os.environ.get('INGEST_WRITER_FLUSH_MS', '1000'))
+# Days the markers of ingested client payloads are kept to detect replays. Must exceed the
+# clients' SPOOL_MAX_AGE (7 days). Pruned hourly by the writer, or `manage.py prune_submitted_batches`
+INGEST_BATCH_RETENTION_DAYS = int(os.environ.get('INGEST_BATCH_RETENTION_DAYS', '14'))
+
+# TimescaleDB storage policies, applied by migrations and `manage.py timescale_policies`
+# Usage chunks older than this are compressed, 0 disables compression
+TIMESCALE_COMPRESS_AFTER_DAYS = int(os.environ.get('TIMESCALE_COMPRESS_AFTER_DAYS', '7'))
+# Days raw usage rows, hourly and daily rollups are kept for, 0 keeps them forever
+TIMESCALE_RAW_RETENTION_DAYS = int(os.environ.get('TIMESCALE_RAW_RETENTION_DAYS', '0'))
+TIMESCALE_HOURLY_RETENTION_DAYS = int(os.environ.get('TIMESCALE_HOURLY_RETENTION_DAYS', '0'))
+TIMESCALE_DAILY_RETENTION_DAYS = int(os.environ.get('TIMESCALE_DAILY_RETENTION_DAYS', '0'))
+# Days back the hourly and daily rollups are refreshed, late samples older than this stay out
+# of them. Must be shorter than the raw and the rollup's own retention; 0 refreshes 30 (hourly)
+# and 90 (daily) days, or a day less than the shortest of those retentions
+TIMESCALE_HOURLY_REFRESH_DAYS = int(os.environ.get('TIMESCALE_HOURLY_REFRESH_DAYS', '0'))
+TIMESCALE_DAILY_REFRESH_DAYS = int(os.environ.get('TIMESCALE_DAILY_REFRESH_DAYS', '0'))
+
+# GPU accounting, see gpu_monitor.accounting
+# A user's samples further apart than this many sampling intervals of their node (the
+# median gap between its samples) are separate uses, each sample accounted for one interval
+ACCOUNTING_GAP_INTERVALS = int(os.environ.get('ACCOUNTING_GAP_INTERVALS', '2'))
+# Sampling interval assumed for a node with a single sampling instant in the recomputed days
+ACCOUNTING_DEFAULT_INTERVAL = int(os.environ.get('ACCOUNTING_DEFAULT_INTERVAL', '60'))  # seconds
+# Longest time a usage sample is accounted for, whatever the interval of its node
+ACCOUNTING_MAX_SAMPLE_GAP = int(os.environ.get('ACCOUNTING_MAX_SAMPLE_GAP', '3600'))  # seconds
+# Days before the last accounted one recomputed by every refresh. Days of samples replayed
+# later than this by spooling clients (up to their SPOOL_MAX_AGE, 7 days) are recomputed too,
+# from the earliest sample recorded with each payload
+ACCOUNTING_REFRESH_DAYS = int(os.environ.get('ACCOUNTING_REFRESH_DAYS', '2'))
+
+# Rows fetched per round trip by the server-side cursor of the export endpoints
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', '10000'))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
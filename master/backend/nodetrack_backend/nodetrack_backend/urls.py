@@ -23,4 +23,7 @@ urlpatterns = [
     path('gpu/', include('gpu_monitor.urls')),
     path('cpu/', include('cpu_monitor.urls')),
     path('overview/', views.get_overview_stats, name='overview_stats'),
+    path('ingest', views.ingest_batch, name='ingest_batch'),
+    path('ingest/metrics', views.get_ingest_queue_metrics, name='ingest_queue_metrics'),
+    path('replay', views.replay_spool, name='replay_spool'),
 ]
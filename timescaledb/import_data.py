@@ -1,7 +1,10 @@
 import os
+import io
 import json
+import time
+import argparse
+import multiprocessing
 import psycopg2
-from psycopg2.extras import Json
 import pandas as pd
 from dotenv import load_dotenv
 
@@ -17,6 +20,20 @@ DB_PASS = os.environ.get('DB_PASS', 'postgres')
 # Log file path
 LOG_FILE = os.environ.get('SERVER_DATA_DIR', './data') + '/cluster_gpu_usage.log'
 
+# Lines parsed and copied per transaction
+CHUNK_LINES = int(os.environ.get('IMPORT_CHUNK_LINES', '100000'))
+
+# Columns of gpu_metrics filled from the log, metadata holds every other field
+COLUMNS = ['time', 'hostname', 'gpu_id', 'gpu_name', 'username',
+           'memory_used', 'memory_total', 'command', 'status', 'metadata']
+CORE_FIELDS = ['timestamp', 'hostname', 'gpu_id', 'gpu_name', 'username',
+               'memory_used', 'memory_total', 'command', 'status']
+INTEGER_FIELDS = ['gpu_id', 'memory_used', 'memory_total']
+
+STAGING_TABLE = 'gpu_metrics_staging'
+CHECKPOINT_TABLE = 'gpu_metrics_import_checkpoint'
+
+
 def get_db_connection():
     """Create a connection to the TimescaleDB database"""
     return psycopg2.connect(
@@ -27,94 +44,244 @@ def get_db_connection():
         password=DB_PASS
     )
 
-def import_data():
-    """Import data from log file to TimescaleDB"""
-    # Check if log file exists
-    if not os.path.exists(LOG_FILE):
-        print(f"Log file not found: {LOG_FILE}")
-        return
-    
-    # Read log file
-    print(f"Reading log file: {LOG_FILE}")
-    with open(LOG_FILE, 'r') as f:
-        log_lines = f.readlines()
-    
-    if not log_lines:
-        print("Log file is empty")
-        return
-    
-    print(f"Found {len(log_lines)} records in log file")
-    
+
+def read_chunks(path, start=0, end=None, chunk_lines=CHUNK_LINES):
+    """Yield ``(lines, offset)`` chunks of complete lines from ``path``
+
+    Reading starts at byte ``start`` and stops before ``end`` (or the end of
+    the file); ``offset`` is the byte position right after the chunk. A last
+    line without its newline is still being written and is left out.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        offset = start
+        lines = []
+        while end is None or offset < end:
+            line = f.readline()
+            if not line.endswith(b'\n'):
+                break
+            lines.append(line)
+            offset += len(line)
+            if len(lines) >= chunk_lines:
+                yield lines, offset
+                lines = []
+        if lines:
+            yield lines, offset
+
+
+def parse_chunk(lines):
+    """Parse a chunk of JSON lines into rows shaped like gpu_metrics
+
+    The chunk is parsed as a whole with pandas; when it holds malformed
+    lines, it is parsed line by line to skip only those.
+    """
+    try:
+        df = pd.read_json(io.BytesIO(b''.join(lines)), lines=True, dtype=False, convert_dates=False)
+    except ValueError:
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Skipping invalid JSON: {line.strip()[:200]}")
+        df = pd.DataFrame.from_records(records)
+
+    for field in CORE_FIELDS:
+        if field not in df:
+            df[field] = None
+    df['time'] = pd.to_datetime(df['timestamp'], errors='coerce', format='mixed')
+    df = df.dropna(subset=['time', 'hostname', 'gpu_id'])
+    for field in INTEGER_FIELDS:
+        # a missing value turns the column to float, COPY wants "100" rather than "100.0"
+        values = pd.to_numeric(df[field], errors='coerce')
+        if (values.dropna() % 1 == 0).all():
+            df[field] = values.astype('Int64')
+
+    extra = [column for column in df.columns if column not in CORE_FIELDS and column != 'time']
+    if extra:
+        df['metadata'] = [
+            json.dumps({k: v for k, v in record.items() if v is not None and v == v})
+            for record in df[extra].to_dict('records')
+        ]
+    else:
+        df['metadata'] = '{}'
+    return df[COLUMNS]
+
+
+def copy_chunk(cursor, df):
+    """COPY parsed rows into the staging table, then merge them into gpu_metrics
+
+    Returns the number of rows inserted into gpu_metrics.
+    """
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False, date_format='%Y-%m-%d %H:%M:%S.%f%z')
+    buffer.seek(0)
+    cursor.execute(f"""
+        CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE}
+        (LIKE gpu_metrics INCLUDING DEFAULTS) ON COMMIT DELETE ROWS
+    """)
+    cursor.copy_expert(
+        f"COPY {STAGING_TABLE} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer
+    )
+    cursor.execute(f"""
+        INSERT INTO gpu_metrics ({', '.join(COLUMNS)})
+        SELECT {', '.join(COLUMNS)} FROM {STAGING_TABLE}
+        ON CONFLICT DO NOTHING
+    """)
+    return cursor.rowcount
+
+
+def load_checkpoint(cursor, path):
+    """Byte offset up to which ``path`` was imported already"""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+            log_file text PRIMARY KEY,
+            byte_offset bigint NOT NULL,
+            updated_at timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+    cursor.execute(f"SELECT byte_offset FROM {CHECKPOINT_TABLE} WHERE log_file = %s", (path,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def save_checkpoint(cursor, path, offset):
+    cursor.execute(f"""
+        INSERT INTO {CHECKPOINT_TABLE} (log_file, byte_offset) VALUES (%s, %s)
+        ON CONFLICT (log_file) DO UPDATE SET byte_offset = EXCLUDED.byte_offset, updated_at = now()
+    """, (path, offset))
+
+
+def split_ranges(path, parts):
+    """Split ``path`` into ``parts`` byte ranges that start and end on line boundaries"""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, parts):
+            f.seek(max(size * i // parts - 1, bounds[-1]))
+            # finish the line the boundary falls in, the next range starts after it
+            f.readline()
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def import_range(log_file, start, end, chunk_lines=CHUNK_LINES, restart=False, label=None):
+    """Import the lines of ``log_file`` between bytes ``start`` and ``end``
+
+    Each chunk is copied and merged in its own transaction together with the
+    byte offset reached, so an interrupted import resumes where it stopped.
+    The range has its own checkpoint, ``end`` None reads to the end of the
+    file. Returns the number of lines read, rows parsed and rows inserted.
+    """
+    checkpoint_key = os.path.abspath(log_file)
+    if end is not None:
+        checkpoint_key += f'#{start}-{end}'
+    size = os.path.getsize(log_file) if end is None else end
+    prefix = f"[{label}] " if label else ""
+    totals = {'lines': 0, 'rows': 0, 'imported': 0}
+
     # Connect to database
     conn = get_db_connection()
     cursor = conn.cursor()
-    
-    # Process records in batches
-    batch_size = 1000
-    total_imported = 0
-    
+
     try:
-        for i in range(0, len(log_lines), batch_size):
-            batch = log_lines[i:i+batch_size]
-            batch_records = []
-            
-            for line in batch:
-                try:
-                    entry = json.loads(line.strip())
-                    
-                    # Convert timestamp to datetime
-                    timestamp = pd.to_datetime(entry['timestamp'])
-                    
-                    # Extract core fields
-                    hostname = entry['hostname']
-                    gpu_id = entry['gpu_id']
-                    gpu_name = entry.get('gpu_name')
-                    username = entry.get('username')
-                    memory_used = entry.get('memory_used')
-                    memory_total = entry.get('memory_total')
-                    command = entry.get('command')
-                    status = entry.get('status')
-                    
-                    # Create metadata JSON with any additional fields
-                    metadata = {k: v for k, v in entry.items() 
-                               if k not in ('timestamp', 'hostname', 'gpu_id', 'gpu_name', 
-                                           'username', 'memory_used', 'memory_total', 
-                                           'command', 'status')}
-                    
-                    batch_records.append((
-                        timestamp, hostname, gpu_id, gpu_name, username,
-                        memory_used, memory_total, command, status, Json(metadata)
-                    ))
-                    
-                except json.JSONDecodeError:
-                    print(f"Skipping invalid JSON: {line.strip()}")
-                except Exception as e:
-                    print(f"Error processing record: {e}")
-            
-            # Insert batch
-            if batch_records:
-                cursor.executemany("""
-                    INSERT INTO gpu_metrics (
-                        time, hostname, gpu_id, gpu_name, username,
-                        memory_used, memory_total, command, status, metadata
-                    )
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT DO NOTHING
-                """, batch_records)
-                
-                conn.commit()
-                total_imported += len(batch_records)
-                print(f"Imported {total_imported} records so far...")
-        
-        print(f"Successfully imported {total_imported} records to TimescaleDB")
-    
+        checkpoint = load_checkpoint(cursor, checkpoint_key)
+        conn.commit()
+        offset = start if restart else max(checkpoint, start)
+        if offset > size:
+            print(f"{prefix}Checkpoint at byte {offset} is past the end of {log_file}, it was truncated: starting over")
+            offset = start
+        print(f"{prefix}Reading log file: {log_file} from byte {offset} to {size}")
+
+        started = time.perf_counter()
+        for lines, offset in read_chunks(log_file, offset, end, chunk_lines):
+            df = parse_chunk(lines)
+            imported = copy_chunk(cursor, df) if len(df) else 0
+            save_checkpoint(cursor, checkpoint_key, offset)
+            conn.commit()
+
+            totals['lines'] += len(lines)
+            totals['rows'] += len(df)
+            totals['imported'] += imported
+            elapsed = time.perf_counter() - started
+            print(f"{prefix}Imported {totals['imported']} records so far ({totals['lines']} lines, "
+                  f"{(offset - start) * 100 / max(size - start, 1):.1f}% done, {totals['lines'] / elapsed:,.0f} rows/sec)")
+
     except Exception as e:
         conn.rollback()
-        print(f"Error importing data: {e}")
-    
+        print(f"{prefix}Error importing data: {e}")
+        totals['error'] = str(e)
+
     finally:
         cursor.close()
         conn.close()
 
+    return totals
+
+
+def _import_range(args):
+    return import_range(*args)
+
+
+def count_metrics():
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM gpu_metrics")
+            return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def import_data(log_file=LOG_FILE, chunk_lines=CHUNK_LINES, restart=False, workers=1):
+    """Import data from log file to TimescaleDB
+
+    The log is streamed in chunks of ``chunk_lines`` lines. With several
+    ``workers``, it is split into as many byte ranges, imported in parallel
+    by a process pool with a connection each; the rows counted in
+    gpu_metrics afterwards are checked against the rows the workers inserted.
+    """
+    # Check if log file exists
+    if not os.path.exists(log_file):
+        print(f"Log file not found: {log_file}")
+        return
+
+    started = time.perf_counter()
+    if workers <= 1:
+        totals = import_range(log_file, 0, None, chunk_lines, restart)
+        results = [totals]
+    else:
+        # checkpoints are kept per range, resuming needs the same number of workers
+        ranges = split_ranges(log_file, workers)
+        print(f"Importing {log_file} with {len(ranges)} workers")
+        before = count_metrics()
+        tasks = [(log_file, start, end, chunk_lines, restart, f"worker {i}") for i, (start, end) in enumerate(ranges)]
+        with multiprocessing.Pool(len(tasks)) as pool:
+            results = pool.map(_import_range, tasks)
+        totals = {key: sum(result[key] for result in results) for key in ('lines', 'rows', 'imported')}
+
+        after = count_metrics()
+        if after - before == totals['imported']:
+            print(f"Consistency check passed: gpu_metrics grew by {after - before} rows, "
+                  f"{totals['rows'] - totals['imported']} duplicate rows skipped")
+        else:
+            print(f"Consistency check failed: gpu_metrics grew by {after - before} rows "
+                  f"but the workers inserted {totals['imported']}, was something else writing to it?")
+
+    elapsed = time.perf_counter() - started
+    failed = [result['error'] for result in results if 'error' in result]
+    if failed:
+        print(f"Import stopped on {len(failed)} errors, rerun to resume from the checkpoints")
+    print(f"Imported {totals['imported']} records to TimescaleDB "
+          f"in {elapsed:.1f}s ({totals['lines'] / max(elapsed, 1e-9):,.0f} rows/sec)")
+
+
 if __name__ == "__main__":
-    import_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Import cluster_gpu_usage.log into the gpu_metrics table")
+    parser.add_argument('--log-file', default=LOG_FILE)
+    parser.add_argument('--chunk-lines', type=int, default=CHUNK_LINES)
+    parser.add_argument('--restart', action='store_true', help="ignore the checkpoints and import from the start")
+    parser.add_argument('--workers', type=int, default=1, help="import byte ranges of the log in parallel processes")
+    args = parser.parse_args()
+    import_data(args.log_file, args.chunk_lines, args.restart, args.workers)